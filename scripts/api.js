@@ -172,8 +172,9 @@ function getAuthToken() {
     }
 }
 
-// Tiny helper: fetch JSON from backend with basic error handling.
-async function fetchJSON(path, options = {}) {
+// Raw fetch against the backend with the bearer token injected.
+// Returns the Response untouched so callers can inspect status / headers.
+async function fetchWithAuth(path, options = {}) {
     const url = `${API_BASE}${path}`;
 
     // Inject bearer token for authenticated calls
@@ -194,10 +195,16 @@ async function fetchJSON(path, options = {}) {
         console.warn('[WQT API] Missing Authorization header for', path);
     }
 
-    const res = await fetch(url, {
+    return fetch(url, {
         ...options,
         headers: mergedHeaders,
     });
+}
+
+// Tiny helper: fetch JSON from backend with basic error handling.
+async function fetchJSON(path, options = {}) {
+    const url = `${API_BASE}${path}`;
+    const res = await fetchWithAuth(path, options);
 
     if (!res.ok) {
         const text = await res.text().catch(() => '');
@@ -209,6 +216,119 @@ async function fetchJSON(path, options = {}) {
     return res.json();
 }
 
+// ------------------------------------------------------------------
+// Delta sync for /api/state
+// ------------------------------------------------------------------
+// The backend versions every stored MainState (X-State-Version header).
+// We remember the document it holds at that version (as returned by GET,
+// POST and PATCH, i.e. after its own normalisation), so the next save can
+// PATCH a JSON Patch against it instead of re-uploading the whole blob.
+// Any 409 from the server means "resend everything".
+
+const stateSync = { userId: null, version: null, snapshot: null };
+
+function rememberSyncedState(userId, snapshot, version) {
+    const parsed = parseInt(version, 10);
+    if (!snapshot || Number.isNaN(parsed)) {
+        resetSyncedState();
+        return;
+    }
+    stateSync.userId = userId || null;
+    stateSync.version = parsed;
+    stateSync.snapshot = snapshot;
+}
+
+function resetSyncedState() {
+    stateSync.userId = null;
+    stateSync.version = null;
+    stateSync.snapshot = null;
+}
+
+// ETag of the server state this device last loaded/saved, per user, so a
+// reload can revalidate with If-None-Match instead of downloading the blob.
+// The sync base is kept next to it so a 304 can restore it and the first
+// save after a reload can still be a PATCH.
+const STATE_ETAG_KEY = 'wqt_state_etag';
+
+function loadStateEtag(userId) {
+    try {
+        const raw = window.localStorage.getItem(STATE_ETAG_KEY);
+        const obj = raw ? JSON.parse(raw) : null;
+        return obj && userId && obj.userId === userId && obj.etag ? obj : null;
+    } catch (e) {
+        return null;
+    }
+}
+
+function saveStateEtag(userId, etag) {
+    try {
+        if (!userId || !etag) {
+            window.localStorage.removeItem(STATE_ETAG_KEY);
+            return;
+        }
+        const entry = { userId, etag };
+        if (stateSync.snapshot && stateSync.userId === userId) {
+            entry.version = stateSync.version;
+            entry.snapshot = stateSync.snapshot;
+        }
+        try {
+            window.localStorage.setItem(STATE_ETAG_KEY, JSON.stringify(entry));
+        } catch (e) {
+            // Over quota: keep revalidation, drop the base
+            window.localStorage.setItem(STATE_ETAG_KEY, JSON.stringify({ userId, etag }));
+        }
+    } catch (e) {}
+}
+
+function escapePointer(key) {
+    return String(key).replace(/~/g, '~0').replace(/\//g, '~1');
+}
+
+function sameJSON(a, b) {
+    return JSON.stringify(a) === JSON.stringify(b);
+}
+
+function isPlainObject(value) {
+    return value !== null && typeof value === 'object' && !Array.isArray(value);
+}
+
+// Minimal RFC 6902 diff. Arrays that only grew (picks, history, logs) become
+// `add /path/-` ops so appends don't resend the whole array.
+function diffState(prev, next, path = '', ops = []) {
+    if (isPlainObject(prev) && isPlainObject(next)) {
+        Object.keys(prev).forEach((key) => {
+            if (!(key in next)) ops.push({ op: 'remove', path: `${path}/${escapePointer(key)}` });
+        });
+        Object.keys(next).forEach((key) => {
+            const childPath = `${path}/${escapePointer(key)}`;
+            if (!(key in prev)) {
+                ops.push({ op: 'add', path: childPath, value: next[key] });
+            } else {
+                diffState(prev[key], next[key], childPath, ops);
+            }
+        });
+        return ops;
+    }
+
+    if (Array.isArray(prev) && Array.isArray(next)) {
+        let same = 0;
+        while (same < prev.length && same < next.length && sameJSON(prev[same], next[same])) same++;
+        if (same === prev.length) {
+            for (let i = same; i < next.length; i++) {
+                ops.push({ op: 'add', path: `${path}/-`, value: next[i] });
+            }
+            return ops;
+        }
+        if (prev.length === next.length) {
+            for (let i = same; i < next.length; i++) diffState(prev[i], next[i], `${path}/${i}`, ops);
+            return ops;
+        }
+    }
+
+    if (!sameJSON(prev, next)) ops.push({ op: 'replace', path, value: next });
+    return ops;
+}
+
 
 const WqtAPI = {
 
@@ -341,8 +461,27 @@ const WqtAPI = {
             const qs = deviceId ? `?device-id=${encodeURIComponent(deviceId)}` : '';
             console.log(`[HISTORY_REQUEST] using current authenticated user id ${userId || 'unknown'}`);
 
-            remoteMain = await fetchJSON(`/api/state${qs}`);
-            console.log(`[WQT API] Backend returned ${remoteMain?.history?.length || 0} history records for user ${userId}`);
+            // Revalidate only when we actually hold a local copy to fall back on
+            const known = localMain ? loadStateEtag(userId) : null;
+            const res = await fetchWithAuth(`/api/state${qs}`, {
+                headers: known ? { 'If-None-Match': known.etag } : {},
+            });
+            if (res.status === 304) {
+                // Server still holds what we last synced: local copy is current,
+                // and the base we stored with that ETag is what the server has
+                remoteMain = localMain;
+                rememberSyncedState(userId, known.snapshot, res.headers.get('X-State-Version') || known.version);
+                console.log(`[WQT API] Backend state unchanged for user ${userId} (304)`);
+            } else if (!res.ok) {
+                throw new Error(`[WQT API] GET /api/state failed: ${res.status} ${res.statusText}`);
+            } else {
+                const text = await res.text();
+                remoteMain = JSON.parse(text);
+                // Separate copy: `main` is mutated in place by the app
+                rememberSyncedState(userId, JSON.parse(text), res.headers.get('X-State-Version'));
+                saveStateEtag(userId, res.headers.get('ETag'));
+                console.log(`[WQT API] Backend returned ${remoteMain?.history?.length || 0} history records for user ${userId}`);
+            }
         } catch (err) {
             console.warn('[WQT API] Backend load failed, continuing local-only:', err);
         }
@@ -438,11 +577,46 @@ const WqtAPI = {
             // Build query string for POST just like GET
             let qs = deviceId ? `?device-id=${encodeURIComponent(deviceId)}` : '';
 
-            await fetchJSON(`/api/state${qs}`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(payload),
-            });
+            const fullBody = JSON.stringify(payload);
+            let saved = false;
+
+            // Delta path: only when we know what the server holds for this user
+            if (stateSync.snapshot && stateSync.version !== null && stateSync.userId === (userId || null)) {
+                const ops = diffState(stateSync.snapshot, payload);
+                const patchBody = JSON.stringify({ base_version: stateSync.version, ops });
+                if (patchBody.length < fullBody.length) {
+                    const res = await fetchWithAuth(`/api/state${qs}`, {
+                        method: 'PATCH',
+                        headers: { 'Content-Type': 'application/json' },
+                        body: patchBody,
+                    });
+                    if (res.ok) {
+                        const data = await res.json().catch(() => ({}));
+                        rememberSyncedState(userId, data.state, data.version);
+                        saveStateEtag(userId, res.headers.get('ETag'));
+                        saved = true;
+                    } else if (res.status !== 409) {
+                        throw new Error(`[WQT API] PATCH /api/state failed: ${res.status} ${res.statusText}`);
+                    }
+                }
+            }
+
+            // Full upload: first save, version mismatch, or delta not worth it
+            if (!saved) {
+                const res = await fetchWithAuth(`/api/state${qs}`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: fullBody,
+                });
+                if (!res.ok) {
+                    resetSyncedState();
+                    const text = await res.text().catch(() => '');
+                    throw new Error(`[WQT API] POST /api/state failed: ${res.status} ${res.statusText} ${text}`);
+                }
+                const stored = await res.json().catch(() => null);
+                rememberSyncedState(userId, stored, res.headers.get('X-State-Version'));
+                saveStateEtag(userId, res.headers.get('ETag'));
+            }
             if (typeof window !== 'undefined' && typeof window.setSyncStatus === 'function') {
                 window.setSyncStatus('synced');
             }
@@ -705,6 +879,27 @@ const WqtAPI = {
         });
     },
 
+    /**
+     * Report performance-zone changes ('green' | 'amber' | 'red') for a shift.
+     * One entry goes to /zone; several (offline replay) go to /zone/batch.
+     * @param {number} shiftId
+     * @param {Array<{zone: string, at: string}>} transitions
+     */
+    async recordZoneTransitions(shiftId, transitions) {
+        if (transitions.length === 1) {
+            return fetchJSON(`/api/shifts/${shiftId}/zone`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(transitions[0]),
+            });
+        }
+        return fetchJSON(`/api/shifts/${shiftId}/zone/batch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ transitions }),
+        });
+    },
+
     async getCurrentOrder() {
         return Storage.getJSON(StorageKeys.CURRENT_ORDER, null);
     },
@@ -1021,47 +1021,54 @@ setTimeout(() => {
     .catch(err => console.warn("Onboarding preload failed:", err));
 })();
 
-// --- Message Poller (NEW) ---
-// Checks for admin messages every 30 seconds
-setInterval(async function pollForMessages() {
-  // Safe check for device ID getter (from api.js scope or window)
-  const getID = (typeof getDeviceId === 'function') ? getDeviceId 
-              : (window.WqtAPI && window.WqtAPI.getDeviceId) ? window.WqtAPI.getDeviceId : null;
-  
-  if (!getID) return; // Not ready yet
-
-  // If we have a custom fetch helper, use it; else generic fetch
-  const doFetch = (typeof fetchJSON === 'function') ? fetchJSON : null; 
-  if (!doFetch) return; // Wait for api.js
+// --- Message delivery ---
+// Long-polls /api/messages/wait: the server holds the request until a
+// message arrives for this device (or ~25s pass), so messages show up
+// within a second without a 30s poll. Backs off on errors.
+(function startMessageListener() {
+  const RETRY_MS = 30000;
+
+  function getDeviceID() {
+    // Safe check for device ID getter (from api.js scope or window)
+    const getID = (typeof getDeviceId === 'function') ? getDeviceId
+                : (window.WqtAPI && window.WqtAPI.getDeviceId) ? window.WqtAPI.getDeviceId : null;
+    if (!getID) return null; // Not ready yet
+    try { return getID(); } catch (e) { return null; }
+  }
 
-  // Actually get the ID
-  let devId = null;
-  try { devId = getID(); } catch(e){}
-  if (!devId) return;
+  async function waitForMessages() {
+    const devId = getDeviceID();
+    if (!devId) {
+      setTimeout(waitForMessages, RETRY_MS);
+      return;
+    }
 
-  try {
-    // If you used the `fetchJSON` helper, it likely prepends API_BASE automatically
-    // But here we might just raw fetch to be safe or use the helper if exported.
-    
-    // Simplest: use raw fetch with the same base you used in api.js
-    // We'll guess API_BASE or assume relative path / proxy.
-    // If `API_BASE` is global, use it.
+    // Raw fetch with the same base used in api.js
     const baseUrl = (typeof API_BASE !== 'undefined') ? API_BASE : 'https://wqt-backend.onrender.com';
-    
-    const res = await fetch(`${baseUrl}/api/messages/check?device-id=${encodeURIComponent(devId)}`);
-    if (res.ok) {
+    let delay = RETRY_MS;
+    try {
+      const res = await fetch(`${baseUrl}/api/messages/wait?device-id=${encodeURIComponent(devId)}`);
+      if (res.ok) {
         const messages = await res.json();
         if (Array.isArray(messages) && messages.length > 0) {
-            messages.forEach(msg => {
-                // Simple Alert for now
-                alert("🔔 SUPERVISOR MESSAGE:\n\n" + msg);
-            });
+          messages.forEach(msg => {
+            // Simple Alert for now
+            alert("🔔 SUPERVISOR MESSAGE:\n\n" + msg);
+          });
+          delay = 0;
+        } else {
+          // Timed out empty; a tiny gap stops a hot loop if the server returns early
+          delay = 1000;
         }
+      }
+    } catch (e) {
+      // Silent fail
     }
-  } catch (e) {
-    // Silent fail
+    setTimeout(waitForMessages, delay);
   }
-}, 30000); // 30s
+
+  waitForMessages();
+})();
 
 // ====== Auth / Login helpers ======
 
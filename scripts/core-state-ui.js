@@ -443,6 +443,7 @@ function refreshSummaryChips(main) {
   setSummarySideStatus(perfSide, perfStatus);
   renderPerfScoreTrend(perfScoreDelta, perfStatus);
   window.perfScoreDelta = perfScoreDelta;
+  reportZoneChange(perfStatus);
 
   // === Set gradient colors on #chipRate ===
   const chipRate = document.getElementById('chipRate');
@@ -458,6 +459,39 @@ function refreshSummaryChips(main) {
   }
 }
 
+// --- Zone time accounting ---
+// Tell the backend when the performance zone changes (not on every
+// refresh) so it can total time-in-zone per shift. Changes that fail to
+// send are kept in localStorage and replayed as one batch.
+const ZONE_PENDING_KEY = 'wqt_zone_pending';
+let _lastReportedZone = null;
+
+function reportZoneChange(perfStatus) {
+  const zone = perfStatus ? perfStatus.replace('status-', '') : null;
+  const shiftId = window.activeShiftSession?.id;
+  if (!zone || !shiftId || zone === _lastReportedZone) return;
+  _lastReportedZone = zone;
+
+  let pending = [];
+  try { pending = JSON.parse(localStorage.getItem(ZONE_PENDING_KEY) || '[]'); } catch (e) {}
+  // Drop entries queued for an earlier shift
+  pending = pending.filter(p => p.shiftId === shiftId);
+  pending.push({ shiftId, zone, at: new Date().toISOString() });
+  try { localStorage.setItem(ZONE_PENDING_KEY, JSON.stringify(pending)); } catch (e) {}
+
+  if (!window.WqtAPI?.recordZoneTransitions) return;
+  const transitions = pending.map(({ zone, at }) => ({ zone, at }));
+  window.WqtAPI.recordZoneTransitions(shiftId, transitions)
+    .then(() => {
+      // Keep anything queued while this request was in flight
+      try {
+        const latest = JSON.parse(localStorage.getItem(ZONE_PENDING_KEY) || '[]');
+        localStorage.setItem(ZONE_PENDING_KEY, JSON.stringify(latest.slice(pending.length)));
+      } catch (e) {}
+    })
+    .catch(() => { /* stays queued for the next change */ });
+}
+
 // Patch updateSummary to also refresh the summary chips
 const _origUpdateSummary = window.updateSummary;
 window.updateSummary = function() {
@@ -0,0 +1,282 @@
+# wqt-backend/app/admin_stream.py
+"""
+Server-sent event stream for the admin dashboard (GET /api/admin/stream).
+
+One AdminStream per worker process fans changes out to every connected
+dashboard:
+
+- A subscriber first gets a `snapshot` event (live floor + recent usage
+  events), then `devices` events (changed live-status entries, same shape
+  as /api/admin/devices) and `usage` events (new usage events, newest
+  first).
+- Writes are signalled by db.add_change_listener() after commit; on
+  Postgres the db change relay also forwards changes committed by other
+  workers, so their saves show up too.
+- Signals are coalesced for ADMIN_STREAM_COALESCE_MS: a device that saves
+  ten times in that window is read and sent once. Each tick does at most
+  one device_live_status read and reads the new usage events in pages of
+  ADMIN_STREAM_USAGE_PAGE (one page unless a burst outran it), however many
+  subscribers are connected, and every message is encoded once and shared.
+- Usage ids are handed out before commit, so with several workers
+  batching inserts a lower id can commit after a higher one was sent.
+  Ids skipped over by the catch-up read are re-checked on each tick for
+  ADMIN_STREAM_USAGE_LOOKBACK_S and sent (once) if they show up.
+- Each subscriber has a bounded queue (ADMIN_STREAM_QUEUE_SIZE). A
+  subscriber that falls that far behind gets a `resync` event instead of
+  the backlog and reloads the snapshot.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from . import db
+from . import jsoncodec
+
+ADMIN_STREAM_COALESCE_MS = int(os.getenv("ADMIN_STREAM_COALESCE_MS", "250"))
+ADMIN_STREAM_QUEUE_SIZE = int(os.getenv("ADMIN_STREAM_QUEUE_SIZE", "64"))
+ADMIN_STREAM_KEEPALIVE_S = float(os.getenv("ADMIN_STREAM_KEEPALIVE_S", "15"))
+ADMIN_STREAM_MAX_SUBSCRIBERS = int(os.getenv("ADMIN_STREAM_MAX_SUBSCRIBERS", "500"))
+ADMIN_STREAM_RECENT_EVENTS = int(os.getenv("ADMIN_STREAM_RECENT_EVENTS", "20"))
+ADMIN_STREAM_USAGE_PAGE = int(os.getenv("ADMIN_STREAM_USAGE_PAGE", "200"))
+ADMIN_STREAM_USAGE_LOOKBACK_S = float(os.getenv("ADMIN_STREAM_USAGE_LOOKBACK_S", "10"))
+# Gaps tracked at once; a larger jump (e.g. a rolled-back batch) keeps the newest
+ADMIN_STREAM_USAGE_MAX_GAPS = int(os.getenv("ADMIN_STREAM_USAGE_MAX_GAPS", "1000"))
+
+
+def sse_message(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode("ascii") + b"\ndata: " + jsoncodec.dumps_bytes(data) + b"\n\n"
+
+
+KEEPALIVE = b": keepalive\n\n"
+RESYNC = sse_message("resync", {})
+
+
+class StreamFull(Exception):
+    """Raised by subscribe() when ADMIN_STREAM_MAX_SUBSCRIBERS are connected."""
+
+
+class _Subscriber:
+    __slots__ = ("queue", "lagging")
+
+    def __init__(self, size: int) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.lagging = False
+
+
+class AdminStream:
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set[_Subscriber] = set()
+        self._dirty_devices: Set[str] = set()
+        self._usage_dirty = False
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_usage_id = 0
+        self._usage_gaps: Dict[int, float] = {}  # unseen id below the cursor -> when noticed
+        self._stats = {
+            "ticks": 0,
+            "device_updates": 0,
+            "usage_updates": 0,
+            "usage_late": 0,
+            "messages": 0,
+            "resyncs": 0,
+            "rejected": 0,
+        }
+
+    # --- lifecycle (event loop thread) ---
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._last_usage_id = await asyncio.to_thread(self._newest_usage_id)
+        db.add_change_listener(self._on_change)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        db.remove_change_listener(self._on_change)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # --- subscribers ---
+
+    def subscribe(self) -> _Subscriber:
+        if len(self._subscribers) >= ADMIN_STREAM_MAX_SUBSCRIBERS:
+            self._stats["rejected"] += 1
+            raise StreamFull()
+        sub = _Subscriber(ADMIN_STREAM_QUEUE_SIZE)
+        self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: _Subscriber) -> None:
+        self._subscribers.discard(sub)
+
+    def snapshot(self) -> bytes:
+        """Full state for a new subscriber (blocking DB reads; run in a thread)."""
+        return sse_message(
+            "snapshot",
+            {
+                "devices": db.get_device_live_status(),
+                "usage": db.get_recent_usage(limit=ADMIN_STREAM_RECENT_EVENTS),
+            },
+        )
+
+    def _publish(self, message: bytes) -> None:
+        self._stats["messages"] += 1
+        for sub in self._subscribers:
+            if sub.lagging:
+                continue
+            try:
+                sub.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too far behind: drop its backlog, tell it to reload
+                sub.lagging = True
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.queue.put_nowait(RESYNC)
+                self._stats["resyncs"] += 1
+
+    # --- change signals ---
+
+    def _on_change(self, kind: str, keys: List[str]) -> None:
+        """db change listener; called on the committing thread or the change relay."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._mark, kind, keys)
+        except RuntimeError:
+            pass  # loop shutting down
+
+    def _mark(self, kind: str, keys: List[str]) -> None:
+        if kind == "device":
+            self._dirty_devices.update(keys)
+        elif kind == "usage":
+            self._usage_dirty = True
+        else:
+            return
+        if self._wake is not None:
+            self._wake.set()
+
+    # --- coalescing loop ---
+
+    async def _run(self) -> None:
+        while True:
+            await self._wake.wait()
+            # Let bursts pile up so each device is read and sent once per window
+            await asyncio.sleep(ADMIN_STREAM_COALESCE_MS / 1000.0)
+            self._wake.clear()
+            devices, self._dirty_devices = self._dirty_devices, set()
+            usage, self._usage_dirty = self._usage_dirty, False
+            if not self._subscribers:
+                if usage:
+                    # Nobody to tell; just keep the cursor current
+                    self._last_usage_id = await asyncio.to_thread(self._newest_usage_id)
+                    self._usage_gaps.clear()
+                continue
+            self._stats["ticks"] += 1
+            try:
+                if devices:
+                    entries = await asyncio.to_thread(db.get_device_live_status, sorted(devices))
+                    if entries:
+                        self._stats["device_updates"] += len(entries)
+                        self._publish(sse_message("devices", entries))
+                if usage:
+                    cutoff = time.monotonic() - ADMIN_STREAM_USAGE_LOOKBACK_S
+                    self._usage_gaps = {i: t for i, t in self._usage_gaps.items() if t >= cutoff}
+                    late, pages = await asyncio.to_thread(
+                        self._usage_late_and_since, self._last_usage_id, sorted(self._usage_gaps)
+                    )
+                    for event in late:
+                        self._usage_gaps.pop(event["id"], None)
+                    if late:
+                        self._stats["usage_late"] += len(late)
+                        self._stats["usage_updates"] += len(late)
+                        self._publish(sse_message("usage", late))
+                    for page in pages:
+                        self._note_usage_gaps(page)
+                        self._last_usage_id = page[0]["id"]
+                        self._stats["usage_updates"] += len(page)
+                        self._publish(sse_message("usage", page))
+            except Exception as err:
+                print(f"[AdminStream] update failed: {err}")
+
+    def _usage_late_and_since(self, after_id: int, gaps: List[int]):
+        """(gap ids that have since committed, _usage_since(after_id))."""
+        late = db.get_recent_usage(limit=len(gaps), ids=gaps) if gaps else []
+        return late, self._usage_since(after_id)
+
+    def _note_usage_gaps(self, page: List[Dict[str, Any]]) -> None:
+        """Remember ids under page[0] that neither it nor the cursor covers."""
+        now = time.monotonic()
+        sent = {e["id"] for e in page}
+        low = max(self._last_usage_id, page[0]["id"] - ADMIN_STREAM_USAGE_MAX_GAPS)
+        for i in range(page[0]["id"] - 1, low, -1):
+            if i not in sent:
+                self._usage_gaps.setdefault(i, now)
+        excess = len(self._usage_gaps) - ADMIN_STREAM_USAGE_MAX_GAPS
+        if excess > 0:
+            for i in sorted(self._usage_gaps)[:excess]:
+                del self._usage_gaps[i]
+
+    def _usage_since(self, after_id: int) -> List[List[Dict[str, Any]]]:
+        """Every usage event newer than after_id, as newest-first pages, oldest page first."""
+        pages: List[List[Dict[str, Any]]] = []
+        before_id = None
+        while True:
+            page = db.get_recent_usage(limit=ADMIN_STREAM_USAGE_PAGE, before_id=before_id, after_id=after_id)
+            if page:
+                pages.append(page)
+            if len(page) < ADMIN_STREAM_USAGE_PAGE:
+                break
+            before_id = page[-1]["id"]
+        pages.reverse()
+        return pages
+
+    def _newest_usage_id(self) -> int:
+        latest = db.get_recent_usage(limit=1, include_detail=False)
+        return latest[0]["id"] if latest else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None,
+            "subscribers": len(self._subscribers),
+            "lagging": sum(1 for s in self._subscribers if s.lagging),
+            "coalesce_ms": ADMIN_STREAM_COALESCE_MS,
+            "pending_devices": len(self._dirty_devices),
+            "usage_gaps": len(self._usage_gaps),
+            **self._stats,
+        }
+
+
+admin_stream = AdminStream()
+
+
+async def stream_events(sub: _Subscriber, snapshot: bytes, is_disconnected):
+    """Body iterator for one subscriber's StreamingResponse."""
+    try:
+        yield b"retry: 3000\n\n" + snapshot
+        last_sent = time.monotonic()
+        while True:
+            try:
+                message = await asyncio.wait_for(sub.queue.get(), timeout=1.0)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    return
+                if time.monotonic() - last_sent >= ADMIN_STREAM_KEEPALIVE_S:
+                    last_sent = time.monotonic()
+                    yield KEEPALIVE
+                continue
+            last_sent = time.monotonic()
+            yield message
+            if message is RESYNC:
+                return
+    finally:
+        admin_stream.unsubscribe(sub)
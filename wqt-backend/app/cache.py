@@ -0,0 +1,134 @@
+# wqt-backend/app/cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Small bounded, thread-safe cache with per-entry expiry.
+
+    - Entries expire `ttl_seconds` after they were stored (or earlier when
+      `set(..., ttl=...)` passes a shorter lifetime).
+    - When `max_entries` is reached the least recently used entry is evicted.
+    - Hit / miss / eviction counters are kept for the admin metrics view.
+    - Read-through fills that may race a writer take `fill_token()` before
+      reading the source and store with `set_if_unchanged()`, which skips
+      the store if the key was set or invalidated since. The per-key write
+      stamps this needs are bounded by `max_entries` as well.
+
+    Sync FastAPI dependencies run in the threadpool, so every access is
+    guarded by a lock.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1024, ttl_seconds: float = 60.0) -> None:
+        self.name = name
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds)
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._stamps: "OrderedDict[Hashable, int]" = OrderedDict()
+        # Highest stamp dropped from _stamps; unknown keys are assumed this recent
+        self._stamp_floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._stamp(key)
+            self._store(key, value, ttl)
+
+    def fill_token(self) -> int:
+        """Take before reading the source for a later set_if_unchanged()."""
+        with self._lock:
+            return self._seq
+
+    def set_if_unchanged(self, key: Hashable, value: Any, token: int, ttl: Optional[float] = None) -> bool:
+        """Store unless `key` was set or invalidated after `token` was taken."""
+        with self._lock:
+            if self._stamps.get(key, self._stamp_floor) > token:
+                return False
+            self._store(key, value, ttl)
+            return True
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._stamp(key)
+            if self._data.pop(key, _MISSING) is not _MISSING:
+                self.invalidations += 1
+
+    def invalidate_where(self, predicate: Callable[[Hashable, Any], bool]) -> int:
+        """Drop every entry for which `predicate(key, value)` is true."""
+        with self._lock:
+            doomed = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for k in doomed:
+                self._stamp(k)
+                del self._data[k]
+            self.invalidations += len(doomed)
+            return len(doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._seq += 1
+            self._stamps.clear()
+            self._stamp_floor = self._seq
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def _stamp(self, key: Hashable) -> None:
+        # Caller holds the lock
+        self._seq += 1
+        self._stamps[key] = self._seq
+        self._stamps.move_to_end(key)
+        while len(self._stamps) > self.max_entries:
+            _, dropped = self._stamps.popitem(last=False)
+            self._stamp_floor = max(self._stamp_floor, dropped)
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]) -> None:
+        # Caller holds the lock
+        lifetime = self.ttl_seconds if ttl is None else min(float(ttl), self.ttl_seconds)
+        if lifetime <= 0:
+            return
+        self._data[key] = (time.monotonic() + lifetime, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = len(self._data)
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
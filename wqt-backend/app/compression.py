@@ -0,0 +1,116 @@
+# wqt-backend/app/compression.py
+"""
+Transparent compression for large JSON TEXT columns.
+
+Values at or above COLUMN_COMPRESS_MIN_BYTES are stored as a short format
+marker followed by base64 of the compressed bytes:
+
+    zs:<base64>   zstd  (needs the optional `zstandard` package)
+    gz:<base64>   gzip
+
+Anything else is plain text. JSON can never start with "zs:" / "gz:", so
+rows written before compression existed (or below the threshold) read back
+unchanged, and no column type change is needed.
+
+COLUMN_COMPRESSION=auto|zstd|gzip|off picks the codec for *new* writes
+(auto = zstd when installed, else gzip). Reading always understands every
+marker, so switching codecs or turning compression off is safe; the
+re-encoder in db.py rewrites existing rows to the current setting.
+"""
+import base64
+import gzip
+import logging
+import os
+import threading
+from typing import Optional
+
+from sqlalchemy.types import Text, TypeDecorator
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+GZIP_MARKER = "gz:"
+ZSTD_MARKER = "zs:"
+
+COLUMN_COMPRESS_MIN_BYTES = int(os.getenv("COLUMN_COMPRESS_MIN_BYTES", "1024"))
+COLUMN_COMPRESS_LEVEL = int(os.getenv("COLUMN_COMPRESS_LEVEL", "6"))
+
+
+def _pick_codec() -> Optional[str]:
+    wanted = os.getenv("COLUMN_COMPRESSION", "auto").strip().lower()
+    if wanted == "off":
+        return None
+    if wanted == "zstd" and zstandard is None:
+        logging.warning("[Compression] COLUMN_COMPRESSION=zstd but zstandard is not installed; using gzip")
+        return "gzip"
+    if wanted in ("zstd", "gzip"):
+        return wanted
+    return "zstd" if zstandard is not None else "gzip"
+
+
+COLUMN_CODEC = _pick_codec()
+
+# zstd (de)compressor objects are not safe to share between threads
+_zstd_local = threading.local()
+
+
+def _zstd_compressor():
+    c = getattr(_zstd_local, "compressor", None)
+    if c is None:
+        c = _zstd_local.compressor = zstandard.ZstdCompressor(level=COLUMN_COMPRESS_LEVEL)
+    return c
+
+
+def _zstd_decompressor():
+    d = getattr(_zstd_local, "decompressor", None)
+    if d is None:
+        d = _zstd_local.decompressor = zstandard.ZstdDecompressor()
+    return d
+
+
+def is_compressed(stored: Optional[str]) -> bool:
+    return bool(stored) and stored.startswith((GZIP_MARKER, ZSTD_MARKER))
+
+
+def encode_text(value: Optional[str]) -> Optional[str]:
+    """Plain text -> stored form, compressing when it is large enough to pay off."""
+    if value is None or COLUMN_CODEC is None:
+        return value
+    raw = value.encode("utf-8")
+    if len(raw) < COLUMN_COMPRESS_MIN_BYTES:
+        return value
+    if COLUMN_CODEC == "zstd":
+        marker, packed = ZSTD_MARKER, _zstd_compressor().compress(raw)
+    else:
+        marker, packed = GZIP_MARKER, gzip.compress(raw, compresslevel=COLUMN_COMPRESS_LEVEL, mtime=0)
+    encoded = marker + base64.b64encode(packed).decode("ascii")
+    # Incompressible data stays plain
+    return encoded if len(encoded) < len(raw) else value
+
+
+def decode_text(stored: Optional[str]) -> Optional[str]:
+    """Stored form -> plain text; plain rows pass through untouched."""
+    if not stored:
+        return stored
+    if stored.startswith(GZIP_MARKER):
+        return gzip.decompress(base64.b64decode(stored[len(GZIP_MARKER):])).decode("utf-8")
+    if stored.startswith(ZSTD_MARKER):
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed column value found but zstandard is not installed")
+        return _zstd_decompressor().decompress(base64.b64decode(stored[len(ZSTD_MARKER):])).decode("utf-8")
+    return stored
+
+
+class CompressedText(TypeDecorator):
+    """TEXT column that compresses large values on write and decodes on read."""
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return encode_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decode_text(value)
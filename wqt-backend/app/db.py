@@ -1,7 +1,11 @@
 import os
-import json
+import random
+import hashlib
+import select as io_select
+import threading
+import time
 from datetime import datetime, timedelta, timezone
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any, Tuple
 
 from passlib.context import CryptContext
 
@@ -19,11 +23,38 @@ from sqlalchemy import (
     CheckConstraint,
     Index,
     case,
+    inspect,
+    event,
+    text,
+    select,
+    insert,
+    update,
+    literal,
+    exists,
+    type_coerce,
+    or_,
+    and_,
+    tuple_,
 )
-from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
 from sqlalchemy.exc import IntegrityError
 
+from .cache import TTLCache
+from .write_behind import WriteBehindBuffer
+from .event_queue import BatchQueue
+from . import jsoncodec
+from .compression import (
+    CompressedText,
+    COLUMN_CODEC,
+    COLUMN_COMPRESS_MIN_BYTES,
+    GZIP_MARKER,
+    ZSTD_MARKER,
+    decode_text,
+    encode_text,
+)
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 
 Base = declarative_base()
@@ -79,10 +110,71 @@ def init_db() -> None:
             conn.execute(text("ALTER TABLE shift_sessions ADD COLUMN IF NOT EXISTS duration_minutes INTEGER;"))
             conn.execute(text("ALTER TABLE shift_sessions ADD COLUMN IF NOT EXISTS active_minutes INTEGER;"))
             conn.execute(text("ALTER TABLE shift_sessions ADD COLUMN IF NOT EXISTS summary_json TEXT;"))
+            conn.execute(text("ALTER TABLE shift_sessions ADD COLUMN IF NOT EXISTS order_count INTEGER;"))
+            conn.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS shift_id INTEGER;"))
+            conn.execute(text("ALTER TABLE orders ADD COLUMN IF NOT EXISTS active_min INTEGER;"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_orders_shift_id ON orders (shift_id);"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_shift_sessions_operator_started_at ON shift_sessions (operator_id, started_at DESC, id DESC);"))
+            conn.execute(text("ALTER TABLE device_states ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;"))
+            conn.execute(text("ALTER TABLE device_states ADD COLUMN IF NOT EXISTS payload_fingerprint TEXT;"))
+            conn.execute(text("ALTER TABLE device_states ADD COLUMN IF NOT EXISTS payload_validated BOOLEAN NOT NULL DEFAULT FALSE;"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_usage_events_category_created_at ON usage_events (category, created_at);"))
+            conn.execute(text("ALTER TABLE usage_events ADD COLUMN IF NOT EXISTS device_id TEXT;"))
+            conn.execute(text("ALTER TABLE usage_events ADD COLUMN IF NOT EXISTS operator_id TEXT;"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_usage_events_category_id ON usage_events (category, id);"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_usage_events_device_id_id ON usage_events (device_id, id);"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_usage_events_operator_id_id ON usage_events (operator_id, id);"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_admin_messages_unread ON admin_messages (device_id) WHERE read_at IS NULL;"))
     except Exception:
         # If ALTER fails (e.g., non-Postgres or permission issues), ignore —
         # admins can run the migration manually in the DB.
         pass
+    _ensure_open_shift_unique_index()
+    _start_state_buffer()
+    _start_usage_queue()
+    _backfill_live_status_if_empty()
+    _backfill_usage_rollups_if_empty()
+    if COLUMN_REENCODE_ON_STARTUP:
+        start_column_reencoder()
+
+
+def _ensure_open_shift_unique_index() -> None:
+    # The partial unique index is start_shift's ON CONFLICT target, so the
+    # app cannot run without it. Existing duplicate open shifts are not
+    # touched here: migrations/20261016_unique_open_shift_per_operator.sql
+    # closes them once, and until it has run the index cannot be built.
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_shift_sessions_open_operator "
+                "ON shift_sessions (operator_id) WHERE ended_at IS NULL;"
+            ))
+            conn.execute(text("DROP INDEX IF EXISTS ix_shift_sessions_open_operator;"))
+    except Exception as err:
+        # Another worker may have created it at the same moment
+        names = {ix["name"] for ix in inspect(engine).get_indexes("shift_sessions")}
+        if "uq_shift_sessions_open_operator" not in names:
+            raise RuntimeError(
+                "uq_shift_sessions_open_operator could not be created; close duplicate open "
+                "shifts with migrations/20261016_unique_open_shift_per_operator.sql first"
+            ) from err
+
+
+def _backfill_live_status_if_empty() -> None:
+    # First start after device_live_status was added: project existing rows once
+    try:
+        session = get_session()
+        try:
+            missing = (
+                session.query(DeviceLiveStatus.storage_key).first() is None
+                and session.query(DeviceState.id).first() is not None
+            )
+        finally:
+            session.close()
+        if missing:
+            print(f"[LiveStatus] backfilled {rebuild_device_live_status()} device rows")
+    except Exception as err:
+        print(f"[LiveStatus] backfill skipped: {err}")
 
 
 def get_session() -> Session:
@@ -90,6 +182,151 @@ def get_session() -> Session:
         raise RuntimeError("DB not initialised")
     return SessionLocal()
 
+
+# --- Change notifications ---
+#
+# Writers call _note_change() inside their transaction; once it commits,
+# every callback registered with add_change_listener() gets (kind, keys)
+# on the committing thread. kind is "device" (keys = device_live_status
+# storage keys), "usage" (no keys) or "message" (keys = device ids with a
+# new admin message). On Postgres the same change is also sent with
+# pg_notify on CHANGE_NOTIFY_CHANNEL, delivered on commit; the change relay
+# (start_change_relay) LISTENs for it and feeds the same listeners, so
+# changes committed by other worker processes are heard too. Payloads carry
+# this process's _CHANGE_ORIGIN, and the relay drops its own, so a local
+# commit reaches each listener once (via after_commit).
+ADMIN_CHANGE_NOTIFY = os.getenv("ADMIN_CHANGE_NOTIFY", "1") == "1"
+CHANGE_NOTIFY_CHANNEL = "wqt_changes"
+_CHANGE_ORIGIN = f"{os.getpid()}.{random.getrandbits(32):08x}"
+
+_change_listeners: List[Callable[[str, List[str]], None]] = []
+
+
+def add_change_listener(fn: Callable[[str, List[str]], None]) -> None:
+    if fn not in _change_listeners:
+        _change_listeners.append(fn)
+
+
+def remove_change_listener(fn: Callable[[str, List[str]], None]) -> None:
+    if fn in _change_listeners:
+        _change_listeners.remove(fn)
+
+
+def _note_change(session: Session, kind: str, keys: List[str], notified: bool = False) -> None:
+    # notified=True: the caller's own statement already ran pg_notify
+    if not ADMIN_CHANGE_NOTIFY:
+        return
+    session.info.setdefault("pending_changes", []).append((kind, keys))
+    if not notified and engine is not None and engine.dialect.name == "postgresql":
+        # One statement per batch; identical payloads are folded by Postgres
+        session.execute(
+            text("SELECT pg_notify(:channel, p) FROM unnest(CAST(:payloads AS text[])) AS p"),
+            {"channel": CHANGE_NOTIFY_CHANNEL, "payloads": [f"{_CHANGE_ORIGIN}|{kind}:{k}" for k in keys]},
+        )
+
+
+def _dispatch_change(kind: str, keys: List[str]) -> None:
+    for fn in list(_change_listeners):
+        try:
+            fn(kind, keys)
+        except Exception as err:
+            print(f"[Changes] listener failed: {err}")
+
+
+@event.listens_for(Session, "after_commit")
+def _fire_change_listeners(session: Session) -> None:
+    changes = session.info.pop("pending_changes", None)
+    if not changes or not _change_listeners:
+        return
+    for kind, keys in changes:
+        _dispatch_change(kind, keys)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_changes(session: Session) -> None:
+    session.info.pop("pending_changes", None)
+
+
+_relay_thread: Optional[threading.Thread] = None
+_relay_stop = threading.Event()
+_relay_stats = {"notifications": 0, "own_dropped": 0, "reconnects": 0}
+
+
+def _parse_change_payload(payload: str) -> Tuple[str, str, str]:
+    """(origin, kind, key) from an "origin|kind:key" NOTIFY payload."""
+    origin, sep, rest = payload.partition("|")
+    if not sep or ":" in origin:
+        # Untagged (sent by a worker still on the old format)
+        origin, rest = "", payload
+    kind, _, key = rest.partition(":")
+    return origin, kind, key
+
+
+def _relay_loop() -> None:
+    while not _relay_stop.is_set():
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {CHANGE_NOTIFY_CHANNEL}")
+            while not _relay_stop.is_set():
+                if io_select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                marks: Dict[str, List[str]] = {}
+                while conn.notifies:
+                    origin, kind, key = _parse_change_payload(conn.notifies.pop(0).payload)
+                    if origin == _CHANGE_ORIGIN:
+                        # Already dispatched by after_commit in this process
+                        _relay_stats["own_dropped"] += 1
+                        continue
+                    marks.setdefault(kind, []).append(key)
+                _relay_stats["notifications"] += sum(len(v) for v in marks.values())
+                for kind, keys in marks.items():
+                    _dispatch_change(kind, keys)
+        except Exception as err:
+            print(f"[Changes] LISTEN connection failed: {err}")
+            _relay_stats["reconnects"] += 1
+            _relay_stop.wait(5.0)
+        finally:
+            if raw is not None:
+                try:
+                    raw.invalidate()
+                except Exception:
+                    pass
+
+
+def start_change_relay() -> bool:
+    """LISTEN for other workers' changes on a background thread (Postgres only)."""
+    global _relay_thread
+    if engine is None or engine.dialect.name != "postgresql" or not ADMIN_CHANGE_NOTIFY:
+        return False
+    if _relay_thread is not None and _relay_thread.is_alive():
+        return False
+    _relay_stop.clear()
+    _relay_thread = threading.Thread(target=_relay_loop, name="change-relay", daemon=True)
+    _relay_thread.start()
+    return True
+
+
+def stop_change_relay() -> None:
+    global _relay_thread
+    _relay_stop.set()
+    if _relay_thread is not None:
+        _relay_thread.join(5.0)
+        _relay_thread = None
+
+
+def get_change_relay_stats() -> Dict[str, Any]:
+    return {
+        "cross_worker": _relay_thread is not None and _relay_thread.is_alive(),
+        "listeners": len(_change_listeners),
+        **_relay_stats,
+    }
+
+
 # --- Models ---
 
 
@@ -105,19 +342,83 @@ class DeviceState(Base):
     We will gradually move the *meaningful* historical data into
     proper tables (ShiftSession, OrderRecord, OrderEvent), so this blob
     can eventually be trimmed down or removed.
+
+    `version` is bumped on every write; clients send it back as the base
+    for delta saves (PATCH /api/state). `payload_fingerprint` hashes the
+    payload minus volatile fields so unchanged saves can be skipped.
+    `payload_validated` marks rows written from a validated MainState, whose
+    stored text GET /api/state can send back as-is.
     """
     __tablename__ = "device_states"
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(Text, unique=True, index=True, nullable=False)
-    payload = Column(Text, nullable=False)
+    payload = Column(CompressedText, nullable=False)
+    version = Column(Integer, nullable=False, default=0, server_default=text("0"))
+    payload_fingerprint = Column(Text, nullable=True)
+    payload_validated = Column(Boolean, nullable=False, default=False, server_default=text("false"))
+
+
+class DeviceLiveStatus(Base):
+    """
+    Compact projection of each device_states row for the admin live floor.
+
+    Rewritten in the same transaction as every state write, so the
+    dashboard can poll this narrow table instead of parsing full blobs.
+    """
+    __tablename__ = "device_live_status"
+    storage_key = Column(Text, primary_key=True)            # device_states.device_id
+    device_id = Column(Text, nullable=True)                 # current.device_id (real device)
+    logical_key = Column(Text, nullable=False, index=True)  # operator_id -> operator_name -> storage_key
+    operator_id = Column(Text, nullable=True)
+    operator_name = Column(Text, nullable=True)
+    operator_role = Column(Text, nullable=True)
+    order_name = Column(Text, nullable=True)
+    units_done = Column(Integer, nullable=True)
+    units_left = Column(Integer, nullable=True)
+    units_total = Column(Integer, nullable=True)
+    locations = Column(Integer, nullable=True)
+    live_rate = Column(Float, nullable=True)
+    active_break = Column(Text, nullable=True)              # small JSON object or NULL
+    saved_at = Column(Text, nullable=True)                  # savedAt as sent by the frontend
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
 class UsageEvent(Base):
     __tablename__ = "usage_events"
+    __table_args__ = (
+        Index("ix_usage_events_category_created_at", "category", "created_at"),
+        Index("ix_usage_events_category_id", "category", "id"),
+        Index("ix_usage_events_device_id_id", "device_id", "id"),
+        Index("ix_usage_events_operator_id_id", "operator_id", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     category = Column(Text, nullable=False)
     detail = Column(Text, nullable=True)
+    # Promoted from `detail` so the admin log can filter/page in SQL
+    device_id = Column(Text, nullable=True)
+    operator_id = Column(Text, nullable=True)
+
+
+class UsageRollup(Base):
+    """
+    Hourly event counts per category / operator / device, kept up to date by
+    the usage-event writer so summaries never have to scan usage_events.
+    Missing operator/device are stored as '' so the unique key works on
+    Postgres (NULLs never conflict).
+    """
+    __tablename__ = "usage_rollups"
+    __table_args__ = (
+        UniqueConstraint("bucket_start", "category", "operator_id", "device_id", name="uq_usage_rollups_bucket"),
+        Index("ix_usage_rollups_category_bucket", "category", "bucket_start"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    bucket_start = Column(DateTime(timezone=True), nullable=False)
+    category = Column(Text, nullable=False)
+    operator_id = Column(Text, nullable=False, default="", server_default=text("''"))
+    device_id = Column(Text, nullable=False, default="", server_default=text("''"))
+    count = Column(Integer, nullable=False, default=0, server_default=text("0"))
 
 
 class ShiftSession(Base):
@@ -141,7 +442,8 @@ class ShiftSession(Base):
     avg_rate = Column(Float, nullable=True)
     duration_minutes = Column(Integer, nullable=True)
     active_minutes = Column(Integer, nullable=True)
-    summary_json = Column(Text, nullable=True)
+    order_count = Column(Integer, nullable=True)
+    summary_json = Column(CompressedText, nullable=True)
     zone_green_seconds = Column(Integer, nullable=True, server_default=text("0"))
     zone_amber_seconds = Column(Integer, nullable=True, server_default=text("0"))
     zone_red_seconds = Column(Integer, nullable=True, server_default=text("0"))
@@ -150,7 +452,27 @@ class ShiftSession(Base):
     zone_id = Column(Text, nullable=True)
     zone_label = Column(Text, nullable=True)
     state_version = Column(Integer, nullable=False, default=0)
-    active_order_snapshot = Column(Text, nullable=True)  # JSON string for now
+    active_order_snapshot = Column(CompressedText, nullable=True)  # JSON string for now
+
+
+# Shift history pages: per operator, newest first, keyset on (started_at, id)
+Index(
+    "ix_shift_sessions_operator_started_at",
+    ShiftSession.operator_id,
+    ShiftSession.started_at.desc(),
+    ShiftSession.id.desc(),
+)
+
+
+# At most one open shift per operator. Also serves every open-shift lookup
+# (operator_id, ended_at IS NULL) and is the ON CONFLICT target in start_shift.
+Index(
+    "uq_shift_sessions_open_operator",
+    ShiftSession.operator_id,
+    unique=True,
+    postgresql_where=ShiftSession.ended_at.is_(None),
+    sqlite_where=ShiftSession.ended_at.is_(None),
+)
 
 
 class OrderRecord(Base):
@@ -197,7 +519,12 @@ class OrderRecord(Base):
     notes = Column(Text, nullable=True)                      # optional aggregated notes
 
     # Optional raw log for debugging (wraps/breaks) – JSON string
-    log_json = Column(Text, nullable=True)
+    log_json = Column(CompressedText, nullable=True)
+
+    # Shift rollup: the operator's open shift when recorded, and active
+    # minutes (duration minus excl, breaks and wraps) so end_shift can sum in SQL
+    shift_id = Column(Integer, nullable=True, index=True)
+    active_min = Column(Integer, nullable=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
@@ -255,6 +582,15 @@ class User(Base):
 
 class AdminMessage(Base):
     __tablename__ = "admin_messages"
+    __table_args__ = (
+        # Only unread rows are ever looked up by device; keeps the index tiny
+        Index(
+            "ix_admin_messages_unread",
+            "device_id",
+            postgresql_where=text("read_at IS NULL"),
+            sqlite_where=text("read_at IS NULL"),
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True)
     device_id = Column(Text, index=True, nullable=False)
     message_text = Column(Text, nullable=False)
@@ -306,144 +642,1141 @@ class BayOccupancy(Base):
 # --- Global / device state helpers ---
 
 
+class StateVersionConflict(Exception):
+    """The stored state moved on since the version the client patched against."""
+
+    def __init__(self, current_version: int) -> None:
+        super().__init__(f"device state is at version {current_version}")
+        self.current_version = current_version
+
+
+# Fields that change on every save without the state meaningfully changing
+# (the 30s timer re-stamps savedAt; liveRate is recomputed server-side).
+_VOLATILE_STATE_FIELDS = ("savedAt",)
+_VOLATILE_CURRENT_FIELDS = ("liveRate",)
+
+_state_save_stats = {"written": 0, "skipped": 0}
+_state_save_stats_lock = threading.Lock()
+
+
+def _count_state_save(written: bool) -> None:
+    with _state_save_stats_lock:
+        _state_save_stats["written" if written else "skipped"] += 1
+
+
+def get_state_save_stats() -> Dict[str, int]:
+    with _state_save_stats_lock:
+        return dict(_state_save_stats)
+
+
+def state_fingerprint(payload: Dict[str, Any]) -> str:
+    """Stable hash of a normalised state payload, ignoring volatile fields."""
+    stable = {k: v for k, v in (payload or {}).items() if k not in _VOLATILE_STATE_FIELDS}
+    cur = stable.get("current")
+    if isinstance(cur, dict):
+        stable["current"] = {k: v for k, v in cur.items() if k not in _VOLATILE_CURRENT_FIELDS}
+    encoded = jsoncodec.dumps_bytes(stable, sort_keys=True)
+    return hashlib.sha256(encoded).hexdigest()
+
+
 def load_device_state(device_id: str) -> Optional[dict]:
+    loaded = load_device_state_with_version(device_id)
+    return loaded[0] if loaded else None
+
+
+def load_device_state_with_version(device_id: str) -> Optional[Tuple[dict, int]]:
+    """Return (payload, version) for a storage key, or None when there is no row."""
+    loaded = load_device_state_text(device_id)
+    return (jsoncodec.loads(loaded[0]), loaded[1]) if loaded else None
+
+
+def load_device_state_text(device_id: str) -> Optional[Tuple[str, int, bool]]:
+    """
+    Return (payload_text, version, validated) for a storage key without
+    parsing the payload, or None when there is no row.
+    """
     if engine is None or not device_id:
         return None
+    if _state_buffer is not None:
+        buffered = _state_buffer.get(device_id)
+        if buffered is not None:
+            return buffered["payload"], buffered["version"], buffered["payload_validated"]
     session = get_session()
     try:
-        row = session.query(DeviceState).filter(DeviceState.device_id == device_id).first()
-        return json.loads(row.payload) if row else None
+        row = (
+            session.query(DeviceState.payload, DeviceState.version, DeviceState.payload_validated)
+            .filter(DeviceState.device_id == device_id)
+            .first()
+        )
+        if row is None:
+            return None
+        return row.payload, int(row.version or 0), bool(row.payload_validated)
     except Exception:
         return None
     finally:
         session.close()
 
 
-def save_device_state(device_id: str, payload: dict) -> None:
-    if engine is None or not device_id:
-        return
+def _load_device_state_head(device_id: str) -> Optional[Tuple[int, Optional[str]]]:
+    """(version, fingerprint) of the stored row, without loading the payload."""
     session = get_session()
     try:
-        # Defensive normalization: ensure any order objects include `locations`
-        safe_payload = dict(payload or {})
-        try:
-            # Normalize top-level current.locations
-            cur = safe_payload.get('current')
-            if isinstance(cur, dict):
-                cur['locations'] = int(cur.get('locations') or 0)
-        except Exception:
-            pass
+        row = (
+            session.query(DeviceState.version, DeviceState.payload_fingerprint)
+            .filter(DeviceState.device_id == device_id)
+            .first()
+        )
+        return (int(row.version or 0), row.payload_fingerprint) if row else None
+    finally:
+        session.close()
 
-        try:
-            # Normalize picks[] entries
-            picks = safe_payload.get('picks')
-            if isinstance(picks, list):
-                for p in picks:
-                    try:
-                        if isinstance(p, dict):
-                            p['locations'] = int(p.get('locations') or 0)
-                    except Exception:
-                        p['locations'] = 0
-        except Exception:
-            pass
 
-        try:
-            # Normalize history -> each day's picks if present
-            history = safe_payload.get('history')
-            if isinstance(history, list):
-                for day in history:
-                    if isinstance(day, dict):
-                        day_picks = day.get('picks')
-                        if isinstance(day_picks, list):
-                            for p in day_picks:
-                                try:
-                                    if isinstance(p, dict):
-                                        p['locations'] = int(p.get('locations') or 0)
-                                except Exception:
-                                    p['locations'] = 0
-        except Exception:
-            pass
+def get_device_state_version(device_id: str) -> Optional[int]:
+    """Version of the stored state without touching the payload; None when there is no row."""
+    if engine is None or not device_id:
+        return None
+    if _state_buffer is not None:
+        buffered = _state_buffer.get(device_id)
+        if buffered is not None:
+            return buffered["version"]
+    try:
+        head = _load_device_state_head(device_id)
+        return head[0] if head else None
+    except Exception:
+        return None
+
+
+def normalize_state_payload(payload: dict) -> dict:
+    """The payload exactly as save_device_state stores it (idempotent)."""
+    # Defensive normalization: ensure any order objects include `locations`
+    safe_payload = dict(payload or {})
+    try:
+        # Normalize top-level current.locations
+        cur = safe_payload.get('current')
+        if isinstance(cur, dict):
+            cur['locations'] = int(cur.get('locations') or 0)
+    except Exception:
+        pass
 
-        row = session.query(DeviceState).filter(DeviceState.device_id == device_id).first()
+    try:
+        # Normalize picks[] entries
+        picks = safe_payload.get('picks')
+        if isinstance(picks, list):
+            for p in picks:
+                try:
+                    if isinstance(p, dict):
+                        p['locations'] = int(p.get('locations') or 0)
+                except Exception:
+                    p['locations'] = 0
+    except Exception:
+        pass
+
+    try:
+        # Normalize history -> each day's picks if present
+        history = safe_payload.get('history')
+        if isinstance(history, list):
+            for day in history:
+                if isinstance(day, dict):
+                    day_picks = day.get('picks')
+                    if isinstance(day_picks, list):
+                        for p in day_picks:
+                            try:
+                                if isinstance(p, dict):
+                                    p['locations'] = int(p.get('locations') or 0)
+                            except Exception:
+                                p['locations'] = 0
+    except Exception:
+        pass
+
+    return safe_payload
+
+
+def save_device_state(
+    device_id: str,
+    payload: dict,
+    expected_version: Optional[int] = None,
+    validated: bool = False,
+) -> Tuple[int, bool]:
+    """
+    Persist the state blob for a storage key.
+
+    Returns (version, written). When the normalised payload has the same
+    fingerprint as the stored one, the state row is left alone (only the
+    live status saved_at heartbeat is refreshed) and the current version
+    comes back with written=False.
+
+    When `expected_version` is given (delta saves), the write only happens if
+    the row is still at that version; otherwise StateVersionConflict is
+    raised and nothing is written.
+
+    On Postgres this is a single statement (INSERT ... ON CONFLICT or a
+    conditional UPDATE, wrapped in a CTE that also writes or touches the
+    live status row, sends the change NOTIFY and reports the current
+    version when nothing changed; see _pg_state_upsert), so concurrent first
+    saves cannot race on the unique device_id. Only a delta save that lost
+    a race needs a second read. SQLite takes two statements (the write,
+    then the live status row).
+
+    With STATE_WRITE_MODE=buffered the write goes to the in-process
+    write-behind buffer instead and reaches Postgres on the next flush.
+
+    Pass `validated=True` only when `payload` is a MainState dump; the
+    stored text is then served verbatim by GET /api/state.
+    """
+    if engine is None or not device_id:
+        return 0, False
+
+    safe_payload = normalize_state_payload(payload)
+    fingerprint = state_fingerprint(safe_payload)
+
+    if _state_buffer is not None:
+        return _buffer_device_state(device_id, safe_payload, fingerprint, expected_version, validated)
+
+    live_status = _live_status_row(device_id, safe_payload)
+    if _native_upsert_insert() is not None:
+        return _upsert_device_state(
+            device_id, jsoncodec.dumps(safe_payload or {}), fingerprint, expected_version, validated, live_status
+        )
+
+    # Portable fallback: SELECT ... FOR UPDATE then INSERT or UPDATE
+    session = get_session()
+    try:
+        q = session.query(DeviceState).filter(DeviceState.device_id == device_id)
+        if expected_version is not None:
+            q = q.with_for_update()
+        row = q.first()
+        current_version = int(row.version or 0) if row else 0
+        if expected_version is not None and expected_version != current_version:
+            session.rollback()
+            raise StateVersionConflict(current_version)
+        if row and row.payload_fingerprint == fingerprint:
+            _touch_live_status(session, device_id, live_status.get("saved_at"))
+            session.commit()
+            _count_state_save(False)
+            return current_version, False
         if not row:
-            session.add(DeviceState(device_id=device_id, payload=json.dumps(safe_payload or {})))
+            row = DeviceState(
+                device_id=device_id,
+                payload=jsoncodec.dumps(safe_payload or {}),
+                version=1,
+                payload_fingerprint=fingerprint,
+                payload_validated=validated,
+            )
+            session.add(row)
         else:
-            row.payload = json.dumps(safe_payload or {})
+            row.payload = jsoncodec.dumps(safe_payload or {})
+            row.version = current_version + 1
+            row.payload_fingerprint = fingerprint
+            row.payload_validated = validated
+        _upsert_live_status(session, [{**live_status, "version": current_version + 1}])
         session.commit()
+        _count_state_save(True)
+        return current_version + 1, True
     finally:
         session.close()
 
 
-def log_usage_event(category: str, detail: Optional[Dict[str, Any]] = None) -> None:
-    if engine is None:
+def _native_upsert_insert():
+    """Dialect-specific insert() supporting ON CONFLICT, or None for other engines."""
+    name = engine.dialect.name if engine is not None else None
+    if name == "postgresql":
+        return pg_insert
+    if name == "sqlite":
+        return sqlite_insert
+    return None
+
+
+def _upsert_device_state(
+    device_id: str,
+    payload_text: str,
+    fingerprint: str,
+    expected_version: Optional[int],
+    validated: bool,
+    live_status: Dict[str, Any],
+) -> Tuple[int, bool]:
+    table = DeviceState.__table__
+    changed = table.c.payload_fingerprint.is_distinct_from(fingerprint)
+
+    if expected_version is None:
+        insert_fn = _native_upsert_insert()
+        ins = insert_fn(table).values(
+            device_id=device_id,
+            payload=payload_text,
+            version=1,
+            payload_fingerprint=fingerprint,
+            payload_validated=validated,
+        )
+        write = ins.on_conflict_do_update(
+            index_elements=[table.c.device_id],
+            set_={
+                "payload": ins.excluded.payload,
+                "version": table.c.version + 1,
+                "payload_fingerprint": ins.excluded.payload_fingerprint,
+                "payload_validated": ins.excluded.payload_validated,
+            },
+            where=changed,
+        )
+    else:
+        # Delta saves only ever patch an existing row
+        write = (
+            update(table)
+            .where(table.c.device_id == device_id, table.c.version == expected_version, changed)
+            .values(
+                payload=payload_text,
+                version=table.c.version + 1,
+                payload_fingerprint=fingerprint,
+                payload_validated=validated,
+            )
+        )
+    write = write.returning(table.c.version)
+
+    session = get_session()
+    try:
+        live_done = False
+        if engine.dialect.name == "postgresql":
+            row = session.execute(_pg_state_upsert(write, device_id, expected_version, live_status)).first()
+            if row is not None:
+                version, written, changes = row
+                if changes:
+                    _note_change(session, "device", [device_id], notified=True)
+                    live_done = True
+                row = (version, written)
+                if not written and not changes and expected_version is not None and version == expected_version:
+                    # Not a no-op (that would have touched the live row): a
+                    # concurrent save at the same version won the row lock,
+                    # and the UPDATE rechecked the row it waited for while
+                    # the fallback SELECT still saw the old snapshot. A fresh
+                    # read gets the version to report in the conflict.
+                    row = None
+        else:
+            row = session.execute(write).first()
+            if row is not None:
+                row = (row[0], True)
+        if row is None:
+            # Nothing written and the row was not visible (or not current) to
+            # the statement (SQLite, a concurrent first insert that landed
+            # after our snapshot was taken, or the CAS case above): read the
+            # committed version.
+            session.commit()
+            current = session.execute(
+                select(table.c.version).where(table.c.device_id == device_id)
+            ).first()
+            row = (current[0], False) if current is not None else None
+        if row is not None and not live_done:
+            if row[1]:
+                _upsert_live_status(session, [{**live_status, "version": int(row[0])}])
+            elif expected_version is None or row[0] == expected_version:
+                _touch_live_status(session, device_id, live_status.get("saved_at"))
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+    if row is None:
+        # Only reachable for a delta save whose row has disappeared
+        raise StateVersionConflict(0)
+    version, written = int(row[0] or 0), bool(row[1])
+    if written:
+        _count_state_save(True)
+        return version, True
+    if expected_version is not None and version != expected_version:
+        raise StateVersionConflict(version)
+    _count_state_save(False)
+    return version, False
+
+
+def _pg_state_upsert(write, device_id: str, expected_version: Optional[int], live_status: Dict[str, Any]):
+    """
+    The whole sync save as one Postgres statement, returning
+    (version, written, changes):
+
+      up       the device_states write (RETURNING the new version)
+      live_up  device_live_status upsert from up's row, when it wrote
+      touch    saved_at heartbeat on the live row, when it did not (for a
+               delta save only while the live row is still at
+               expected_version, so a lost CAS race touches nothing)
+      note     pg_notify once if either live CTE changed a row
+
+    When nothing was written, version is the stored row's version from the
+    statement's snapshot.
+    """
+    table = DeviceState.__table__
+    live = DeviceLiveStatus.__table__
+    up = write.cte("up")
+    nothing_written = ~exists(select(up.c.version))
+
+    cols = [c for c in live_status if c != "version"]
+    ins = pg_insert(live).from_select(
+        cols + ["version"],
+        select(*[literal(live_status[c], type_=live.c[c].type) for c in cols], up.c.version),
+    )
+    live_up = ins.on_conflict_do_update(
+        index_elements=[live.c.storage_key],
+        set_={**{c: ins.excluded[c] for c in cols + ["version"] if c != "storage_key"}, "updated_at": func.now()},
+    ).returning(live.c.storage_key).cte("live_up")
+
+    touch_where = [live.c.storage_key == device_id, nothing_written]
+    if expected_version is not None:
+        touch_where.append(live.c.version == expected_version)
+    touch = (
+        update(live)
+        .where(*touch_where)
+        .values(saved_at=live_status.get("saved_at"), updated_at=func.now())
+        .returning(live.c.storage_key)
+        .cte("touch")
+    )
+
+    changed = select(live_up.c.storage_key).union_all(select(touch.c.storage_key)).subquery("changed")
+    if ADMIN_CHANGE_NOTIFY:
+        payload = f"{_CHANGE_ORIGIN}|device:{device_id}"
+        changes = func.count(func.pg_notify(CHANGE_NOTIFY_CHANNEL, payload))
+    else:
+        changes = func.count()
+    # An aggregate always yields one row, so joining it keeps the result rows
+    # and forces the notify to be evaluated
+    note = select(changes.label("changes")).select_from(changed).cte("note")
+
+    result = select(up.c.version, literal(True).label("written")).union_all(
+        select(table.c.version, literal(False).label("written")).where(
+            table.c.device_id == device_id, nothing_written
+        )
+    ).subquery("result")
+    return select(result.c.version, result.c.written, note.c.changes).select_from(
+        result.join(note, literal(True))
+    )
+
+
+# --- Write-behind buffering for device state ---
+#
+# STATE_WRITE_MODE=sync (default): every save commits before the response.
+# STATE_WRITE_MODE=buffered: saves are acknowledged from memory and flushed
+#   in bulk every STATE_FLUSH_INTERVAL_MS (or once STATE_FLUSH_MAX_PENDING
+#   keys are waiting). Up to one interval of saves can be lost on a hard
+#   crash; a clean shutdown drains the buffer. Versions are assigned in
+#   process, so buffered mode assumes each user's saves land on one worker
+#   (sticky sessions or a single worker).
+STATE_WRITE_MODE = os.getenv("STATE_WRITE_MODE", "sync").strip().lower()
+STATE_FLUSH_INTERVAL_MS = int(os.getenv("STATE_FLUSH_INTERVAL_MS", "500"))
+STATE_FLUSH_MAX_PENDING = int(os.getenv("STATE_FLUSH_MAX_PENDING", "200"))
+
+_state_buffer: Optional[WriteBehindBuffer] = None
+# Striped per storage key: the version check, the head read it may need and
+# the put must not interleave with another save of the same key
+_state_buffer_locks = [threading.Lock() for _ in range(64)]
+
+
+def _buffer_device_state(
+    device_id: str,
+    safe_payload: dict,
+    fingerprint: str,
+    expected_version: Optional[int],
+    validated: bool,
+) -> Tuple[int, bool]:
+    with _state_buffer_locks[hash(device_id) % len(_state_buffer_locks)]:
+        buffered = _state_buffer.get(device_id)
+        # Read the head under the lock: once get() is None, any earlier put
+        # for this key has been flushed and committed, so the row is current
+        head = _load_device_state_head(device_id) if buffered is None else None
+        if buffered is not None:
+            current_version, current_fingerprint = buffered["version"], buffered["payload_fingerprint"]
+        elif head is not None:
+            current_version, current_fingerprint = head
+        else:
+            current_version, current_fingerprint = 0, None
+
+        if expected_version is not None and expected_version != current_version:
+            raise StateVersionConflict(current_version)
+        if current_fingerprint == fingerprint:
+            _count_state_save(False)
+            saved_at = _live_status_row(device_id, safe_payload).get("saved_at")
+            if buffered is None:
+                touch = True
+            else:
+                # A direct touch would be overwritten by the flush with the
+                # older savedAt, so carry the heartbeat in the buffer instead
+                _state_buffer.put(
+                    device_id, {**buffered, "live_status": {**buffered["live_status"], "saved_at": saved_at}}
+                )
+                return current_version, False
+        else:
+            touch = False
+            version = current_version + 1
+            _state_buffer.put(
+                device_id,
+                {
+                    "device_id": device_id,
+                    "payload": jsoncodec.dumps(safe_payload or {}),
+                    "version": version,
+                    "payload_fingerprint": fingerprint,
+                    "payload_validated": validated,
+                    "live_status": {**_live_status_row(device_id, safe_payload), "version": version},
+                },
+            )
+    if touch:
+        session = get_session()
+        try:
+            _touch_live_status(session, device_id, saved_at)
+            session.commit()
+        finally:
+            session.close()
+        return current_version, False
+    _count_state_save(True)
+    return version, True
+
+
+def _write_device_state_rows(rows: List[Dict[str, Any]]) -> None:
+    """Bulk upsert of complete device_states rows (and their live status) in one transaction."""
+    if not rows:
         return
+    live_rows = [r["live_status"] for r in rows if r.get("live_status")]
+    rows = [{k: v for k, v in r.items() if k != "live_status"} for r in rows]
+    insert_fn = _native_upsert_insert()
     session = get_session()
     try:
-        session.add(UsageEvent(category=category, detail=json.dumps(detail or {})))
+        _upsert_live_status(session, live_rows)
+        if insert_fn is not None:
+            ins = insert_fn(DeviceState.__table__)
+            session.execute(
+                ins.on_conflict_do_update(
+                    index_elements=[DeviceState.__table__.c.device_id],
+                    set_={
+                        "payload": ins.excluded.payload,
+                        "version": ins.excluded.version,
+                        "payload_fingerprint": ins.excluded.payload_fingerprint,
+                        "payload_validated": ins.excluded.payload_validated,
+                    },
+                ),
+                rows,
+            )
+            session.commit()
+            return
+
+        keys = [r["device_id"] for r in rows]
+        existing = {
+            row.device_id: row
+            for row in session.query(DeviceState).filter(DeviceState.device_id.in_(keys))
+        }
+        for r in rows:
+            row = existing.get(r["device_id"])
+            if row is None:
+                session.add(DeviceState(**r))
+            else:
+                row.payload = r["payload"]
+                row.version = r["version"]
+                row.payload_fingerprint = r["payload_fingerprint"]
+                row.payload_validated = r["payload_validated"]
         session.commit()
+    except Exception:
+        session.rollback()
+        raise
     finally:
         session.close()
 
 
-def get_recent_usage(limit: int = 100) -> List[Dict[str, Any]]:
+def _flush_state_buffer(entries: Dict[str, Dict[str, Any]]) -> None:
+    _write_device_state_rows(list(entries.values()))
+
+
+def get_state_buffer_stats() -> Optional[Dict[str, Any]]:
+    return _state_buffer.stats() if _state_buffer is not None else None
+
+
+def _start_state_buffer() -> None:
+    global _state_buffer
+    if STATE_WRITE_MODE != "buffered" or _state_buffer is not None:
+        return
+    _state_buffer = WriteBehindBuffer(
+        "device_states",
+        _flush_state_buffer,
+        interval_seconds=STATE_FLUSH_INTERVAL_MS / 1000.0,
+        max_pending=STATE_FLUSH_MAX_PENDING,
+    )
+    _state_buffer.start()
+
+
+# --- Column compression (see app/compression.py) ---
+#
+# Large JSON TEXT columns go through CompressedText. New writes are encoded
+# on the way in; existing rows are rewritten by the re-encoder, which walks
+# each table by id in small batches and only touches rows whose stored form
+# differs from what the current settings would write (so it also
+# decompresses rows after raising the threshold or COLUMN_COMPRESSION=off).
+COLUMN_REENCODE_ON_STARTUP = os.getenv("COLUMN_REENCODE_ON_STARTUP", "0") == "1"
+COLUMN_REENCODE_BATCH = int(os.getenv("COLUMN_REENCODE_BATCH", "200"))
+COLUMN_REENCODE_PAUSE_MS = int(os.getenv("COLUMN_REENCODE_PAUSE_MS", "50"))
+
+_reencoder_thread: Optional[threading.Thread] = None
+_reencoder_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _compressed_columns() -> List[Tuple[Any, str]]:
+    return [
+        (DeviceState, "payload"),
+        (ShiftSession, "summary_json"),
+        (ShiftSession, "active_order_snapshot"),
+        (OrderRecord, "log_json"),
+    ]
+
+
+def reencode_compressed_columns(batch_size: int = COLUMN_REENCODE_BATCH) -> Dict[str, Dict[str, Any]]:
+    """
+    Rewrite existing rows of every CompressedText column to the current
+    compression settings. Safe to run while the app is serving: each row is
+    updated only if its stored value is still the one we read.
+    """
+    for model, column_name in _compressed_columns():
+        table = model.__table__
+        column = table.c[column_name]
+        stored_col = type_coerce(column, Text)  # raw stored form, no decoding
+        name = f"{table.name}.{column_name}"
+        stats = _reencoder_stats[name] = {
+            "scanned": 0,
+            "rewritten": 0,
+            "bytes_before": 0,
+            "bytes_after": 0,
+            "done": False,
+        }
+        last_id = 0
+        while True:
+            session = get_session()
+            try:
+                rows = session.execute(
+                    select(table.c.id, stored_col.label("stored"))
+                    .where(table.c.id > last_id, column.isnot(None))
+                    .order_by(table.c.id)
+                    .limit(batch_size)
+                ).all()
+                for row_id, stored in rows:
+                    stats["scanned"] += 1
+                    plain = decode_text(stored)
+                    target = encode_text(plain)
+                    if target == stored:
+                        continue
+                    result = session.execute(
+                        update(table)
+                        .where(table.c.id == row_id, stored_col == stored)
+                        .values({column_name: plain})
+                    )
+                    if result.rowcount:
+                        stats["rewritten"] += 1
+                        stats["bytes_before"] += len(stored)
+                        stats["bytes_after"] += len(target)
+                session.commit()
+            except Exception as err:
+                session.rollback()
+                print(f"[Compression] re-encode of {name} failed after id {last_id}: {err}")
+                stats["error"] = True
+                break
+            finally:
+                session.close()
+            if not rows:
+                stats["done"] = True
+                break
+            last_id = rows[-1][0]
+            if COLUMN_REENCODE_PAUSE_MS:
+                # Leave room for live traffic between batches
+                time.sleep(COLUMN_REENCODE_PAUSE_MS / 1000.0)
+    return _reencoder_stats
+
+
+def start_column_reencoder() -> bool:
+    """Run reencode_compressed_columns() on a background thread; False if one is already running."""
+    global _reencoder_thread
     if engine is None:
-        return []
+        return False
+    if _reencoder_thread is not None and _reencoder_thread.is_alive():
+        return False
+    _reencoder_thread = threading.Thread(
+        target=reencode_compressed_columns, name="column-reencoder", daemon=True
+    )
+    _reencoder_thread.start()
+    return True
+
+
+def get_compression_report() -> Dict[str, Any]:
+    """
+    Stored vs. logical size per compressed column.
+
+    Plain rows are summed in SQL; compressed rows are read back and decoded
+    to get their logical size, so this scans every compressed value - it is
+    an on-demand admin report, not something to poll.
+    """
+    report: Dict[str, Any] = {
+        "codec": COLUMN_CODEC or "off",
+        "min_bytes": COLUMN_COMPRESS_MIN_BYTES,
+        "reencoder": {
+            "running": _reencoder_thread is not None and _reencoder_thread.is_alive(),
+            "columns": _reencoder_stats,
+        },
+        "columns": {},
+    }
+    if engine is None:
+        return report
     session = get_session()
     try:
-        q = session.query(UsageEvent).order_by(UsageEvent.id.desc()).limit(limit)
-        results: List[Dict[str, Any]] = []
-        for r in list(q):
-            det: Dict[str, Any] = {}
-            if r.detail:
-                try:
-                    det = json.loads(r.detail)
-                except Exception:
-                    det = {}
-            results.append(
+        for model, column_name in _compressed_columns():
+            table = model.__table__
+            stored_col = type_coerce(table.c[column_name], Text)
+            compressed = or_(stored_col.like(f"{GZIP_MARKER}%"), stored_col.like(f"{ZSTD_MARKER}%"))
+            rows, stored_bytes, plain_bytes, compressed_rows = session.execute(
+                select(
+                    func.count(),
+                    func.coalesce(func.sum(func.length(stored_col)), 0),
+                    func.coalesce(func.sum(case((compressed, 0), else_=func.length(stored_col))), 0),
+                    func.coalesce(func.sum(case((compressed, 1), else_=0)), 0),
+                ).where(table.c[column_name].isnot(None))
+            ).one()
+            logical_bytes = int(plain_bytes)
+            for (stored,) in session.execute(select(stored_col).where(compressed)).yield_per(200):
+                logical_bytes += len(decode_text(stored))
+            report["columns"][f"{table.name}.{column_name}"] = {
+                "rows": int(rows),
+                "compressed_rows": int(compressed_rows),
+                "stored_bytes": int(stored_bytes),
+                "logical_bytes": logical_bytes,
+                "bytes_saved": logical_bytes - int(stored_bytes),
+            }
+    finally:
+        session.close()
+    return report
+
+
+def shutdown_db() -> None:
+    """Drain in-process buffers before the worker exits."""
+    global _state_buffer, _usage_queue
+    if _state_buffer is not None:
+        _state_buffer.stop()
+        _state_buffer = None
+    if _usage_queue is not None:
+        _usage_queue.stop()
+        _usage_queue = None
+
+
+# --- Usage events ---
+#
+# log_usage_event() only samples and enqueues; a background thread
+# bulk-inserts the queue into usage_events. created_at is taken at enqueue
+# time so batching does not shift timestamps.
+#
+# USAGE_EVENTS_ASYNC=0 restores the old one-commit-per-event behaviour.
+# USAGE_EVENT_SAMPLING is a comma list of CATEGORY=rate (0..1), with "*" as
+# the default for unlisted categories, e.g. in production:
+#   USAGE_EVENT_SAMPLING="SHIFT_DEBUG_WRITE=0,HISTORY_DEBUG_ORDER_WRITE=0,AUTH_DEBUG_LOGIN=0.1"
+USAGE_EVENTS_ASYNC = os.getenv("USAGE_EVENTS_ASYNC", "1") == "1"
+USAGE_EVENT_QUEUE_MAX = int(os.getenv("USAGE_EVENT_QUEUE_MAX", "10000"))
+USAGE_EVENT_BATCH_SIZE = int(os.getenv("USAGE_EVENT_BATCH_SIZE", "200"))
+USAGE_EVENT_FLUSH_MS = int(os.getenv("USAGE_EVENT_FLUSH_MS", "1000"))
+
+
+def _parse_sampling(spec: str) -> Dict[str, float]:
+    rates: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        name, _, rate = part.partition("=")
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            print(f"[UsageEvents] ignoring bad sampling entry {part!r}")
+    return rates
+
+
+USAGE_EVENT_SAMPLING = _parse_sampling(os.getenv("USAGE_EVENT_SAMPLING", ""))
+
+_usage_queue: Optional[BatchQueue] = None
+_usage_sampled_out: Dict[str, int] = {}
+_usage_sampled_out_lock = threading.Lock()
+
+
+def _usage_event_sampled(category: str) -> bool:
+    rate = USAGE_EVENT_SAMPLING.get(category, USAGE_EVENT_SAMPLING.get("*", 1.0))
+    if rate >= 1.0 or (rate > 0.0 and random.random() < rate):
+        return True
+    # log_usage_event runs on threadpool threads
+    with _usage_sampled_out_lock:
+        _usage_sampled_out[category] = _usage_sampled_out.get(category, 0) + 1
+    return False
+
+
+def _write_usage_events(rows: List[Dict[str, Any]]) -> None:
+    """Insert a batch of events and fold them into usage_rollups in one transaction."""
+    session = get_session()
+    try:
+        if USAGE_ROLLUPS:
+            _lock_usage_rollups(session)
+        session.execute(
+            insert(UsageEvent.__table__),
+            [
                 {
-                    "id": r.id,
-                    "created_at": None if r.created_at is None else r.created_at.isoformat(),
-                    "category": r.category,
-                    "device_id": det.get("device_id"),
-                    "operator_id": det.get("operator_id"),
-                    "detail": det,
+                    "category": r["category"],
+                    "detail": r["detail"],
+                    "created_at": r["created_at"],
+                    "operator_id": r.get("operator_id") or None,
+                    "device_id": r.get("device_id") or None,
                 }
-            )
+                for r in rows
+            ],
+        )
+        if USAGE_ROLLUPS:
+            _bump_usage_rollups(session, _rollup_counts(rows))
+        _note_change(session, "usage", [""])
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def _start_usage_queue() -> None:
+    global _usage_queue
+    if not USAGE_EVENTS_ASYNC or _usage_queue is not None:
+        return
+    _usage_queue = BatchQueue(
+        "usage_events",
+        _write_usage_events,
+        max_size=USAGE_EVENT_QUEUE_MAX,
+        batch_size=USAGE_EVENT_BATCH_SIZE,
+        interval_seconds=USAGE_EVENT_FLUSH_MS / 1000.0,
+    )
+    _usage_queue.start()
+
+
+def get_usage_queue_stats() -> Dict[str, Any]:
+    with _usage_sampled_out_lock:
+        sampled_out = dict(_usage_sampled_out)
+    return {
+        "async": _usage_queue is not None,
+        "sampling": USAGE_EVENT_SAMPLING,
+        "sampled_out": sampled_out,
+        "queue": _usage_queue.stats() if _usage_queue is not None else None,
+    }
+
+
+def log_usage_event(category: str, detail: Optional[Dict[str, Any]] = None) -> None:
+    if engine is None or not _usage_event_sampled(category):
+        return
+    operator_id, device_id = _usage_dimensions(detail)
+    row = {
+        "category": category,
+        "detail": jsoncodec.dumps(detail or {}),
+        "created_at": datetime.now(timezone.utc),
+        "operator_id": operator_id,
+        "device_id": device_id,
+    }
+    if _usage_queue is not None:
+        _usage_queue.put(row)
+        return
+    _write_usage_events([row])
+
+
+def get_recent_usage(
+    limit: int = 100,
+    before_id: Optional[int] = None,
+    after_id: Optional[int] = None,
+    ids: Optional[List[int]] = None,
+    categories: Optional[List[str]] = None,
+    device_id: Optional[str] = None,
+    operator_id: Optional[str] = None,
+    include_detail: bool = True,
+) -> List[Dict[str, Any]]:
+    """
+    Newest-first page of usage events.
+
+    Keyset pagination: pass the last `id` of the previous page as
+    `before_id`; `after_id` returns only events newer than that id and
+    `ids` only those ids (the admin stream's catch-up and late-commit
+    reads). Filters run in SQL on the promoted, indexed
+    category / device_id / operator_id columns. With include_detail=False
+    the `detail` column is not even selected.
+    """
+    if engine is None:
+        return []
+    columns = [UsageEvent.id, UsageEvent.created_at, UsageEvent.category, UsageEvent.device_id, UsageEvent.operator_id]
+    if include_detail:
+        columns.append(UsageEvent.detail)
+    session = get_session()
+    try:
+        q = session.query(*columns)
+        if before_id is not None:
+            q = q.filter(UsageEvent.id < before_id)
+        if after_id is not None:
+            q = q.filter(UsageEvent.id > after_id)
+        if ids is not None:
+            q = q.filter(UsageEvent.id.in_(ids))
+        if categories:
+            q = q.filter(UsageEvent.category.in_(categories))
+        if device_id:
+            q = q.filter(UsageEvent.device_id == device_id)
+        if operator_id:
+            q = q.filter(UsageEvent.operator_id == operator_id)
+        q = q.order_by(UsageEvent.id.desc()).limit(limit)
+
+        results: List[Dict[str, Any]] = []
+        for r in q:
+            item: Dict[str, Any] = {
+                "id": r.id,
+                "created_at": None if r.created_at is None else r.created_at.isoformat(),
+                "category": r.category,
+                "device_id": r.device_id,
+                "operator_id": r.operator_id,
+            }
+            if include_detail:
+                det: Dict[str, Any] = {}
+                if r.detail:
+                    try:
+                        det = jsoncodec.loads(r.detail)
+                    except Exception:
+                        det = {}
+                # Rows logged before the columns were promoted
+                if item["device_id"] is None:
+                    item["device_id"] = det.get("device_id")
+                if item["operator_id"] is None:
+                    item["operator_id"] = det.get("operator_id")
+                item["detail"] = det
+            results.append(item)
         return results
     finally:
         session.close()
 
 
-def get_usage_summary(days: int = 7) -> List[Dict[str, Any]]:
+# --- Usage rollups / summaries ---
+#
+# usage_rollups holds hourly counts per (category, operator, device) and is
+# bumped by _write_usage_events in the same transaction as the raw rows, so
+# summaries are O(buckets) no matter how many events were logged.
+# rebuild_usage_rollups() backfills history from usage_events; init_db runs
+# it once when the table is empty, and POST /api/admin/usage/rollups/rebuild
+# runs it on demand. On Postgres writers hold _USAGE_ROLLUP_LOCK_KEY shared
+# and the rebuild holds it exclusively, so a batch commits either before the
+# rebuild reads (and is counted by it) or after it (and bumps on top).
+# USAGE_ROLLUPS=0 stops maintaining them and summaries fall back to a
+# GROUP BY over usage_events (using ix_usage_events_category_created_at).
+USAGE_ROLLUPS = os.getenv("USAGE_ROLLUPS", "1") == "1"
+
+_ROLLUP_GROUPS = {"operator": "operator_id", "device": "device_id"}
+
+_USAGE_ROLLUP_LOCK_KEY = 0x77717475  # pg advisory lock id ("wqtu")
+
+
+def _lock_usage_rollups(session: Session, exclusive: bool = False) -> None:
+    """Transaction-scoped rollup lock on Postgres; a no-op elsewhere."""
+    if engine.dialect.name != "postgresql":
+        return
+    fn = "pg_advisory_xact_lock" if exclusive else "pg_advisory_xact_lock_shared"
+    session.execute(text(f"SELECT {fn}(:key)"), {"key": _USAGE_ROLLUP_LOCK_KEY})
+
+
+def _backfill_usage_rollups_if_empty() -> None:
+    # First start with rollups enabled: summaries read only from usage_rollups
+    if not USAGE_ROLLUPS:
+        return
+    try:
+        result = rebuild_usage_rollups(only_if_empty=True)
+        if result["buckets"]:
+            print(f"[UsageRollups] backfilled {result['buckets']} buckets from {result['events']} events")
+    except Exception as err:
+        print(f"[UsageRollups] backfill skipped: {err}")
+
+
+def _usage_dimensions(detail: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+    """(operator_id, device_id) of an event detail, '' when absent."""
+    d = detail or {}
+    operator_id = d.get("operator_id") or d.get("logged_in_user") or d.get("username") or ""
+    return str(operator_id), str(d.get("device_id") or "")
+
+
+def _hour_bucket(ts: datetime) -> datetime:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def _rollup_counts(rows: List[Dict[str, Any]]) -> Dict[Tuple[datetime, str, str, str], int]:
+    counts: Dict[Tuple[datetime, str, str, str], int] = {}
+    for r in rows:
+        key = (_hour_bucket(r["created_at"]), r["category"], r.get("operator_id") or "", r.get("device_id") or "")
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _bump_usage_rollups(
+    session: Session,
+    counts: Dict[Tuple[datetime, str, str, str], int],
+    replace: bool = False,
+) -> None:
+    """Add (or with replace=True, set) counts on usage_rollups; caller commits."""
+    if not counts:
+        return
+    table = UsageRollup.__table__
+    values = [
+        {"bucket_start": b, "category": c, "operator_id": o, "device_id": d, "count": n}
+        for (b, c, o, d), n in counts.items()
+    ]
+    insert_fn = _native_upsert_insert()
+    if insert_fn is not None:
+        ins = insert_fn(table)
+        session.execute(
+            ins.on_conflict_do_update(
+                index_elements=[table.c.bucket_start, table.c.category, table.c.operator_id, table.c.device_id],
+                set_={"count": ins.excluded.count if replace else table.c.count + ins.excluded.count},
+            ),
+            values,
+        )
+        return
+    for v in values:
+        existing = (
+            session.query(UsageRollup)
+            .filter(
+                UsageRollup.bucket_start == v["bucket_start"],
+                UsageRollup.category == v["category"],
+                UsageRollup.operator_id == v["operator_id"],
+                UsageRollup.device_id == v["device_id"],
+            )
+            .with_for_update()
+            .first()
+        )
+        if existing is None:
+            session.add(UsageRollup(**v))
+        else:
+            existing.count = v["count"] if replace else existing.count + v["count"]
+
+
+def rebuild_usage_rollups(days: int = 30, only_if_empty: bool = False) -> Dict[str, int]:
+    """
+    Recompute usage_rollups for the last `days` days from usage_events.
+
+    Takes the rollup lock exclusively (Postgres), or deletes first so the
+    write lock is held before reading (SQLite), so batches the live writer
+    commits meanwhile are neither lost nor double counted.
+    `only_if_empty` skips the rebuild when any rollup row exists, checked
+    under the lock so concurrently starting workers backfill once.
+    Reads just (created_at, category, detail) in batches.
+    """
+    if engine is None:
+        return {"events": 0, "buckets": 0}
+    start = _hour_bucket(datetime.now(timezone.utc)) - timedelta(days=days)
+    counts: Dict[Tuple[datetime, str, str, str], int] = {}
+    events = 0
+    session = get_session()
+    try:
+        _lock_usage_rollups(session, exclusive=True)
+        if only_if_empty and session.query(UsageRollup.id).first() is not None:
+            session.rollback()
+            return {"events": 0, "buckets": 0}
+        session.query(UsageRollup).filter(UsageRollup.bucket_start >= start).delete(
+            synchronize_session=False
+        )
+        q = (
+            session.query(UsageEvent.created_at, UsageEvent.category, UsageEvent.detail)
+            .filter(UsageEvent.created_at >= start)
+            .yield_per(1000)
+        )
+        for created_at, category, detail in q:
+            if created_at is None:
+                continue
+            try:
+                det = jsoncodec.loads(detail) if detail else {}
+            except ValueError:
+                det = {}
+            operator_id, device_id = _usage_dimensions(det if isinstance(det, dict) else {})
+            key = (_hour_bucket(created_at), category, operator_id, device_id)
+            counts[key] = counts.get(key, 0) + 1
+            events += 1
+        _bump_usage_rollups(session, counts, replace=True)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return {"events": events, "buckets": len(counts)}
+
+
+def _day_of(column):
+    """SQL expression truncating a timestamp column to its calendar day."""
+    if engine.dialect.name == "postgresql":
+        return func.date_trunc("day", column)
+    return func.date(column)
+
+
+def _day_key(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return str(value)[:10]
+
+
+def get_usage_summary(
+    days: int = 7,
+    category: str = "STATE_SAVE",
+    group_by: Optional[str] = None,
+    limit: int = 50,
+) -> Dict[str, Any]:
+    """
+    Daily event counts for the last `days` days.
+
+    Returns {"series": [{date, count}, ...]} and, with group_by="operator"
+    or "device", also {"groups": [{key, total, series}, ...]} for the top
+    `limit` keys by total. Grouping needs the rollups (USAGE_ROLLUPS=1).
+    """
     if engine is None:
-        return []
+        return {"series": []}
+    if group_by is not None and group_by not in _ROLLUP_GROUPS:
+        raise ValueError(f"group_by must be one of {sorted(_ROLLUP_GROUPS)}")
     now = datetime.now(timezone.utc)
+    dates = [(now - timedelta(days=days - 1 - i)).date().isoformat() for i in range(days)]
     cutoff = now - timedelta(days=days)
+
     session = get_session()
     try:
-        q = (
-            session.query(UsageEvent)
-            .filter(UsageEvent.category == "STATE_SAVE")
-            .filter(UsageEvent.created_at >= cutoff)
-            .order_by(UsageEvent.created_at.asc())
-        )
-        counts: Dict[str, int] = {}
-        for evt in q:
-            if not evt.created_at:
-                continue
-            d = evt.created_at.date().isoformat()
-            counts[d] = counts.get(d, 0) + 1
+        if USAGE_ROLLUPS:
+            ts_col, count_expr = UsageRollup.bucket_start, func.sum(UsageRollup.count)
+            base_filter = [UsageRollup.category == category, UsageRollup.bucket_start >= _hour_bucket(cutoff)]
+        else:
+            if group_by is not None:
+                raise ValueError("group_by needs USAGE_ROLLUPS=1")
+            ts_col, count_expr = UsageEvent.created_at, func.count(UsageEvent.id)
+            base_filter = [UsageEvent.category == category, UsageEvent.created_at >= cutoff]
+
+        day = _day_of(ts_col).label("day")
+        totals: Dict[str, int] = {}
+        for d, n in session.query(day, count_expr).filter(*base_filter).group_by(day):
+            totals[_day_key(d)] = totals.get(_day_key(d), 0) + int(n or 0)
+        result: Dict[str, Any] = {
+            "series": [{"date": d, "count": totals.get(d, 0)} for d in dates],
+        }
 
-        # Return list of {date, count}
-        return [
-            {
-                "date": (now - timedelta(days=days - 1 - i)).date().isoformat(),
-                "count": counts.get(
-                    (now - timedelta(days=days - 1 - i)).date().isoformat(), 0
-                ),
-            }
-            for i in range(days)
-        ]
+        if group_by is not None:
+            key_col = getattr(UsageRollup, _ROLLUP_GROUPS[group_by])
+            top = [
+                k
+                for k, _ in session.query(key_col, func.sum(UsageRollup.count).label("total"))
+                .filter(*base_filter)
+                .group_by(key_col)
+                .order_by(func.sum(UsageRollup.count).desc())
+                .limit(limit)
+            ]
+            per_key: Dict[str, Dict[str, int]] = {k: {} for k in top}
+            if top:
+                rows = (
+                    session.query(key_col, day, count_expr)
+                    .filter(*base_filter, key_col.in_(top))
+                    .group_by(key_col, day)
+                )
+                for k, d, n in rows:
+                    bucket = per_key[k]
+                    bucket[_day_key(d)] = bucket.get(_day_key(d), 0) + int(n or 0)
+            result["groups"] = [
+                {
+                    "key": k or None,
+                    "total": sum(per_key[k].values()),
+                    "series": [{"date": d, "count": per_key[k].get(d, 0)} for d in dates],
+                }
+                for k in top
+            ]
+        return result
     finally:
         session.close()
 
@@ -458,33 +1791,108 @@ def send_admin_message(device_id: str, text: str) -> None:
     try:
         msg = AdminMessage(device_id=device_id, message_text=text)
         session.add(msg)
+        _note_change(session, "message", [device_id])
         session.commit()
     finally:
         session.close()
 
 
-def pop_admin_messages(device_id: str) -> List[str]:
+def resolve_broadcast_devices(
+    session: Session,
+    site: Optional[str] = None,
+    zone: Optional[str] = None,
+    role: Optional[str] = None,
+) -> List[str]:
     """
-    Fetch unread messages for a device and mark them as read immediately.
-    Returns a list of message strings.
+    Device ids of operators on an open shift, narrowed by site, zone
+    (zone_id or zone_label) and role. The role is the account's users.role,
+    never the client-reported operator_role in the live-status projection.
+    A shift without a device_id falls back to the devices the operator last
+    saved state from.
+    """
+    live = DeviceLiveStatus.__table__
+    device_col = func.coalesce(ShiftSession.device_id, live.c.device_id)
+    q = (
+        select(device_col)
+        .select_from(ShiftSession)
+        .outerjoin(live, live.c.operator_id == ShiftSession.operator_id)
+        .where(ShiftSession.ended_at.is_(None), device_col.isnot(None))
+        .distinct()
+    )
+    if site:
+        q = q.where(ShiftSession.site == site)
+    if zone:
+        q = q.where(or_(ShiftSession.zone_id == zone, ShiftSession.zone_label == zone))
+    if role:
+        q = q.join(User, User.username == ShiftSession.operator_id).where(User.role == role)
+    return sorted(session.execute(q).scalars())
+
+
+def broadcast_admin_message(
+    text: str,
+    site: Optional[str] = None,
+    zone: Optional[str] = None,
+    role: Optional[str] = None,
+) -> List[str]:
+    """
+    Send one message to every active device matching site/zone/role.
+
+    Targets are resolved and all rows written with a single multi-row
+    INSERT in one transaction; returns the device ids it was sent to.
     """
+    if not (site or zone or role):
+        raise ValueError("broadcast needs at least one of site, zone or role")
     if engine is None:
         return []
     session = get_session()
     try:
-        msgs = (
-            session.query(AdminMessage)
-            .filter(AdminMessage.device_id == device_id, AdminMessage.read_at == None)
-            .all()
+        device_ids = resolve_broadcast_devices(session, site=site, zone=zone, role=role)
+        if not device_ids:
+            return []
+        session.execute(
+            insert(AdminMessage).values([{"device_id": d, "message_text": text} for d in device_ids])
         )
+        _note_change(session, "message", device_ids)
+        session.commit()
+        return device_ids
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
 
-        results: List[str] = []
-        for m in msgs:
-            results.append(m.message_text)
-            m.read_at = datetime.now(timezone.utc)
+def pop_admin_messages(device_id: str) -> List[str]:
+    """
+    Fetch unread messages for a device and mark them as read immediately.
+    Returns a list of message strings, oldest first.
 
+    One UPDATE ... RETURNING claims the rows, so two concurrent pops never
+    both deliver the same message; with nothing unread it is a single probe
+    of the partial ix_admin_messages_unread index.
+    """
+    if engine is None:
+        return []
+    session = get_session()
+    try:
+        unread = (AdminMessage.device_id == device_id, AdminMessage.read_at.is_(None))
+        if engine.dialect.update_returning:
+            rows = session.execute(
+                update(AdminMessage)
+                .where(*unread)
+                .values(read_at=datetime.now(timezone.utc))
+                .returning(AdminMessage.id, AdminMessage.message_text)
+            ).all()
+        else:
+            msgs = session.query(AdminMessage).filter(*unread).with_for_update().all()
+            rows = [(m.id, m.message_text) for m in msgs]
+            for m in msgs:
+                m.read_at = datetime.now(timezone.utc)
+        if not rows:
+            session.rollback()
+            return []
         session.commit()
-        return results
+        return [message_text for _, message_text in sorted(rows)]
     finally:
         session.close()
 
@@ -948,40 +2356,84 @@ def _compute_active_minutes_from_pick(pick: Dict[str, Any]) -> int:
         return 0
 
 
+def _pick_key(name: Any, start: Any, close: Any) -> Tuple[str, str, str]:
+    return (str(name or ""), str(start or ""), str(close or ""))
+
+
 def _compute_shift_stats(
+    session: Session,
+    shift: ShiftSession,
     summary: Optional[Dict[str, Any]],
-    started_at: Optional[datetime],
     ended_at: datetime,
     provided_total_units: Optional[int],
     provided_avg_rate: Optional[float],
 ) -> Dict[str, Any]:
+    """
+    Totals for a closing shift, from the orders recorded during it.
+
+    One aggregate over `orders` (linked by shift_id, or for rows recorded
+    before that link existed, by operator and the shift's time window).
+    Picks in the client `summary` that have no matching order row (closed
+    orders that never synced) are added on top. As before, totals the
+    client sends take precedence; the computed ones fill the gaps.
+    """
+    order_filter = or_(
+        OrderRecord.shift_id == shift.id,
+        and_(
+            OrderRecord.shift_id.is_(None),
+            OrderRecord.operator_id == shift.operator_id,
+            OrderRecord.created_at >= shift.started_at,
+            OrderRecord.created_at <= ended_at,
+        ),
+    )
+    # Rows written before orders.active_min existed (and not backfilled)
+    net_minutes = OrderRecord.duration_min - func.coalesce(OrderRecord.excl_min, 0)
+    row_active = func.coalesce(OrderRecord.active_min, case((net_minutes > 0, net_minutes), else_=0))
+    order_count, units, active = session.execute(
+        select(
+            func.count(OrderRecord.id),
+            func.coalesce(func.sum(OrderRecord.total_units), 0),
+            func.coalesce(func.sum(row_active), 0),
+        ).where(order_filter)
+    ).one()
+    order_count, total_units, active_minutes = int(order_count), int(units), int(active)
+
     summary = summary or {}
     picks = summary.get("picks") if isinstance(summary, dict) else None
-    picks_list = picks if isinstance(picks, list) else []
-
-    total_units = provided_total_units
-    if total_units is None:
-        try:
-            total_units = sum(int(p.get("units") or 0) for p in picks_list)
-        except Exception:
-            total_units = None
+    picks_list = [p for p in picks if isinstance(p, dict)] if isinstance(picks, list) else []
+    if picks_list:
+        # Count only the picks that never reached /api/orders/record
+        synced: Dict[Tuple[str, str, str], int] = {}
+        if order_count:
+            for row in session.execute(
+                select(OrderRecord.order_name, OrderRecord.start_hhmm, OrderRecord.close_hhmm).where(order_filter)
+            ):
+                key = _pick_key(*row)
+                synced[key] = synced.get(key, 0) + 1
+        for p in picks_list:
+            key = _pick_key(p.get("name"), p.get("start"), p.get("close") or p.get("closed"))
+            if synced.get(key):
+                synced[key] -= 1
+                continue
+            try:
+                total_units += int(p.get("units") or 0)
+            except (TypeError, ValueError):
+                pass
+            active_minutes += _compute_active_minutes_from_pick(p)
+            order_count += 1
 
-    active_minutes = None
-    try:
-        active_minutes = sum(_compute_active_minutes_from_pick(p) for p in picks_list)
-    except Exception:
-        active_minutes = None
+    if provided_total_units is not None:
+        total_units = provided_total_units
 
     duration_minutes = None
     try:
-        if started_at:
-            duration = ended_at - started_at
-            duration_minutes = int(duration.total_seconds() / 60)
+        if shift.started_at:
+            duration_minutes = int((_as_utc(ended_at) - _as_utc(shift.started_at)).total_seconds() / 60)
     except Exception:
         duration_minutes = None
 
     avg_rate = provided_avg_rate
-    if avg_rate is None and active_minutes and active_minutes > 0 and total_units is not None:
+    if avg_rate is None and active_minutes > 0:
         avg_rate = float(total_units) / (active_minutes / 60.0)
 
     return {
@@ -989,6 +2441,7 @@ def _compute_shift_stats(
         "active_minutes": active_minutes,
         "duration_minutes": duration_minutes,
         "avg_rate": avg_rate,
+        "order_count": order_count,
     }
 
 
@@ -1008,6 +2461,7 @@ def serialize_shift_session(shift: ShiftSession) -> Dict[str, Any]:
         "avg_rate": shift.avg_rate,
         "duration_minutes": shift.duration_minutes,
         "active_minutes": shift.active_minutes,
+        "order_count": shift.order_count,
         "zone_green_seconds": shift.zone_green_seconds,
         "zone_amber_seconds": shift.zone_amber_seconds,
         "zone_red_seconds": shift.zone_red_seconds,
@@ -1018,20 +2472,66 @@ def serialize_shift_session(shift: ShiftSession) -> Dict[str, Any]:
     }
 
 
+# --- Active-shift cache ---
+#
+# get_active_shift_for_operator() is hit on every app boot; the answer only
+# changes on start_shift / end_shift. Both refresh or drop this worker's
+# entry after commit and record a "shift" change, so other workers drop
+# theirs via the change relay. "No open shift" is cached too (as False).
+# The TTL bounds staleness if a notification is ever missed.
+ACTIVE_SHIFT_CACHE_TTL_S = float(os.getenv("ACTIVE_SHIFT_CACHE_TTL_S", "300"))
+ACTIVE_SHIFT_CACHE_MAX_ENTRIES = int(os.getenv("ACTIVE_SHIFT_CACHE_MAX_ENTRIES", "4096"))
+_active_shift_cache = TTLCache(
+    "active_shifts", max_entries=ACTIVE_SHIFT_CACHE_MAX_ENTRIES, ttl_seconds=ACTIVE_SHIFT_CACHE_TTL_S
+)
+
+
+def _reset_active_shift(operator_id: str, shift: Optional[Dict[str, Any]] = None) -> None:
+    # Both stamp the key, so a lookup that raced this start/end does not
+    # cache what it read before the change committed
+    if shift is None:
+        _active_shift_cache.invalidate(operator_id)
+    else:
+        _active_shift_cache.set(operator_id, shift)
+
+
+def _on_shift_change(kind: str, keys: List[str]) -> None:
+    if kind == "shift":
+        for operator_id in keys:
+            _reset_active_shift(operator_id)
+
+
+add_change_listener(_on_shift_change)
+
+
+def get_active_shift_cache_stats() -> Dict[str, Any]:
+    return _active_shift_cache.stats()
+
+
+def _open_shift_query(session: Session, operator_id: str):
+    # Served by uq_shift_sessions_open_operator
+    return (
+        session.query(ShiftSession)
+        .filter(ShiftSession.operator_id == operator_id, ShiftSession.ended_at.is_(None))
+        .order_by(ShiftSession.started_at.desc())
+    )
+
+
 def get_active_shift_for_operator(operator_id: str) -> Optional[Dict[str, Any]]:
     if engine is None:
         return None
+    cached = _active_shift_cache.get(operator_id)
+    if cached is not None:
+        return dict(cached) if cached else None
+    token = _active_shift_cache.fill_token()
     session = get_session()
     try:
-        shift = (
-            session.query(ShiftSession)
-            .filter(ShiftSession.operator_id == operator_id, ShiftSession.ended_at.is_(None))
-            .order_by(ShiftSession.started_at.desc())
-            .first()
-        )
-        return serialize_shift_session(shift) if shift else None
+        shift = _open_shift_query(session, operator_id).first()
+        result = serialize_shift_session(shift) if shift else None
     finally:
         session.close()
+    _active_shift_cache.set_if_unchanged(operator_id, result or False, token)
+    return dict(result) if result else None
 
 
 def start_shift(
@@ -1041,52 +2541,86 @@ def start_shift(
     site: Optional[str] = None,
     shift_type: Optional[str] = None,
 ) -> int:
+    """
+    Open a shift for operator_id, or return the one already open.
+
+    Idempotent under retries and parallel calls: uq_shift_sessions_open_operator
+    allows one open shift per operator, and on Postgres/SQLite a single
+    INSERT ... ON CONFLICT DO UPDATE ... RETURNING either creates the row or
+    returns the open one (filling in device/name/site/type it was missing).
+    """
     if engine is None:
         return 0
     now = datetime.now(timezone.utc)
     scheduled_start_at = now.replace(minute=0, second=0, microsecond=0)
+    fills = {"device_id": device_id, "operator_name": operator_name, "site": site, "shift_type": shift_type}
+    insert_fn = _native_upsert_insert()
     session = get_session()
     try:
-        existing = (
-            session.query(ShiftSession)
-            .filter(ShiftSession.operator_id == operator_id, ShiftSession.ended_at.is_(None))
-            .order_by(ShiftSession.started_at.desc())
-            .first()
-        )
-        if existing:
-            updated = False
-            if device_id and not existing.device_id:
-                existing.device_id = device_id
-                updated = True
-            if operator_name and not existing.operator_name:
-                existing.operator_name = operator_name
-                updated = True
-            if shift_type and not existing.shift_type:
-                existing.shift_type = shift_type
-                updated = True
-            if site and not existing.site:
-                existing.site = site
-                updated = True
-            if updated:
-                session.commit()
-            return existing.id or 0
+        if insert_fn is not None:
+            stmt = insert_fn(ShiftSession).values(
+                operator_id=operator_id,
+                started_at=now,
+                actual_login_at=now,
+                scheduled_start_at=scheduled_start_at,
+                state_version=0,
+                **fills,
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ShiftSession.operator_id],
+                index_where=ShiftSession.ended_at.is_(None),
+                # Keep what the open shift already has; only fill blanks
+                set_={
+                    name: func.coalesce(ShiftSession.__table__.c[name], stmt.excluded[name])
+                    for name, value in fills.items()
+                    if value
+                } or {"operator_id": stmt.excluded.operator_id},
+            )
+            shift = session.scalars(
+                stmt.returning(ShiftSession), execution_options={"populate_existing": True}
+            ).one()
+        else:
+            shift = _start_shift_portable(session, operator_id, fills, now, scheduled_start_at)
+        _note_change(session, "shift", [operator_id])
+        # Serialise before commit expires the row (no reload round trip)
+        result = serialize_shift_session(shift)
+        session.commit()
+        _reset_active_shift(operator_id, result)
+        return result["id"] or 0
+    finally:
+        session.close()
+
 
+def _start_shift_portable(
+    session: Session,
+    operator_id: str,
+    fills: Dict[str, Optional[str]],
+    now: datetime,
+    scheduled_start_at: datetime,
+) -> ShiftSession:
+    # Engines without ON CONFLICT: look, insert, and on a unique violation
+    # (a parallel start won) re-read the row that won.
+    for _ in range(2):
+        existing = _open_shift_query(session, operator_id).first()
+        if existing:
+            for name, value in fills.items():
+                if value and not getattr(existing, name):
+                    setattr(existing, name, value)
+            return existing
         shift = ShiftSession(
             operator_id=operator_id,
-            device_id=device_id,
-            operator_name=operator_name,
-            site=site,
-            shift_type=shift_type,
             started_at=now,
             actual_login_at=now,
             scheduled_start_at=scheduled_start_at,
+            **fills,
         )
         session.add(shift)
-        session.commit()
-        session.refresh(shift)
-        return shift.id if shift.id is not None else 0
-    finally:
-        session.close()
+        try:
+            session.flush()
+            return shift
+        except IntegrityError:
+            session.rollback()
+    raise RuntimeError(f"could not open or find a shift for {operator_id}")
 
 
 def end_shift(
@@ -1106,12 +2640,7 @@ def end_shift(
         if shift_id:
             target = session.get(ShiftSession, shift_id)
         if target is None:
-            target = (
-                session.query(ShiftSession)
-                .filter(ShiftSession.operator_id == operator_id, ShiftSession.ended_at.is_(None))
-                .order_by(ShiftSession.started_at.desc())
-                .first()
-            )
+            target = _open_shift_query(session, operator_id).first()
 
         if target is None:
             raise ValueError("No active shift found to close")
@@ -1121,9 +2650,16 @@ def end_shift(
 
         ts_end = ended_at or datetime.now(timezone.utc)
 
-        stats = _compute_shift_stats(summary, target.started_at, ts_end, total_units, avg_rate)
+        stats = _compute_shift_stats(session, target, summary, ts_end, total_units, avg_rate)
 
         target.ended_at = ts_end
+        # Close the open zone interval at the end of the shift
+        if target.zone_last in _ZONE_COLUMNS and target.zone_last_at is not None:
+            open_seconds = int((_as_utc(ts_end) - _as_utc(target.zone_last_at)).total_seconds())
+            if open_seconds > 0:
+                column_name = _ZONE_COLUMNS[target.zone_last]
+                setattr(target, column_name, (getattr(target, column_name) or 0) + open_seconds)
+                target.zone_last_at = ts_end
         if stats.get("total_units") is not None:
             target.total_units = stats["total_units"]
         if stats.get("avg_rate") is not None:
@@ -1132,54 +2668,554 @@ def end_shift(
             target.duration_minutes = stats["duration_minutes"]
         if stats.get("active_minutes") is not None:
             target.active_minutes = stats["active_minutes"]
+        target.order_count = stats["order_count"]
         if summary is not None:
             try:
-                target.summary_json = json.dumps(summary)
+                target.summary_json = jsoncodec.dumps(summary)
             except Exception:
                 target.summary_json = None
 
+        _note_change(session, "shift", [operator_id])
         session.commit()
+        _reset_active_shift(operator_id)
         session.refresh(target)
         return serialize_shift_session(target)
     finally:
         session.close()
 
 
-def get_recent_shifts(limit: int = 50, operator_id: Optional[str] = None) -> List[Dict[str, Any]]:
+# --- Shift state (PATCH /api/shift/{id}/state) ---
+
+# Fields a device may patch on its shift; anything else in the body is ignored.
+SHIFT_STATE_FIELDS = ("active_order_snapshot", "operator_name", "site", "shift_type", "zone_id", "zone_label")
+
+
+class ShiftNotFound(LookupError):
+    """No shift_sessions row has the requested id."""
+
+
+class ShiftStateConflict(Exception):
+    """A shift state patch lost the compare-and-swap or was refused."""
+
+    def __init__(self, detail: str, server_state: Dict[str, Any]) -> None:
+        super().__init__(detail)
+        self.detail = detail
+        self.server_state = server_state
+
+
+def _shift_state(row: Any) -> Dict[str, Any]:
+    return {
+        "state_version": row.state_version or 0,
+        "active_order_snapshot": jsoncodec.loads(row.active_order_snapshot or "{}"),
+        "shift_id": row.id,
+    }
+
+
+def get_shift_state(shift_id: int) -> Optional[Dict[str, Any]]:
+    """state_version + active_order_snapshot for one shift, or None if it does not exist."""
+    if engine is None:
+        return None
+    session = get_session()
+    try:
+        row = session.execute(
+            select(ShiftSession.id, ShiftSession.state_version, ShiftSession.active_order_snapshot)
+            .where(ShiftSession.id == shift_id)
+        ).first()
+        return _shift_state(row) if row else None
+    finally:
+        session.close()
+
+
+def patch_shift_state(
+    shift_id: int,
+    fields: Dict[str, Any],
+    base_version: Optional[int] = None,
+    explicit_clear_active_order: bool = False,
+) -> Dict[str, Any]:
+    """
+    Field-level merge of `fields` into a shift as one compare-and-swap.
+
+    Only SHIFT_STATE_FIELDS present in `fields` are written; absent fields
+    keep their stored value. With base_version set, the UPDATE only matches
+    while state_version still equals it, so of two concurrent patches from
+    the same base exactly one wins. Clearing an existing active order needs
+    explicit_clear_active_order. Returns the new state_version and the
+    fields applied; raises ShiftNotFound if the shift does not exist and
+    ShiftStateConflict (with the server state) when the patch is refused.
+    """
+    if engine is None:
+        raise ValueError("Database not initialised")
+    values: Dict[str, Any] = {}
+    for name in SHIFT_STATE_FIELDS:
+        if name in fields:
+            values[name] = fields[name]
+    clearing = "active_order_snapshot" in values and not values["active_order_snapshot"]
+    if "active_order_snapshot" in values:
+        values["active_order_snapshot"] = jsoncodec.dumps(values["active_order_snapshot"]) if not clearing else None
+
+    conditions = [ShiftSession.id == shift_id]
+    if base_version is not None:
+        conditions.append(func.coalesce(ShiftSession.state_version, 0) == base_version)
+    if clearing and not explicit_clear_active_order:
+        conditions.append(ShiftSession.active_order_snapshot.is_(None))
+
+    stmt = (
+        update(ShiftSession)
+        .where(*conditions)
+        .values(state_version=func.coalesce(ShiftSession.state_version, 0) + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    session = get_session()
+    try:
+        if engine.dialect.update_returning:
+            row = session.execute(stmt.returning(ShiftSession.state_version, ShiftSession.operator_id)).first()
+        else:
+            row = None
+            if session.execute(stmt).rowcount:
+                row = session.execute(
+                    select(ShiftSession.state_version, ShiftSession.operator_id).where(ShiftSession.id == shift_id)
+                ).first()
+        if row is None:
+            session.rollback()
+            current = session.execute(
+                select(ShiftSession.id, ShiftSession.state_version, ShiftSession.active_order_snapshot)
+                .where(ShiftSession.id == shift_id)
+            ).first()
+            if current is None:
+                raise ShiftNotFound(shift_id)
+            server_state = _shift_state(current)
+            if base_version is not None and server_state["state_version"] != base_version:
+                raise ShiftStateConflict("Version conflict", server_state)
+            raise ShiftStateConflict("Blocked destructive clear", server_state)
+        new_version, operator_id = row
+        _note_change(session, "shift", [operator_id])
+        session.commit()
+    finally:
+        session.close()
+    _reset_active_shift(operator_id)
+    return {"state_version": new_version, "applied": sorted(values)}
+
+
+# --- Zone time accounting ---
+#
+# The client reports performance-zone changes (green / amber / red) as they
+# happen. Each report closes the interval since zone_last_at into the
+# zone_last bucket and opens a new one, so zone_*_seconds always hold the
+# totals up to zone_last_at; end_shift closes the final interval.
+
+SHIFT_ZONES = ("green", "amber", "red")
+_ZONE_COLUMNS = {zone: f"zone_{zone}_seconds" for zone in SHIFT_ZONES}
+_ZONE_RETURNING = (
+    ShiftSession.id,
+    *(getattr(ShiftSession, c) for c in _ZONE_COLUMNS.values()),
+    ShiftSession.zone_last,
+    ShiftSession.zone_last_at,
+)
+
+
+def _seconds_since(column, value: datetime):
+    """SQL expression: whole seconds from `column` to the bound timestamp `value`."""
+    bound = literal(value, DateTime(timezone=True))
+    if engine.dialect.name == "postgresql":
+        return func.cast(func.round(func.extract("epoch", bound - column)), Integer)
+    return func.cast(func.round((func.julianday(bound) - func.julianday(column)) * 86400), Integer)
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def _zone_totals(row: Any) -> Dict[str, Any]:
+    totals = {f"{zone}_seconds": int(getattr(row, _ZONE_COLUMNS[zone]) or 0) for zone in SHIFT_ZONES}
+    return {
+        "shift_id": row.id,
+        **totals,
+        "zone_last": row.zone_last,
+        "zone_last_at": row.zone_last_at.isoformat() if row.zone_last_at else None,
+    }
+
+
+def record_zone_transitions(
+    shift_id: int,
+    operator_id: str,
+    transitions: List[Tuple[str, Optional[datetime]]],
+) -> Dict[str, Any]:
+    """
+    Apply (zone, at) changes to an open shift; a live change is a batch of one.
+
+    Intervals between transitions in the batch are summed here; the gap from
+    the stored zone_last_at to the first transition is computed in SQL, so a
+    whole batch (e.g. offline replay) is one UPDATE ... RETURNING. Transitions
+    older than zone_last_at were already counted and are skipped. Raises
+    ValueError for an unknown zone or a shift that is not this operator's
+    open shift; returns the zone totals.
+    """
+    if engine is None:
+        raise ValueError("Database not initialised")
+    now = datetime.now(timezone.utc)
+    events = []
+    for zone, at in transitions:
+        if zone not in _ZONE_COLUMNS:
+            raise ValueError(f"Unknown zone {zone!r}; expected one of {', '.join(SHIFT_ZONES)}")
+        events.append((min(_as_utc(at), now) if at else now, zone))
+    events.sort()
+
+    session = get_session()
+    try:
+        for _ in range(2):
+            if not events:
+                break
+            stmt = _zone_update(shift_id, operator_id, events)
+            if engine.dialect.update_returning:
+                row = session.execute(stmt.returning(*_ZONE_RETURNING)).first()
+            else:
+                row = session.get(ShiftSession, shift_id) if session.execute(stmt).rowcount else None
+            if row is not None:
+                _note_change(session, "shift", [operator_id])
+                session.commit()
+                _reset_active_shift(operator_id)
+                return _zone_totals(row)
+            session.rollback()
+            current = session.get(ShiftSession, shift_id)
+            if current is None or current.operator_id != operator_id or current.ended_at is not None:
+                raise ValueError("No open shift with this id for operator")
+            # Some transitions predate what is stored; drop them and retry
+            stored_at = _as_utc(current.zone_last_at) if current.zone_last_at else None
+            events = [e for e in events if stored_at is None or e[0] >= stored_at]
+        current = session.get(ShiftSession, shift_id)
+        if current is None or current.operator_id != operator_id:
+            raise ValueError("No open shift with this id for operator")
+        return _zone_totals(current)
+    finally:
+        session.close()
+
+
+def _zone_update(shift_id: int, operator_id: str, events: List[Tuple[datetime, str]]):
+    first_at = events[0][0]
+    last_at, last_zone = events[-1]
+    # Seconds between consecutive transitions, known without the stored row
+    within: Dict[str, int] = {zone: 0 for zone in SHIFT_ZONES}
+    for (at, zone), (next_at, _) in zip(events, events[1:]):
+        within[zone] += int((next_at - at).total_seconds())
+
+    table = ShiftSession.__table__
+    gap = _seconds_since(table.c.zone_last_at, first_at)
+    values: Dict[str, Any] = {"zone_last": last_zone, "zone_last_at": last_at}
+    for zone, column_name in _ZONE_COLUMNS.items():
+        column = table.c[column_name]
+        values[column_name] = (
+            func.coalesce(column, 0)
+            + within[zone]
+            + case(
+                (and_(table.c.zone_last == zone, table.c.zone_last_at.isnot(None)), gap),
+                else_=0,
+            )
+        )
+    return (
+        update(ShiftSession)
+        .where(
+            ShiftSession.id == shift_id,
+            ShiftSession.operator_id == operator_id,
+            ShiftSession.ended_at.is_(None),
+            or_(ShiftSession.zone_last_at.is_(None), ShiftSession.zone_last_at <= first_at),
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+
+# Columns GET /api/shifts/recent may project; the large summary_json and
+# active_order_snapshot blobs are deliberately not among them.
+SHIFT_HISTORY_FIELDS = (
+    "id",
+    "operator_id",
+    "device_id",
+    "operator_name",
+    "site",
+    "shift_type",
+    "started_at",
+    "scheduled_start_at",
+    "actual_login_at",
+    "ended_at",
+    "total_units",
+    "avg_rate",
+    "duration_minutes",
+    "active_minutes",
+    "order_count",
+    "zone_green_seconds",
+    "zone_amber_seconds",
+    "zone_red_seconds",
+    "zone_last",
+    "zone_last_at",
+    "zone_id",
+    "zone_label",
+)
+
+
+_CURSOR_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_shift_cursor(started_at: Optional[str], shift_id: int) -> str:
+    """Opaque `before` cursor for the page after a row: "<started_at epoch µs>.<id>"."""
+    micros = 0
+    if started_at:
+        # Integer arithmetic: a float timestamp can be a microsecond off,
+        # which would skip or repeat rows at a page boundary
+        micros = (_as_utc(datetime.fromisoformat(started_at)) - _CURSOR_EPOCH) // timedelta(microseconds=1)
+    return f"{micros}.{shift_id}"
+
+
+def _decode_shift_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        micros, shift_id = cursor.split(".", 1)
+        started_at = _CURSOR_EPOCH + timedelta(microseconds=int(micros))
+        return started_at, int(shift_id)
+    except ValueError:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+
+
+def get_recent_shifts(
+    limit: int = 50,
+    operator_id: Optional[str] = None,
+    before: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    fields: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Newest-first page of shifts.
+
+    Keyset pagination on (started_at, id): pass encode_shift_cursor() of the
+    last row as `before`. since/until bound started_at. `fields` picks which
+    SHIFT_HISTORY_FIELDS are selected (id and started_at always are, for the
+    cursor); the summary/snapshot blobs are never read.
+    """
     if engine is None:
         return []
+    wanted = list(SHIFT_HISTORY_FIELDS) if not fields else list(fields)
+    unknown = [f for f in wanted if f not in SHIFT_HISTORY_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown shift fields: {', '.join(unknown)}")
+    selected = list(dict.fromkeys(["id", "started_at", *wanted]))
+    table = ShiftSession.__table__
+    q = select(*(table.c[name] for name in selected))
+    if operator_id:
+        q = q.where(table.c.operator_id == operator_id)
+    if since is not None:
+        q = q.where(table.c.started_at >= since)
+    if until is not None:
+        q = q.where(table.c.started_at < until)
+    if before:
+        cursor_at, cursor_id = _decode_shift_cursor(before)
+        q = q.where(tuple_(table.c.started_at, table.c.id) < tuple_(literal(cursor_at, DateTime(timezone=True)), cursor_id))
+    q = q.order_by(table.c.started_at.desc(), table.c.id.desc()).limit(limit)
+
     session = get_session()
     try:
-        q = session.query(ShiftSession)
-        if operator_id:
-            q = q.filter(ShiftSession.operator_id == operator_id)
-        q = q.order_by(ShiftSession.started_at.desc()).limit(limit)
-        return [
-            {
-                "id": s.id,
-                "operator_id": s.operator_id,
-                "device_id": s.device_id,
-                "operator_name": s.operator_name,
-                "site": s.site,
-                "shift_type": s.shift_type,
-                "started_at": s.started_at.isoformat() if s.started_at else None,
-                "scheduled_start_at": s.scheduled_start_at.isoformat() if s.scheduled_start_at else None,
-                "actual_login_at": s.actual_login_at.isoformat() if s.actual_login_at else None,
-                "ended_at": s.ended_at.isoformat() if s.ended_at else None,
-                "total_units": s.total_units,
-                "avg_rate": s.avg_rate,
-                "zone_green_seconds": s.zone_green_seconds,
-                "zone_amber_seconds": s.zone_amber_seconds,
-                "zone_red_seconds": s.zone_red_seconds,
-                "zone_last": s.zone_last,
-                "zone_last_at": s.zone_last_at.isoformat() if s.zone_last_at else None,
-                "zone_id": s.zone_id,
-                "zone_label": s.zone_label,
-            }
-            for s in q
-        ]
+        rows = session.execute(q).all()
+    finally:
+        session.close()
+    results: List[Dict[str, Any]] = []
+    for row in rows:
+        item: Dict[str, Any] = {}
+        for name in selected:
+            value = getattr(row, name)
+            item[name] = value.isoformat() if isinstance(value, datetime) else value
+        results.append(item)
+    return results
+
+
+# --- Device live status projection ---
+
+
+def _live_status_row(storage_key: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Derive the device_live_status columns from a (normalised) state payload."""
+    current = payload.get("current") if isinstance(payload.get("current"), dict) else {}
+
+    def _int(value: Any) -> Optional[int]:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    # Same precedence as the admin save summary: latest wrap, then current
+    wraps = payload.get("tempWraps") or current.get("wraps") or (current.get("log") or {}).get("wraps") or []
+    latest = wraps[-1] if wraps and isinstance(wraps[-1], dict) else {}
+    done = _int(latest.get("done")) or _int(current.get("done"))
+    left = _int(latest.get("left")) or _int(current.get("left"))
+    total = _int(latest.get("total")) or _int(current.get("total") or current.get("units"))
+    if total is not None and done is not None and left is None:
+        left = max(total - done, 0)
+
+    try:
+        live_rate = float(current["liveRate"]) if current.get("liveRate") is not None else None
+    except (TypeError, ValueError):
+        live_rate = None
+    active_break = current.get("active_break")
+
+    operator_id = current.get("operator_id")
+    operator_name = current.get("operator_name")
+    return {
+        "storage_key": storage_key,
+        "device_id": current.get("device_id"),
+        "logical_key": str(operator_id or operator_name or storage_key),
+        "operator_id": operator_id,
+        "operator_name": operator_name,
+        "operator_role": current.get("operator_role"),
+        "order_name": current.get("name") or current.get("order_name"),
+        "units_done": done,
+        "units_left": left,
+        "units_total": total,
+        "locations": _int(current.get("locations")),
+        "live_rate": live_rate,
+        "active_break": jsoncodec.dumps(active_break) if isinstance(active_break, dict) else None,
+        "saved_at": payload.get("savedAt"),
+    }
+
+
+def _upsert_live_status(session: Session, rows: List[Dict[str, Any]]) -> None:
+    """Write device_live_status rows inside the caller's transaction."""
+    if not rows:
+        return
+    _note_change(session, "device", [r["storage_key"] for r in rows])
+    table = DeviceLiveStatus.__table__
+    insert_fn = _native_upsert_insert()
+    if insert_fn is not None:
+        ins = insert_fn(table)
+        session.execute(
+            ins.on_conflict_do_update(
+                index_elements=[table.c.storage_key],
+                set_={
+                    **{c: ins.excluded[c] for c in rows[0] if c != "storage_key"},
+                    "updated_at": func.now(),
+                },
+            ),
+            rows,
+        )
+        return
+    for r in rows:
+        session.merge(DeviceLiveStatus(**r))
+
+
+def _touch_live_status(session: Session, storage_key: str, saved_at: Optional[str]) -> None:
+    """
+    Heartbeat for a save that changed nothing: only saved_at (and
+    updated_at) move, so the live floor does not show the device as stale.
+    """
+    table = DeviceLiveStatus.__table__
+    session.execute(
+        update(table).where(table.c.storage_key == storage_key).values(saved_at=saved_at, updated_at=func.now())
+    )
+    _note_change(session, "device", [storage_key])
+
+
+def rebuild_device_live_status() -> int:
+    """Backfill device_live_status from device_states (one blob parse per row)."""
+    if engine is None:
+        return 0
+    count = 0
+    session = get_session()
+    try:
+        q = session.query(DeviceState.device_id, DeviceState.payload, DeviceState.version).yield_per(100)
+        batch: List[Dict[str, Any]] = []
+        for storage_key, payload_text, version in q:
+            try:
+                payload = jsoncodec.loads(payload_text) or {}
+            except ValueError:
+                continue
+            batch.append({**_live_status_row(storage_key, payload), "version": int(version or 0)})
+        _upsert_live_status(session, batch)
+        session.commit()
+        count = len(batch)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    return count
+
+
+def _saved_at_ts(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def get_device_live_status(storage_keys: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Live-floor list for the admin dashboard, one entry per logical user
+    (newest savedAt wins), read from device_live_status only.
+
+    Entries keep the shape super.html already reads from full states:
+    device_id (the storage key), logical_key, savedAt and a `current`
+    object, plus the projected progress fields. Fetch the full blob per
+    device separately. `storage_keys` limits the read to those rows (the
+    admin stream's incremental updates).
+    """
+    if engine is None:
+        return []
+    session = get_session()
+    try:
+        q = session.query(DeviceLiveStatus)
+        if storage_keys is not None:
+            if not storage_keys:
+                return []
+            q = q.filter(DeviceLiveStatus.storage_key.in_(storage_keys))
+        rows: Dict[str, Dict[str, Any]] = {
+            r.storage_key: {c.name: getattr(r, c.name) for c in DeviceLiveStatus.__table__.c}
+            for r in q
+        }
     finally:
         session.close()
+    # Saves still sitting in the write-behind buffer are newer than the DB
+    if _state_buffer is not None:
+        wanted = None if storage_keys is None else set(storage_keys)
+        for key, buffered in _state_buffer.pending_items().items():
+            if buffered.get("live_status") and (wanted is None or key in wanted):
+                rows[key] = buffered["live_status"]
+
+    latest_by_key: Dict[str, Dict[str, Any]] = {}
+    for row in rows.values():
+        existing = latest_by_key.get(row["logical_key"])
+        if existing is not None:
+            prev_ts, this_ts = _saved_at_ts(existing.get("saved_at")), _saved_at_ts(row.get("saved_at"))
+            if prev_ts and this_ts and this_ts <= prev_ts:
+                continue
+        latest_by_key[row["logical_key"]] = row
+
+    result = []
+    for row in latest_by_key.values():
+        active_break = None
+        if row.get("active_break"):
+            try:
+                active_break = jsoncodec.loads(row["active_break"])
+            except ValueError:
+                active_break = None
+        current = {
+            "device_id": row.get("device_id"),
+            "operator_id": row.get("operator_id"),
+            "operator_name": row.get("operator_name"),
+            "operator_role": row.get("operator_role"),
+            "name": row.get("order_name"),
+            "done": row.get("units_done"),
+            "left": row.get("units_left"),
+            "total": row.get("units_total"),
+            "locations": row.get("locations"),
+            "liveRate": row.get("live_rate"),
+        }
+        if active_break is not None:
+            current["active_break"] = active_break
+        result.append(
+            {
+                "device_id": row["storage_key"],
+                "logical_key": row["logical_key"],
+                "savedAt": row.get("saved_at"),
+                "version": row.get("version"),
+                "current": current,
+            }
+        )
+    return result
 
 
 def get_all_device_states() -> List[Dict[str, Any]]:
@@ -1200,19 +3236,25 @@ def get_all_device_states() -> List[Dict[str, Any]]:
 
     session = get_session()
     try:
-        rows = session.query(DeviceState).all()
+        payload_by_device: Dict[str, str] = {
+            row.device_id: row.payload for row in session.query(DeviceState).all()
+        }
+        # Saves still sitting in the write-behind buffer are newer than the DB
+        if _state_buffer is not None:
+            for key, buffered in _state_buffer.pending_items().items():
+                payload_by_device[key] = buffered["payload"]
 
         # temp map: logical_key -> latest payload
         latest_by_key: Dict[str, Dict[str, Any]] = {}
 
-        for row in rows:
+        for row_device_id, row_payload in payload_by_device.items():
             try:
-                data = json.loads(row.payload) or {}
+                data = jsoncodec.loads(row_payload) or {}
             except Exception:
                 continue
 
             # Attach the DB device_id for UI / messaging
-            data["device_id"] = row.device_id
+            data["device_id"] = row_device_id
 
             current = data.get("current") or {}
 
@@ -1234,7 +3276,7 @@ def get_all_device_states() -> List[Dict[str, Any]]:
             #  - Prefer operator_id (PIN / DB username)
             #  - Else operator_name (Julius / Supervisor Acc)
             #  - Else fall back to raw device_id
-            logical_key = operator_id or operator_name or row.device_id
+            logical_key = operator_id or operator_name or row_device_id
 
             existing = latest_by_key.get(logical_key)
             if existing is not None:
@@ -1378,10 +3420,16 @@ def record_order_from_payload(
     log_json = None
     if "log" in p:
         try:
-            log_json = json.dumps(p.get("log") or {})
+            log_json = jsoncodec.dumps(p.get("log") or {})
         except Exception:
             log_json = None
 
+    # Same active-minutes rule end_shift used to apply to every pick
+    active_min = _compute_active_minutes_from_pick(p) if duration_min is not None else None
+    # Link to the open shift (served from the active-shift cache)
+    open_shift = get_active_shift_for_operator(operator_id)
+    shift_id = open_shift["id"] if open_shift else None
+
     session = get_session()
     try:
         rec = OrderRecord(
@@ -1402,6 +3450,8 @@ def record_order_from_payload(
             early_reason=early_reason,
             notes=combined_notes,
             log_json=log_json,
+            shift_id=shift_id,
+            active_min=active_min,
         )
         session.add(rec)
         session.commit()
@@ -0,0 +1,130 @@
+# wqt-backend/app/event_queue.py
+import collections
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+
+class BatchQueue:
+    """
+    Bounded append-only queue drained in batches by a background thread.
+
+    - `put(item)` never blocks the request: when `max_size` items are already
+      waiting the item is dropped and counted (`dropped_full`).
+    - The flusher calls `flush_fn(items)` with up to `batch_size` items every
+      `interval_seconds`, or straight away once a full batch is waiting.
+    - A failed batch goes back to the front of the queue as far as capacity
+      allows; whatever does not fit is counted as `dropped_error`.
+    - `stop()` drains everything before returning; call it on shutdown.
+
+    Unlike WriteBehindBuffer nothing is coalesced: every item is written.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[List[Any]], None],
+        max_size: int = 10000,
+        batch_size: int = 200,
+        interval_seconds: float = 1.0,
+    ) -> None:
+        self.name = name
+        self._flush_fn = flush_fn
+        self.max_size = max(1, int(max_size))
+        self.batch_size = max(1, int(batch_size))
+        self.interval_seconds = max(0.01, float(interval_seconds))
+        self._items: collections.deque = collections.deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "enqueued": 0,
+            "dropped_full": 0,
+            "dropped_error": 0,
+            "written": 0,
+            "batches": 0,
+            "flush_errors": 0,
+            "pressure_wakeups": 0,
+            "max_depth": 0,
+        }
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-flusher", daemon=True)
+        self._thread.start()
+
+    def put(self, item: Any) -> bool:
+        with self._lock:
+            if len(self._items) >= self.max_size:
+                self._stats["dropped_full"] += 1
+                return False
+            self._items.append(item)
+            self._stats["enqueued"] += 1
+            depth = len(self._items)
+            if depth > self._stats["max_depth"]:
+                self._stats["max_depth"] = depth
+            full_batch = depth == self.batch_size
+            if full_batch:
+                self._stats["pressure_wakeups"] += 1
+        if full_batch:
+            self._wake.set()
+        return True
+
+    def flush(self) -> int:
+        """Write out everything queued right now; returns the number of items written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    if not self._items:
+                        return written
+                    n = min(self.batch_size, len(self._items))
+                    batch = [self._items.popleft() for _ in range(n)]
+                try:
+                    self._flush_fn(batch)
+                except Exception:
+                    logging.exception("[BatchQueue:%s] flush of %d items failed", self.name, len(batch))
+                    with self._lock:
+                        self._stats["flush_errors"] += 1
+                        room = max(0, self.max_size - len(self._items))
+                        self._items.extendleft(reversed(batch[:room]))
+                        self._stats["dropped_error"] += len(batch) - min(room, len(batch))
+                    return written
+                with self._lock:
+                    self._stats["batches"] += 1
+                    self._stats["written"] += len(batch)
+                written += len(batch)
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(5.0, self.interval_seconds * 4))
+            self._thread = None
+        # Drain whatever is left (including batches re-queued after an error)
+        for _ in range(3):
+            self.flush()
+            with self._lock:
+                if not self._items:
+                    break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "depth": len(self._items),
+                "max_size": self.max_size,
+                "batch_size": self.batch_size,
+                "interval_seconds": self.interval_seconds,
+                **self._stats,
+            }
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            self.flush()
@@ -0,0 +1,98 @@
+# wqt-backend/app/hashing.py
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# PIN hashing (pbkdf2_sha256) is deliberately slow. Running it inline inside
+# `async def` handlers blocks the event loop for every other request, which is
+# painful at shift change when a whole floor logs in at once.
+#
+# passlib's pbkdf2 goes through hashlib.pbkdf2_hmac, which releases the GIL,
+# so a small thread pool gives real parallelism without process overhead.
+PIN_HASH_WORKERS = int(os.getenv("PIN_HASH_WORKERS", "2"))
+# Jobs allowed in flight (running + queued) before we shed load with a 503.
+PIN_HASH_MAX_PENDING = int(os.getenv("PIN_HASH_MAX_PENDING", "32"))
+PIN_HASH_RETRY_AFTER_SECONDS = int(os.getenv("PIN_HASH_RETRY_AFTER_SECONDS", "2"))
+
+
+class HashPoolBusy(Exception):
+    """Raised when the hashing queue is full; callers should answer 503."""
+
+    def __init__(self, retry_after: int = PIN_HASH_RETRY_AFTER_SECONDS) -> None:
+        super().__init__("PIN hashing queue is full")
+        self.retry_after = retry_after
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+_pending = 0
+_stats = {"submitted": 0, "completed": 0, "rejected": 0, "peak_pending": 0}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, PIN_HASH_WORKERS),
+                thread_name_prefix="pin-hash",
+            )
+        return _executor
+
+
+def _acquire_slot() -> None:
+    global _pending
+    with _lock:
+        if _pending >= PIN_HASH_MAX_PENDING:
+            _stats["rejected"] += 1
+            raise HashPoolBusy()
+        _pending += 1
+        _stats["submitted"] += 1
+        _stats["peak_pending"] = max(_stats["peak_pending"], _pending)
+
+
+def _release_slot() -> None:
+    global _pending
+    with _lock:
+        _pending -= 1
+        _stats["completed"] += 1
+
+
+async def run_pin_hashing(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a hashing-heavy callable (create_user, verify_user, ...) on the
+    dedicated pool and await its result.
+
+    Raises HashPoolBusy immediately, without queueing, when
+    PIN_HASH_MAX_PENDING jobs are already waiting.
+    """
+    executor = _get_executor()
+    _acquire_slot()
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+    finally:
+        _release_slot()
+
+
+def hashing_stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "workers": PIN_HASH_WORKERS,
+            "max_pending": PIN_HASH_MAX_PENDING,
+            "pending": _pending,
+            **_stats,
+        }
+
+
+def shutdown_hashing_pool() -> None:
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
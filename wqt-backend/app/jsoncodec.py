@@ -0,0 +1,96 @@
+# wqt-backend/app/jsoncodec.py
+"""
+One JSON codec for state blobs, event payloads and API responses.
+
+Picks the fastest available backend at import time:
+  orjson  -> msgspec  -> stdlib json
+
+JSON_CODEC=orjson|msgspec|json forces one (falls back to stdlib if the
+requested package is not installed). Everything here speaks plain JSON
+types; callers that used to pass `default=str` to json.dumps get the same
+behaviour for dates / Decimals / UUIDs.
+
+Decode errors are always raised as ValueError, like json.loads.
+"""
+import json
+import logging
+import os
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # optional dependency
+    msgspec = None
+
+
+def _pick_backend() -> str:
+    wanted = os.getenv("JSON_CODEC", "auto").strip().lower()
+    available = {"orjson": orjson is not None, "msgspec": msgspec is not None, "json": True}
+    if wanted in available:
+        if available[wanted]:
+            return wanted
+        logging.warning("[JSONCodec] JSON_CODEC=%s requested but not installed; using stdlib json", wanted)
+        return "json"
+    for name in ("orjson", "msgspec"):
+        if available[name]:
+            return name
+    return "json"
+
+
+JSON_BACKEND = _pick_backend()
+
+if JSON_BACKEND == "msgspec":
+    _msgspec_encoder = msgspec.json.Encoder(enc_hook=str)
+    _msgspec_sorted_encoder = msgspec.json.Encoder(enc_hook=str, order="sorted")
+    _msgspec_decoder = msgspec.json.Decoder()
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False) -> bytes:
+    """Compact UTF-8 JSON bytes."""
+    if JSON_BACKEND == "orjson":
+        option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        try:
+            return orjson.dumps(obj, default=str, option=option)
+        except TypeError:
+            # e.g. integers beyond 64 bits; stdlib handles them
+            pass
+    elif JSON_BACKEND == "msgspec":
+        try:
+            encoder = _msgspec_sorted_encoder if sort_keys else _msgspec_encoder
+            return encoder.encode(obj)
+        except (TypeError, msgspec.EncodeError):
+            pass
+    return json.dumps(
+        obj, sort_keys=sort_keys, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode("utf-8")
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """Compact JSON text, for TEXT columns."""
+    return dumps_bytes(obj, sort_keys=sort_keys).decode("utf-8")
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from str or bytes."""
+    if JSON_BACKEND == "orjson":
+        return orjson.loads(data)
+    if JSON_BACKEND == "msgspec":
+        try:
+            return _msgspec_decoder.decode(data)
+        except msgspec.DecodeError as exc:
+            raise ValueError(str(exc)) from exc
+    return json.loads(data)
+
+
+class CodecJSONResponse(JSONResponse):
+    """JSONResponse rendered with the active codec."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps_bytes(content)
@@ -1,17 +1,24 @@
+import asyncio
 import os
 import uuid
-from typing import Any, Dict, List, Optional
+import hashlib
+from typing import Any, Dict, List, Literal, Optional
 from datetime import datetime, timedelta, timezone
 
-from fastapi import FastAPI, Query, HTTPException, Depends, status, Request
+from fastapi import FastAPI, Query, HTTPException, Depends, status, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.datastructures import Default
 
 from .models import MainState
-import json
+from .state_patch import StatePatchError, apply_json_patch, apply_merge_patch
+from .cache import TTLCache
+from .hashing import HashPoolBusy, run_pin_hashing, hashing_stats, shutdown_hashing_pool
+from . import jsoncodec
+from .jsoncodec import CodecJSONResponse
 
 # -------------------------------------------------------------------
 # CORS
@@ -20,7 +27,10 @@ import json
 import logging
 VERSION = os.getenv("WQT_VERSION", "dev")
 CURRENT_ONBOARDING_VERSION = 1
-app = FastAPI(title="WQT Backend v1")
+# Routes without a response_model render through the shared codec (orjson
+# when installed). Wrapped in Default() so routes that do declare a
+# response_model keep FastAPI's direct pydantic-to-JSON serialisation.
+app = FastAPI(title="WQT Backend v1", default_response_class=Default(CodecJSONResponse))
 
 # --- Route inventory logging (AUDIT_ROUTES=1) ---
 if os.getenv("AUDIT_ROUTES", "0") == "1":
@@ -50,43 +60,59 @@ async def root_head():
 
 def get_shift_state_with_version(shift_id):
     # Fetch shift session and return state_version and active_order_snapshot
-    from .db import get_session, ShiftSession
-    db = get_session()
-    shift = db.query(ShiftSession).filter(ShiftSession.id == shift_id).first()
-    if not shift:
+    from .db import get_shift_state
+    state = get_shift_state(shift_id)
+    if state is None:
         raise HTTPException(status_code=404, detail="Shift not found")
-    return {
-        "state_version": shift.state_version,
-        "active_order_snapshot": json.loads(shift.active_order_snapshot or '{}'),
-        "shift_id": shift.id
-    }
+    return state
+
+# Sync control keys the client sends alongside the patched fields
+_SHIFT_PATCH_CONTROL_KEYS = ("base_version", "explicit_clear_active_order", "request_id", "device_id")
 
 @app.patch("/api/shift/{shift_id}/state")
-async def patch_shift_state(shift_id: int, payload: Dict[str, Any], base_version: int = None, explicit_clear_active_order: bool = False, request_id: str = None, device_id: str = None):
-    from .db import get_session, ShiftSession
-    db = get_session()
-    shift = db.query(ShiftSession).filter(ShiftSession.id == shift_id).first()
-    if not shift:
+def patch_shift_state(shift_id: int, payload: Dict[str, Any], base_version: int = None, explicit_clear_active_order: bool = False, request_id: str = None, device_id: str = None):
+    # Single UPDATE ... WHERE state_version = base (compare-and-swap); runs in the threadpool
+    from .db import patch_shift_state as cas_patch_shift_state, ShiftNotFound, ShiftStateConflict
+    fields = dict(payload)
+    control = {k: fields.pop(k) for k in _SHIFT_PATCH_CONTROL_KEYS if k in fields}
+    # core-state-ui.js sends these in the body; query params still work
+    if base_version is None and control.get("base_version") is not None:
+        try:
+            base_version = int(control["base_version"])
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="base_version must be an integer")
+    explicit_clear_active_order = explicit_clear_active_order or bool(control.get("explicit_clear_active_order"))
+    request_id = request_id or control.get("request_id")
+    device_id = device_id or control.get("device_id")
+    try:
+        result = cas_patch_shift_state(
+            shift_id,
+            fields,
+            base_version=base_version,
+            explicit_clear_active_order=explicit_clear_active_order,
+        )
+    except ShiftNotFound:
         raise HTTPException(status_code=404, detail="Shift not found")
-    # Version check
-    if base_version is not None and base_version != shift.state_version:
-        # Log conflict
-        print(f"[PATCH CONFLICT] request_id={request_id} device_id={device_id} shift_id={shift_id} base_version={base_version} current_version={shift.state_version}")
-        return JSONResponse(status_code=409, content={"detail": "Version conflict", "server_state": get_shift_state_with_version(shift_id)})
-    # Defensive clear guard
-    incoming_order = payload.get("active_order_snapshot")
-    if (shift.active_order_snapshot and not incoming_order) and not explicit_clear_active_order:
-        # Log blocked clear
-        print(f"[PATCH BLOCKED CLEAR] request_id={request_id} device_id={device_id} shift_id={shift_id} - attempted clear without explicit flag")
-        return JSONResponse(status_code=409, content={"detail": "Blocked destructive clear", "server_state": get_shift_state_with_version(shift_id)})
-    # Apply patch
-    if incoming_order is not None:
-        shift.active_order_snapshot = json.dumps(incoming_order)
-    # ...apply other fields as needed...
-    shift.state_version += 1
-    db.commit()
-    return {"ok": True, "state_version": shift.state_version}
-from .storage import load_main, save_main
+    except ShiftStateConflict as exc:
+        # Log conflict / blocked clear
+        print(f"[PATCH CONFLICT] request_id={request_id} device_id={device_id} shift_id={shift_id} base_version={base_version} detail={exc.detail} current_version={exc.server_state['state_version']}")
+        return JSONResponse(status_code=409, content={"detail": exc.detail, "server_state": exc.server_state})
+    return {"ok": True, **result}
+from .admin_stream import admin_stream, stream_events, StreamFull
+from .message_waiters import message_waiters, MESSAGE_WAIT_TIMEOUT_S, WaitersFull
+from .retention import (
+    run_retention,
+    start_retention_job,
+    stop_retention_job,
+    get_retention_stats,
+)
+from .storage import (
+    save_main,
+    load_journaled_state,
+    start_state_journal,
+    shutdown_state_journal,
+    get_state_journal_stats,
+)
 from .db import (
     init_db,
     log_usage_event,
@@ -95,9 +121,14 @@ from .db import (
     start_shift,
     end_shift,
     get_active_shift_for_operator,
+    get_active_shift_cache_stats,
+    record_zone_transitions,
     get_recent_shifts,
+    encode_shift_cursor,
     get_all_device_states,
+    get_device_live_status,
     send_admin_message,
+    broadcast_admin_message,
     pop_admin_messages,
     create_user,
     verify_user,
@@ -105,8 +136,21 @@ from .db import (
     get_user_by_id,
     record_order_from_payload,  # NEW: orders table integration
     get_history_for_operator,   # NEW: fetch archived orders for frontend
-    load_device_state,          # NEW: legacy fallback
+    load_device_state_with_version,
+    load_device_state_text,
+    get_device_state_version,
+    get_state_save_stats,
+    get_state_buffer_stats,
+    shutdown_db,
+    get_compression_report,
+    get_usage_queue_stats,
+    start_change_relay,
+    stop_change_relay,
+    get_change_relay_stats,
+    rebuild_usage_rollups,
+    start_column_reencoder,
     save_device_state,          # NEW: migrate to user key
+    StateVersionConflict,
     User,
     bulk_upsert_locations,
     get_warehouse_aisle_summary,
@@ -159,6 +203,52 @@ def create_access_token(user: User) -> str:
     return token
 
 
+# Identity caches: every authenticated request used to decode the JWT and
+# hit Postgres once or twice. Tokens are cached by their raw string (bounded
+# by the token's own `exp`), users by the token `sub`.
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "2048"))
+_token_cache = TTLCache("auth_tokens", max_entries=AUTH_CACHE_MAX_ENTRIES, ttl_seconds=AUTH_CACHE_TTL_SECONDS)
+_identity_cache = TTLCache("auth_identities", max_entries=AUTH_CACHE_MAX_ENTRIES, ttl_seconds=AUTH_CACHE_TTL_SECONDS)
+
+
+def invalidate_identity_cache(user_id: Optional[int] = None, username: Optional[str] = None) -> None:
+    """Drop cached identities for a user whose row has just changed."""
+    _identity_cache.invalidate_where(
+        lambda key, user: (user_id is not None and (key == str(user_id) or user.id == user_id))
+        or (username is not None and user.username == username)
+    )
+
+
+def _decode_token(token: str) -> TokenPayload:
+    cached = _token_cache.get(token)
+    if cached is not None:
+        return cached
+    try:
+        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+        token_data = TokenPayload(**payload)
+    except JWTError:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    # Never serve a cached token past its own expiry
+    _token_cache.set(token, token_data, ttl=token_data.exp - datetime.now(timezone.utc).timestamp())
+    return token_data
+
+
+async def _run_pin_hashing(fn, *args, **kwargs):
+    """Run PIN hashing off the event loop; shed load with 503 when saturated."""
+    try:
+        return await run_pin_hashing(fn, *args, **kwargs)
+    except HashPoolBusy as exc:
+        logging.warning("[PinHashing] queue full; rejecting request")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Login service busy, please retry",
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+
 def get_current_user(
     credentials: Optional[HTTPAuthorizationCredentials] = Depends(security),
 ) -> User:
@@ -168,16 +258,12 @@ def get_current_user(
             detail="Missing Authorization header",
         )
 
-    token = credentials.credentials
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        token_data = TokenPayload(**payload)
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    except Exception:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload")
+    token_data = _decode_token(credentials.credentials)
+
+    user: Optional[User] = _identity_cache.get(token_data.sub)
+    if user is not None:
+        return user
 
-    user: Optional[User] = None
     # Prefer numeric id from `sub`
     if token_data.sub.isdigit():
         user = get_user_by_id(int(token_data.sub))
@@ -188,6 +274,7 @@ def get_current_user(
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
 
+    _identity_cache.set(token_data.sub, user)
     print(f"AUTH_DEBUG: current_user.id={user.id} username={user.username} role={user.role}")
     return user
 
@@ -231,6 +318,7 @@ async def api_me_update(
         user.onboarding_version = CURRENT_ONBOARDING_VERSION
         user.onboarding_completed_at = datetime.now(timezone.utc)
         session.commit()
+        invalidate_identity_cache(user_id=user.id, username=user.username)
         logging.info(
             "[OnboardingUpdate] user=%s default_shift_hours=%s onboarding_version=%s",
             user.username,
@@ -393,6 +481,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-State-Version", "X-State-Save", "ETag", "X-Next-Cursor"],
 )
 
 def _cors_headers_for_origin(origin: Optional[str]) -> Dict[str, str]:
@@ -423,6 +512,22 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
 @app.on_event("startup")
 async def on_startup() -> None:
     init_db()
+    start_state_journal()
+    start_retention_job()
+    start_change_relay()
+    await admin_stream.start()
+    message_waiters.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    message_waiters.stop()
+    await admin_stream.stop()
+    stop_change_relay()
+    stop_retention_job()
+    shutdown_db()
+    shutdown_state_journal()
+    shutdown_hashing_pool()
 
 
 # -------------------------------------------------------------------
@@ -436,8 +541,36 @@ async def health() -> Dict[str, str]:
 # -------------------------------------------------------------------
 # Main state API (user/device-aware)
 # -------------------------------------------------------------------
+STATE_VERSION_HEADER = "X-State-Version"
+
+# Serve validated state rows straight from the stored JSON text (no parse /
+# re-validate / re-serialise on read). Set to 0 to force the model path.
+STATE_PASSTHROUGH = os.getenv("STATE_PASSTHROUGH", "1") == "1"
+
+
+def _state_etag(storage_key: str, version: int) -> str:
+    # Version alone is only unique per key; mix the key in so a device that
+    # switches users can never get a 304 for someone else's state.
+    key_tag = hashlib.sha1(storage_key.encode("utf-8")).hexdigest()[:10]
+    return f'"{version}-{key_tag}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+def _set_state_version_headers(response: Response, storage_key: str, version: int) -> None:
+    response.headers[STATE_VERSION_HEADER] = str(version)
+    response.headers["ETag"] = _state_etag(storage_key, version)
+
+
 @app.get("/api/state", response_model=MainState)
 async def get_state(
+    request: Request,
+    response: Response,
     device_id: Optional[str] = Query(default=None, alias="device-id"),
     current_user: User = Depends(get_current_user),
 ) -> MainState:
@@ -448,34 +581,85 @@ async def get_state(
       1) Per-user state: device_states.device_id = "user:<PIN>"
       2) Legacy per-device state (device_states.device_id = "<device uuid>"),
          migrated into the user key when found.
-      3) Global / legacy fallback from storage.load_main().
+      3) This user's local journal (storage.load_journaled_state) when
+         Postgres has nothing / is unreachable.
+
+    Honours If-None-Match: when the client already holds the current
+    version we answer 304 after a version-only lookup.
+
+    Rows written by a validated save (payload_validated) are returned as
+    the stored JSON text without going through MainState again; older or
+    unvalidated rows still take the parse + validate path.
     """
     # Build key strictly from authenticated user; do NOT migrate device state into new users
     primary_key: Optional[str] = f"user:{current_user.username}" if current_user else None
 
-    raw: Optional[dict] = None
+    loaded: Optional[tuple] = None
+
+    if primary_key and request.headers.get("if-none-match"):
+        version = get_device_state_version(primary_key)
+        if version is not None:
+            etag = _state_etag(primary_key, version)
+            if _etag_matches(request.headers.get("if-none-match"), etag):
+                return Response(
+                    status_code=status.HTTP_304_NOT_MODIFIED,
+                    headers={"ETag": etag, STATE_VERSION_HEADER: str(version)},
+                )
 
     print(f"AUTH_DEBUG: current_user.id={current_user.username} requesting state")
 
     # Only load per-user payload; avoid legacy device migration to prevent cross-user bleed
     if primary_key:
-        raw = load_device_state(primary_key)
+        stored = load_device_state_text(primary_key)
+        if stored is not None:
+            payload_text, version, validated = stored
+            if validated and STATE_PASSTHROUGH:
+                return Response(
+                    content=payload_text,
+                    media_type="application/json",
+                    headers={
+                        "ETag": _state_etag(primary_key, version),
+                        STATE_VERSION_HEADER: str(version),
+                    },
+                )
+            loaded = (jsoncodec.loads(payload_text), version)
 
-    if raw is not None:
+    if loaded is not None:
+        raw, version = loaded
+        _set_state_version_headers(response, primary_key, version)
         return MainState(**raw)
 
+    journaled = load_journaled_state(primary_key) if primary_key else None
+    if journaled:
+        return MainState(**journaled)
+
     # Fresh user: return an empty state (no history bleed)
     return MainState(version="3.3.55")
 
-@app.post("/api/state", response_model=MainState)
-async def set_state(
-    state: MainState,
-    device_id: Optional[str] = Query(default=None, alias="device-id"),
+
+@app.get("/api/state/version")
+async def get_state_version(
     current_user: User = Depends(get_current_user),
-) -> MainState:
+) -> Dict[str, Any]:
+    """Cheap check for reloads/reconnects: the stored version and ETag only."""
+    storage_key = f"user:{current_user.username}"
+    version = get_device_state_version(storage_key)
+    if version is None:
+        return {"version": None, "etag": None}
+    return {"version": version, "etag": _state_etag(storage_key, version)}
+
+def _persist_state(
+    state: MainState,
+    device_id: Optional[str],
+    current_user: User,
+    expected_version: Optional[int] = None,
+) -> tuple:
     """
-    Save MainState.
+    Shared write path for full (POST) and delta (PATCH) saves.
     Includes fixes for User ID persistence and Live Rate calculation.
+    Returns (version, written, document); unchanged saves are not written
+    or logged. `document` is the normalised state as stored, for the client
+    to use as its delta base.
     """
 
     # 1) Determine storage key (User > Device) and capture raw device for display
@@ -525,7 +709,9 @@ async def set_state(
             pass
 
     # Save to DB
-    save_main(state, device_id=target_id)
+    version, written, document = save_main(state, device_id=target_id, expected_version=expected_version)
+    if not written:
+        return version, False, document
 
     # Logging
     detail: Dict[str, Any] = {"version": state.version}
@@ -560,7 +746,99 @@ async def set_state(
 
     print(f"HISTORY_DEBUG: state save for user_id={current_user.username} device_id={device_id}")
 
-    return state
+    return version, True, document
+
+
+@app.post("/api/state", response_model=MainState)
+async def set_state(
+    state: MainState,
+    device_id: Optional[str] = Query(default=None, alias="device-id"),
+    current_user: User = Depends(get_current_user),
+) -> MainState:
+    """
+    Save MainState (full upload).
+    The body is the document as stored (after server-side normalisation:
+    device_id, operator_id, liveRate, locations), and the new stored version
+    is in the X-State-Version / ETag headers, so the client can diff its
+    next save against exactly what the server holds and revalidate on reload.
+    X-State-Save says whether anything was written ("noop" when unchanged).
+    """
+    storage_key = f"user:{current_user.username}"
+    version, written, document = _persist_state(state, device_id, current_user)
+    return Response(
+        content=jsoncodec.dumps(document),
+        media_type="application/json",
+        headers={
+            "ETag": _state_etag(storage_key, version),
+            STATE_VERSION_HEADER: str(version),
+            "X-State-Save": "written" if written else "noop",
+        },
+    )
+
+
+class StatePatchPayload(BaseModel):
+    base_version: int
+    ops: Optional[List[Dict[str, Any]]] = None     # RFC 6902 JSON Patch
+    merge: Optional[Dict[str, Any]] = None         # RFC 7386 merge patch
+
+
+@app.patch("/api/state")
+async def patch_state(
+    payload: StatePatchPayload,
+    response: Response,
+    device_id: Optional[str] = Query(default=None, alias="device-id"),
+    current_user: User = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Delta save: apply a JSON Patch / merge patch to the stored MainState.
+
+    The patch must be made against `base_version`. Any mismatch (including
+    no stored state yet, or a patch that does not apply) returns 409 with
+    the server's version, and the client falls back to a full POST.
+
+    On success `state` is the document as stored (normalised, as for POST),
+    which the client keeps as the base for its next delta.
+    """
+    if payload.ops is None and payload.merge is None:
+        raise HTTPException(status_code=400, detail="Provide 'ops' or 'merge'")
+
+    storage_key = f"user:{current_user.username}"
+    loaded = load_device_state_with_version(storage_key)
+    if loaded is None:
+        return JSONResponse(status_code=409, content={"detail": "No stored state", "version": 0})
+
+    doc, current_version = loaded
+    if current_version != payload.base_version:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Version conflict", "version": current_version},
+        )
+
+    try:
+        if payload.ops is not None:
+            doc = apply_json_patch(doc, payload.ops)
+        if payload.merge is not None:
+            doc = apply_merge_patch(doc, payload.merge)
+        state = MainState(**doc)
+    except (StatePatchError, ValidationError) as exc:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": f"Patch rejected: {exc}", "version": current_version},
+        )
+
+    try:
+        version, written, document = _persist_state(
+            state, device_id, current_user, expected_version=current_version
+        )
+    except StateVersionConflict as exc:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Version conflict", "version": exc.current_version},
+        )
+
+    _set_state_version_headers(response, storage_key, version)
+    response.headers["X-State-Save"] = "written" if written else "noop"
+    return {"ok": True, "version": version, "unchanged": not written, "state": document}
 
 # -------------------------------------------------------------------
 # Usage analytics API
@@ -568,27 +846,162 @@ async def set_state(
 @app.get("/api/usage/recent")
 async def api_usage_recent(
     limit: int = Query(100, ge=1, le=1000),
+    before_id: Optional[int] = Query(default=None, ge=1),
+    category: Optional[str] = Query(default=None),
+    device_id: Optional[str] = Query(default=None),
+    operator_id: Optional[str] = Query(default=None),
+    fields: str = Query("full", pattern="^(full|summary)$"),
 ) -> List[Dict[str, Any]]:
-    return get_recent_usage(limit=limit)
+    """
+    Newest-first usage log.
+
+    - Page back with `before_id` = the X-Next-Cursor header of the previous
+      page (absent on the last page).
+    - `category` takes a comma-separated list; `device_id` / `operator_id`
+      filter exactly.
+    - fields=summary drops the `detail` payload.
+    """
+    categories = [c.strip() for c in category.split(",") if c.strip()] if category else None
+    events = get_recent_usage(
+        limit=limit,
+        before_id=before_id,
+        categories=categories,
+        device_id=device_id,
+        operator_id=operator_id,
+        include_detail=fields == "full",
+    )
+    headers = {"X-Next-Cursor": str(events[-1]["id"])} if len(events) == limit else None
+    # Already plain JSON types; skip jsonable_encoder's extra pass
+    return CodecJSONResponse(events, headers=headers)
 
 
 @app.get("/api/usage/summary")
 async def api_usage_summary(
     days: int = Query(7, ge=1, le=30),
+    category: str = Query("STATE_SAVE"),
+    group_by: Optional[str] = Query(default=None, pattern="^(operator|device)$"),
+    limit: int = Query(50, ge=1, le=500),
+) -> Dict[str, Any]:
+    """
+    Daily counts for one event category (served from usage_rollups).
+    group_by=operator|device adds per-key series for the top `limit` keys.
+    """
+    try:
+        summary = get_usage_summary(days=days, category=category, group_by=group_by, limit=limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"days": days, "category": category, "group_by": group_by, **summary}
+
+
+@app.post("/api/admin/usage/rollups/rebuild")
+def api_admin_rebuild_usage_rollups(
+    days: int = Query(30, ge=1, le=400),
 ) -> Dict[str, Any]:
-    return {"days": days, "series": get_usage_summary(days=days)}
+    """Recompute usage_rollups from usage_events for the last `days` days. Runs in the threadpool."""
+    return rebuild_usage_rollups(days=days)
 
 
 # -------------------------------------------------------------------
 # Admin / Dashboard API
 # -------------------------------------------------------------------
 @app.get("/api/admin/devices")
-async def api_admin_devices() -> List[Dict[str, Any]]:
+async def api_admin_devices(
+    full: bool = Query(False),
+) -> List[Dict[str, Any]]:
     """
-    Returns the full JSON state (including Picks & Current) for all devices.
+    Live status for all devices, one entry per logical user.
     Used by the Admin Dashboard to show live status.
+
+    Served from the compact device_live_status projection; full=1 returns
+    the old full-blob list (parses every device_states row - avoid polling).
+    """
+    # Already plain JSON types; skip jsonable_encoder's extra pass
+    if full:
+        return CodecJSONResponse(get_all_device_states())
+    return CodecJSONResponse(get_device_live_status())
+
+
+@app.get("/api/admin/stream")
+async def api_admin_stream(request: Request) -> StreamingResponse:
+    """
+    Server-sent events for the Admin Dashboard: one `snapshot` (devices +
+    recent usage events), then coalesced `devices` / `usage` updates.
+    Replaces polling /api/admin/devices and /api/usage/recent.
+    """
+    try:
+        sub = admin_stream.subscribe()
+    except StreamFull:
+        raise HTTPException(status_code=503, detail="Too many dashboard streams")
+    try:
+        snapshot = await asyncio.to_thread(admin_stream.snapshot)
+    except Exception:
+        admin_stream.unsubscribe(sub)
+        raise
+    return StreamingResponse(
+        stream_events(sub, snapshot, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/api/admin/devices/{storage_key:path}")
+async def api_admin_device_state(storage_key: str) -> Response:
+    """Full stored MainState for one device_states key (e.g. "user:1234"), for the detail view."""
+    stored = load_device_state_text(storage_key)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="No state for this device")
+    payload_text, version, _ = stored
+    return Response(
+        content=payload_text,
+        media_type="application/json",
+        headers={STATE_VERSION_HEADER: str(version)},
+    )
+
+
+@app.get("/api/admin/metrics")
+async def api_admin_metrics() -> Dict[str, Any]:
+    """
+    In-process counters for this worker (caches, write paths, queues).
+    Each gunicorn/uvicorn worker reports its own numbers.
+    """
+    return {
+        "caches": {
+            "auth_tokens": _token_cache.stats(),
+            "auth_identities": _identity_cache.stats(),
+            "active_shifts": get_active_shift_cache_stats(),
+        },
+        "pin_hashing": hashing_stats(),
+        "state_saves": get_state_save_stats(),
+        "state_write_buffer": get_state_buffer_stats(),
+        "state_journal": get_state_journal_stats(),
+        "json_codec": jsoncodec.JSON_BACKEND,
+        "usage_events": get_usage_queue_stats(),
+        "retention": get_retention_stats(),
+        "admin_stream": admin_stream.stats(),
+        "change_relay": get_change_relay_stats(),
+        "message_waiters": message_waiters.stats(),
+    }
+
+
+@app.get("/api/admin/storage/compression")
+def api_admin_compression_report() -> Dict[str, Any]:
     """
-    return get_all_device_states()
+    Bytes stored vs. bytes saved per compressed column, plus re-encoder
+    progress. Scans the compressed rows, so it runs in the threadpool.
+    """
+    return get_compression_report()
+
+
+@app.post("/api/admin/retention/run")
+def api_admin_run_retention() -> Dict[str, Any]:
+    """Run partition upkeep + retention now (same as the scheduled job). Runs in the threadpool."""
+    return run_retention()
+
+
+@app.post("/api/admin/storage/reencode")
+async def api_admin_reencode_columns() -> Dict[str, Any]:
+    """Start the background re-encoder for existing rows (no-op if it is already running)."""
+    return {"started": start_column_reencoder()}
 
 
 # -------------------------------------------------------------------
@@ -608,17 +1021,52 @@ async def api_send_message(payload: MessagePayload) -> Dict[str, str]:
     return {"status": "sent"}
 
 
+class BroadcastPayload(BaseModel):
+    text: str
+    site: Optional[str] = None
+    zone: Optional[str] = None
+    role: Optional[str] = None
+
+
+@app.post("/api/admin/message/broadcast")
+def api_broadcast_message(payload: BroadcastPayload) -> Dict[str, Any]:
+    """
+    Send a message to every device on an open shift in a site, zone
+    (zone_id or zone_label) and/or role. Runs in the threadpool.
+    """
+    try:
+        device_ids = broadcast_admin_message(payload.text, site=payload.site, zone=payload.zone, role=payload.role)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"status": "sent", "delivered": len(device_ids), "device_ids": device_ids}
+
+
 @app.get("/api/messages/check")
-async def api_check_messages(
+def api_check_messages(
     device_id: str = Query(..., alias="device-id"),
 ) -> List[str]:
     """
-    Called by the WQT App (client) to poll for new admin messages.
+    Legacy poll for new admin messages (runs in the threadpool).
     Returns list of message texts and marks them as read.
     """
     return pop_admin_messages(device_id)
 
 
+@app.get("/api/messages/wait")
+async def api_wait_messages(
+    device_id: str = Query(..., alias="device-id"),
+    timeout: float = Query(MESSAGE_WAIT_TIMEOUT_S, ge=0, le=55),
+) -> List[str]:
+    """
+    Long-poll used by the WQT App: returns as soon as a message arrives for
+    this device (marking it read), or [] after `timeout` seconds.
+    """
+    try:
+        return await message_waiters.wait(device_id, timeout)
+    except WaitersFull:
+        raise HTTPException(status_code=503, detail="Too many waiting devices")
+
+
 # -------------------------------------------------------------------
 # Shift/session API
 # -------------------------------------------------------------------
@@ -792,14 +1240,109 @@ async def api_shift_end(
     return {"status": "ok", "shift": closed_shift}
 
 
+class ZoneTransitionPayload(BaseModel):
+    zone: Literal["green", "amber", "red"]
+    at: Optional[datetime] = None  # when the zone changed; defaults to now
+
+
+class ZoneTransitionBatchPayload(BaseModel):
+    transitions: List[ZoneTransitionPayload]
+
+
+@app.post("/api/shifts/{shift_id}/zone")
+def api_shift_zone(
+    shift_id: int,
+    payload: ZoneTransitionPayload,
+    current_user: User = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """
+    Performance-zone change for the caller's open shift. Closes the time
+    since the previous change into that zone's bucket (one UPDATE).
+    """
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Missing user identity")
+    try:
+        return record_zone_transitions(shift_id, current_user.username, [(payload.zone, payload.at)])
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+
+@app.post("/api/shifts/{shift_id}/zone/batch")
+def api_shift_zone_batch(
+    shift_id: int,
+    payload: ZoneTransitionBatchPayload,
+    current_user: User = Depends(get_current_user),
+) -> Dict[str, Any]:
+    """Replay zone changes recorded offline (any order; already-counted ones are skipped)."""
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Missing user identity")
+    if len(payload.transitions) > 1000:
+        raise HTTPException(status_code=400, detail="At most 1000 transitions per batch")
+    try:
+        return record_zone_transitions(
+            shift_id, current_user.username, [(t.zone, t.at) for t in payload.transitions]
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+
+
+def _shift_history_page(
+    limit: int,
+    operator_id: Optional[str],
+    before: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    fields: Optional[str],
+) -> Response:
+    wanted = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        shifts = get_recent_shifts(
+            limit=limit, operator_id=operator_id, before=before, since=since, until=until, fields=wanted
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    headers = None
+    if len(shifts) == limit:
+        last = shifts[-1]
+        headers = {"X-Next-Cursor": encode_shift_cursor(last["started_at"], last["id"])}
+    # Already plain JSON types; skip jsonable_encoder's extra pass
+    return CodecJSONResponse(shifts, headers=headers)
+
+
 @app.get("/api/shifts/recent")
-async def api_shifts_recent(
-    limit: int = Query(50, ge=1, le=200),
+def api_shifts_recent(
+    limit: int = Query(50, ge=1, le=1000),
+    before: Optional[str] = Query(default=None),
+    since: Optional[datetime] = Query(default=None),
+    until: Optional[datetime] = Query(default=None),
+    fields: Optional[str] = Query(default=None),
     current_user: User = Depends(get_current_user),
 ) -> List[Dict[str, Any]]:
+    """
+    The caller's shifts, newest first.
+
+    - Page back with `before` = the X-Next-Cursor header of the previous
+      page (absent on the last page).
+    - `since` / `until` bound started_at.
+    - `fields` is a comma-separated subset of the shift columns; only those
+      are read (id and started_at are always included).
+    """
     if not current_user:
         raise HTTPException(status_code=401, detail="Missing user identity")
-    return get_recent_shifts(limit=limit, operator_id=current_user.username)
+    return _shift_history_page(limit, current_user.username, before, since, until, fields)
+
+
+@app.get("/api/admin/shifts")
+def api_admin_shifts(
+    operator_id: Optional[str] = Query(default=None),
+    limit: int = Query(100, ge=1, le=1000),
+    before: Optional[str] = Query(default=None),
+    since: Optional[datetime] = Query(default=None),
+    until: Optional[datetime] = Query(default=None),
+    fields: Optional[str] = Query(default=None),
+) -> List[Dict[str, Any]]:
+    """Shift history for supervisors (all operators, or one); same paging and fields as /api/shifts/recent."""
+    return _shift_history_page(limit, operator_id, before, since, until, fields)
 
 
 # -------------------------------------------------------------------
@@ -826,7 +1369,8 @@ async def api_register(payload: AuthPayload) -> Dict[str, Any]:
     if role not in ALLOWED_ROLES:
         return {"success": False, "message": "Invalid role"}
 
-    created, reason = create_user(
+    created, reason = await _run_pin_hashing(
+        create_user,
         username=clean_user,
         pin=payload.pin,
         display_name=full_name,
@@ -838,6 +1382,7 @@ async def api_register(payload: AuthPayload) -> Dict[str, Any]:
         if reason == "username_exists":
             return {"success": False, "message": "Username taken"}
         return {"success": False, "message": "Failed to create user"}
+    invalidate_identity_cache(username=clean_user)
 
     user = get_user(clean_user)
     if not user:
@@ -866,7 +1411,7 @@ async def api_login(payload: AuthPayload) -> Dict[str, Any]:
     clean_user = payload.username.strip()
     if len(payload.pin) < 4 or len(payload.pin) > 32:
         return {"success": False, "message": "Invalid PIN"}
-    valid = verify_user(clean_user, payload.pin)
+    valid = await _run_pin_hashing(verify_user, clean_user, payload.pin)
     if not valid:
         return {"success": False, "message": "Invalid username or PIN"}
 
@@ -923,7 +1468,7 @@ async def auth_role_access(payload: RoleAccessPayload) -> Dict[str, Any]:
 
     # Overlay flow uses PIN == username for lookup
     user = get_user(pin)
-    if not user or user.role.strip().lower() != role or not verify_user(user.username, pin):
+    if not user or user.role.strip().lower() != role or not await _run_pin_hashing(verify_user, user.username, pin):
         raise HTTPException(status_code=401, detail="Invalid PIN or role")
 
     return {
@@ -944,7 +1489,7 @@ async def auth_login_pin(payload: PinLoginPayload) -> Dict[str, Any]:
         return {"success": False, "message": "PIN must be between 4 and 32 characters"}
 
     username = pin
-    valid = verify_user(username, pin)
+    valid = await _run_pin_hashing(verify_user, username, pin)
     if not valid:
         return {
             "success": False,
@@ -0,0 +1,102 @@
+"""
+Long-poll delivery for admin messages (GET /api/messages/wait).
+
+A device's request parks on a future in this worker's registry instead of
+re-querying every 30 seconds. send_admin_message() records a "message"
+change; the db change listener (and, on Postgres, the change relay for
+messages sent through other workers) resolves every waiter for that
+device, which then claims its messages with one UPDATE ... RETURNING.
+
+An idle device costs one index probe per MESSAGE_WAIT_TIMEOUT_S and no
+open transaction while it waits. Past MESSAGE_MAX_WAITERS parked requests
+per worker, new requests get a 503 and the client backs off.
+"""
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Set
+
+from . import db
+
+MESSAGE_WAIT_TIMEOUT_S = float(os.getenv("MESSAGE_WAIT_TIMEOUT_S", "25"))
+MESSAGE_MAX_WAITERS = int(os.getenv("MESSAGE_MAX_WAITERS", "5000"))
+
+
+class WaitersFull(Exception):
+    """Raised by wait() when MESSAGE_MAX_WAITERS requests are already parked."""
+
+
+class MessageWaiters:
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._count = 0
+        self._stats = {"wakeups": 0, "timeouts": 0, "rejected": 0}
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        db.add_change_listener(self._on_change)
+
+    def stop(self) -> None:
+        db.remove_change_listener(self._on_change)
+        for futures in self._waiters.values():
+            for fut in futures:
+                if not fut.done():
+                    fut.set_result(False)
+
+    async def wait(self, device_id: str, timeout: float) -> List[str]:
+        """Unread messages for device_id, waiting up to `timeout` seconds for one to arrive."""
+        if self._loop is None or self._count >= MESSAGE_MAX_WAITERS:
+            self._stats["rejected"] += 1
+            raise WaitersFull()
+        # Register before the first claim so a send in between still wakes us
+        fut = self._loop.create_future()
+        self._waiters.setdefault(device_id, set()).add(fut)
+        self._count += 1
+        try:
+            messages = await asyncio.to_thread(db.pop_admin_messages, device_id)
+            if messages:
+                return messages
+            try:
+                await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                self._stats["timeouts"] += 1
+                return []
+            return await asyncio.to_thread(db.pop_admin_messages, device_id)
+        finally:
+            self._count -= 1
+            futures = self._waiters.get(device_id)
+            if futures is not None:
+                futures.discard(fut)
+                if not futures:
+                    del self._waiters[device_id]
+
+    def _on_change(self, kind: str, keys: List[str]) -> None:
+        """db change listener; called on the committing thread or the change relay."""
+        if kind != "message":
+            return
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._wake, keys)
+        except RuntimeError:
+            pass  # loop shutting down
+
+    def _wake(self, device_ids: List[str]) -> None:
+        for device_id in device_ids:
+            for fut in self._waiters.get(device_id, ()):
+                if not fut.done():
+                    fut.set_result(True)
+                    self._stats["wakeups"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "waiting": self._count,
+            "devices": len(self._waiters),
+            "timeout_s": MESSAGE_WAIT_TIMEOUT_S,
+            "max_waiters": MESSAGE_MAX_WAITERS,
+            **self._stats,
+        }
+
+
+message_waiters = MessageWaiters()
@@ -0,0 +1,550 @@
+# wqt-backend/app/retention.py
+"""
+Monthly partitioning and retention for the append-only tables.
+
+Postgres
+  usage_events and order_events can be range-partitioned by month on
+  created_at (`python -m app.retention migrate <table>` converts an existing
+  table). Partitions are named <table>_pYYYYMM and created ahead of time by
+  ensure_partitions(); there is deliberately no DEFAULT partition because
+  it would rule out DETACH ... CONCURRENTLY.
+
+  Expired partitions are detached CONCURRENTLY, optionally archived, then
+  dropped, so live inserts into the parent are never blocked. New ones are
+  built as standalone tables and ATTACHed, which only takes SHARE UPDATE
+  EXCLUSIVE on the parent.
+
+  orders is referenced by order_events.order_id, so it cannot be
+  partitioned; it (and any table that is not partitioned, and everything on
+  SQLite) is pruned by batched row deletes using SKIP LOCKED row locks.
+
+Retention policy, per table (0 / unset = keep forever):
+  RETENTION_USAGE_EVENTS_MONTHS=6   RETENTION_USAGE_EVENTS_MODE=archive|drop
+  RETENTION_ORDER_EVENTS_MONTHS=24  RETENTION_ORDER_EVENTS_MODE=archive|drop
+  RETENTION_ORDERS_MONTHS=24        RETENTION_ORDERS_MODE=archive|drop
+
+archive writes the rows to gzip CSV under RETENTION_ARCHIVE_DIR before
+they are removed. Deleting an order also removes (and archives, in archive
+mode) its order_events.
+
+RETENTION_JOB=1 runs run_retention() on a background thread every
+RETENTION_INTERVAL_HOURS; with several workers a Postgres advisory lock
+makes sure only one of them does the work. It can also be run from cron:
+    python -m app.retention run
+
+Upcoming partitions do not depend on RETENTION_JOB: without a DEFAULT
+partition an insert for a month with no partition fails, so every worker
+runs ensure_all_partitions() at startup and, with the job off, the same
+background thread still does partition upkeep (no pruning) each interval.
+"""
+import csv
+import gzip
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select, text
+
+from . import db
+
+PARTITIONED_TABLES = ("usage_events", "order_events")
+RETENTION_TABLES = ("usage_events", "order_events", "orders")
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+RETENTION_ARCHIVE_DIR = Path(
+    os.getenv("RETENTION_ARCHIVE_DIR", str(Path(__file__).resolve().parent.parent / "data" / "archive"))
+)
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "1000"))
+RETENTION_BATCH_PAUSE_MS = int(os.getenv("RETENTION_BATCH_PAUSE_MS", "100"))
+RETENTION_LOCK_TIMEOUT = os.getenv("RETENTION_LOCK_TIMEOUT", "5s")
+RETENTION_JOB = os.getenv("RETENTION_JOB", "0") == "1"
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+RETENTION_FIRST_RUN_DELAY_S = float(os.getenv("RETENTION_FIRST_RUN_DELAY_S", "60"))
+
+_ADVISORY_LOCK_KEY = 734_015_001
+_PARTITION_NAME = re.compile(r"^(?P<table>.+)_p(?P<year>\d{4})(?P<month>\d{2})$")
+
+_job_thread: Optional[threading.Thread] = None
+_job_stop = threading.Event()
+_last_report: Dict[str, Any] = {}
+
+
+def _policy(table: str) -> Tuple[int, str]:
+    prefix = f"RETENTION_{table.upper()}"
+    months = int(os.getenv(f"{prefix}_MONTHS", "0"))
+    mode = os.getenv(f"{prefix}_MODE", "archive").strip().lower()
+    return months, ("drop" if mode == "drop" else "archive")
+
+
+def retention_policies() -> Dict[str, Dict[str, Any]]:
+    return {t: dict(zip(("months", "mode"), _policy(t))) for t in RETENTION_TABLES}
+
+
+# --- Month arithmetic (partitions are UTC calendar months) ---
+
+
+def _month_start(ts: datetime) -> datetime:
+    ts = ts.astimezone(timezone.utc) if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(ts: datetime, months: int) -> datetime:
+    index = ts.year * 12 + (ts.month - 1) + months
+    return ts.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def _is_postgres() -> bool:
+    return db.engine is not None and db.engine.dialect.name == "postgresql"
+
+
+@contextmanager
+def _autocommit():
+    # ATTACH / DETACH CONCURRENTLY cannot run inside a transaction block
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(f"SET lock_timeout = '{RETENTION_LOCK_TIMEOUT}'"))
+        yield conn
+
+
+def is_partitioned(table: str) -> bool:
+    if not _is_postgres():
+        return False
+    with db.engine.connect() as conn:
+        return bool(
+            conn.execute(
+                text(
+                    "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+                    "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :t)"
+                ),
+                {"t": table},
+            ).scalar()
+        )
+
+
+def list_partitions(table: str) -> List[Tuple[str, datetime, datetime]]:
+    """(name, lower, upper) of the monthly partitions attached to `table`."""
+    with db.engine.connect() as conn:
+        names = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :t"
+            ),
+            {"t": table},
+        ).scalars()
+        result = []
+        for name in names:
+            m = _PARTITION_NAME.match(name)
+            if not m or m.group("table") != table:
+                continue
+            lower = datetime(int(m.group("year")), int(m.group("month")), 1, tzinfo=timezone.utc)
+            result.append((name, lower, _add_months(lower, 1)))
+    return sorted(result, key=lambda p: p[1])
+
+
+def _attach_partition(conn, table: str, month: datetime) -> str:
+    name = _partition_name(table, month)
+    lower, upper = month.isoformat(), _add_months(month, 1).isoformat()
+    # Build the partition on its own, then ATTACH: unlike CREATE TABLE ...
+    # PARTITION OF this only takes SHARE UPDATE EXCLUSIVE on the parent.
+    # The temporary CHECK lets ATTACH skip its validation scan.
+    conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{name}" (LIKE "{table}" INCLUDING DEFAULTS)'))
+    # Left behind if an earlier attempt stopped half way
+    conn.execute(text(f'ALTER TABLE "{name}" DROP CONSTRAINT IF EXISTS "{name}_bounds"'))
+    conn.execute(
+        text(
+            f'ALTER TABLE "{name}" ADD CONSTRAINT "{name}_bounds" '
+            f"CHECK (created_at IS NOT NULL AND created_at >= '{lower}' AND created_at < '{upper}')"
+        )
+    )
+    conn.execute(
+        text(f"ALTER TABLE \"{table}\" ATTACH PARTITION \"{name}\" FOR VALUES FROM ('{lower}') TO ('{upper}')")
+    )
+    conn.execute(text(f'ALTER TABLE "{name}" DROP CONSTRAINT "{name}_bounds"'))
+    return name
+
+
+def ensure_partitions(table: str, months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create any missing partitions from the current month to `months_ahead` months out."""
+    if not is_partitioned(table):
+        return []
+    existing = {name for name, _, _ in list_partitions(table)}
+    this_month = _month_start(datetime.now(timezone.utc))
+    created = []
+    with _autocommit() as conn:
+        for i in range(months_ahead + 1):
+            month = _add_months(this_month, i)
+            if _partition_name(table, month) not in existing:
+                created.append(_attach_partition(conn, table, month))
+    return created
+
+
+def ensure_all_partitions() -> List[str]:
+    """
+    ensure_partitions() for every partitioned table, under the retention
+    advisory lock (if another worker holds it, that worker is doing this).
+    Called at startup whatever RETENTION_JOB says.
+    """
+    if not _is_postgres():
+        return []
+    created: List[str] = []
+    with _single_runner() as got_lock:
+        if not got_lock:
+            return []
+        for table in PARTITIONED_TABLES:
+            created.extend(ensure_partitions(table))
+    if created:
+        print(f"[Retention] created partitions: {', '.join(created)}")
+    return created
+
+
+# --- Archiving ---
+
+
+def _archive_path(table: str, label: str) -> Path:
+    return RETENTION_ARCHIVE_DIR / table / f"{label}.csv.gz"
+
+
+def _archive_rows(path: Path, columns: List[str], rows) -> int:
+    """Append rows to a gzip CSV (one gzip member per call) and fsync it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    new_file = not path.exists()
+    count = 0
+    with open(path, "ab") as raw:
+        with gzip.open(raw, "wt", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            if new_file:
+                writer.writerow(columns)
+            for row in rows:
+                writer.writerow([
+                    v.isoformat() if isinstance(v, datetime) else v for v in (row[c] for c in columns)
+                ])
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+    return count
+
+
+# --- Pruning ---
+
+
+def _detached_partitions(table: str) -> List[Tuple[str, datetime]]:
+    """(name, upper) of <table>_pYYYYMM tables detached by a run that stopped before the DROP."""
+    with db.engine.connect() as conn:
+        names = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_class c "
+                "WHERE c.relkind = 'r' AND c.relname LIKE :prefix "
+                "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+            ),
+            {"prefix": f"{table}\\_p%"},
+        ).scalars()
+        result = []
+        for name in names:
+            m = _PARTITION_NAME.match(name)
+            if m and m.group("table") == table:
+                lower = datetime(int(m.group("year")), int(m.group("month")), 1, tzinfo=timezone.utc)
+                result.append((name, _add_months(lower, 1)))
+    return result
+
+
+def _prune_partitions(table: str, cutoff: datetime, mode: str) -> Dict[str, Any]:
+    dropped: List[str] = []
+    archived = 0
+    expired = [(name, upper, True) for name, _, upper in list_partitions(table)]
+    expired += [(name, upper, False) for name, upper in _detached_partitions(table)]
+    for name, upper, attached in expired:
+        if upper > cutoff:
+            continue
+        with _autocommit() as conn:
+            if attached:
+                try:
+                    conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" CONCURRENTLY'))
+                except Exception as err:
+                    # A previously interrupted concurrent detach must be finalised
+                    if "pending" not in str(err).lower():
+                        raise
+                    conn.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" FINALIZE'))
+            if mode == "archive":
+                # Server-side cursors need a transaction, which `conn` (autocommit) never opens
+                with db.engine.connect() as reader:
+                    result = reader.execution_options(stream_results=True).execute(
+                        text(f'SELECT * FROM "{name}"')
+                    )
+                    archived += _archive_rows(
+                        _archive_path(table, name), list(result.keys()), result.mappings()
+                    )
+            conn.execute(text(f'DROP TABLE "{name}"'))
+        dropped.append(name)
+        print(f"[Retention] {table}: dropped partition {name} ({mode})")
+    return {"strategy": "partitions", "dropped_partitions": dropped, "archived_rows": archived}
+
+
+def _prune_rows(table_name: str, cutoff: datetime, mode: str) -> Dict[str, Any]:
+    """Delete rows older than cutoff in small batches (row locks only)."""
+    table = db.Base.metadata.tables[table_name]
+    events = db.OrderEvent.__table__
+    label = f"{table_name}-before-{cutoff:%Y%m}"
+    deleted = archived = 0
+    while True:
+        session = db.get_session()
+        try:
+            batch = (
+                select(table)
+                .where(table.c.created_at < cutoff)
+                .order_by(table.c.id)
+                .limit(RETENTION_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            rows = session.execute(batch).mappings().all()
+            if not rows:
+                session.rollback()
+                break
+            ids = [r["id"] for r in rows]
+            if table_name == "orders":
+                # Children first so the FK holds
+                child_filter = events.c.order_id.in_(ids)
+                if mode == "archive":
+                    children = session.execute(select(events).where(child_filter)).mappings().all()
+                    archived += _archive_rows(
+                        _archive_path("order_events", f"order_events-of-{label}"),
+                        list(events.c.keys()),
+                        children,
+                    )
+                session.execute(delete(events).where(child_filter))
+            if mode == "archive":
+                archived += _archive_rows(_archive_path(table_name, label), list(table.c.keys()), rows)
+            session.execute(delete(table).where(table.c.id.in_(ids)))
+            session.commit()
+            deleted += len(ids)
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+        if RETENTION_BATCH_PAUSE_MS:
+            time.sleep(RETENTION_BATCH_PAUSE_MS / 1000.0)
+    if deleted:
+        print(f"[Retention] {table_name}: deleted {deleted} rows older than {cutoff:%Y-%m-%d} ({mode})")
+    return {"strategy": "rows", "deleted_rows": deleted, "archived_rows": archived}
+
+
+@contextmanager
+def _single_runner():
+    """Postgres advisory lock so only one worker prunes at a time; yields False if busy."""
+    if not _is_postgres():
+        yield True
+        return
+    with db.engine.connect() as conn:
+        got = bool(conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": _ADVISORY_LOCK_KEY}).scalar())
+        conn.commit()
+        try:
+            yield got
+        finally:
+            if got:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": _ADVISORY_LOCK_KEY})
+                conn.commit()
+
+
+def run_retention() -> Dict[str, Any]:
+    """Create upcoming partitions, then apply every configured retention policy."""
+    global _last_report
+    if db.engine is None:
+        return {"skipped": "db not initialised"}
+    report: Dict[str, Any] = {"started_at": datetime.now(timezone.utc).isoformat(), "tables": {}}
+    with _single_runner() as got_lock:
+        if not got_lock:
+            report["skipped"] = "another worker is running retention"
+            return report
+        for table in PARTITIONED_TABLES:
+            created = ensure_partitions(table)
+            if created:
+                report.setdefault("created_partitions", []).extend(created)
+        now = datetime.now(timezone.utc)
+        for table in RETENTION_TABLES:
+            months, mode = _policy(table)
+            if months <= 0:
+                continue
+            cutoff = _add_months(now, -months)
+            try:
+                if table in PARTITIONED_TABLES and is_partitioned(table):
+                    result = _prune_partitions(table, cutoff, mode)
+                else:
+                    result = _prune_rows(table, cutoff, mode)
+            except Exception as err:
+                print(f"[Retention] {table}: failed: {err}")
+                result = {"error": str(err)}
+            report["tables"][table] = {"cutoff": cutoff.isoformat(), "mode": mode, **result}
+    report["finished_at"] = datetime.now(timezone.utc).isoformat()
+    _last_report = report
+    return report
+
+
+def get_retention_stats() -> Dict[str, Any]:
+    return {
+        "job": _job_thread is not None and _job_thread.is_alive(),
+        "interval_hours": RETENTION_INTERVAL_HOURS,
+        "policies": retention_policies(),
+        "last_run": _last_report or None,
+    }
+
+
+def _job_loop() -> None:
+    if _job_stop.wait(RETENTION_FIRST_RUN_DELAY_S):
+        return
+    while True:
+        try:
+            if RETENTION_JOB:
+                run_retention()
+            else:
+                ensure_all_partitions()
+        except Exception as err:
+            print(f"[Retention] run failed: {err}")
+        if _job_stop.wait(RETENTION_INTERVAL_HOURS * 3600):
+            return
+
+
+def start_retention_job() -> None:
+    """
+    Create any missing partitions now, then start the background thread:
+    full retention with RETENTION_JOB=1, otherwise partition upkeep only
+    (Postgres; elsewhere there is nothing to do without the job).
+    """
+    global _job_thread
+    if _job_thread is not None:
+        return
+    try:
+        ensure_all_partitions()
+    except Exception as err:
+        # Loud, but not fatal: an existing partition still takes this month's rows
+        print(f"[Retention] PARTITION UPKEEP FAILED at startup: {err}")
+    if not RETENTION_JOB and not _is_postgres():
+        return
+    _job_stop.clear()
+    _job_thread = threading.Thread(target=_job_loop, name="retention-job", daemon=True)
+    _job_thread.start()
+
+
+def stop_retention_job() -> None:
+    global _job_thread
+    _job_stop.set()
+    if _job_thread is not None:
+        _job_thread.join(timeout=5.0)
+        _job_thread = None
+
+
+# --- One-off conversion of an existing table (Postgres) ---
+
+
+def migrate_to_partitioned(table: str, batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Convert `table` into a monthly-partitioned table with the same name.
+
+    1. Builds <table>_partitioned (PK becomes (id, created_at), FKs and
+       indexes recreated) with partitions covering all existing data.
+    2. Copies rows across in id batches while the app keeps writing to the
+       old table.
+    3. In one short transaction that blocks writers only for the tail copy,
+       copies the remaining rows and swaps the names.
+
+    The old table is kept as <table>_unpartitioned; drop it once verified.
+    """
+    if not _is_postgres():
+        raise RuntimeError("Partitioning is only supported on Postgres")
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"{table} is not a partitioning candidate")
+    if is_partitioned(table):
+        return {"table": table, "already_partitioned": True}
+
+    model_table = db.Base.metadata.tables[table]
+    columns = ", ".join(f'"{c}"' for c in model_table.c.keys())
+    new, old = f"{table}_partitioned", f"{table}_unpartitioned"
+
+    with db.engine.begin() as conn:
+        conn.execute(text(f'UPDATE "{table}" SET created_at = now() WHERE created_at IS NULL'))
+        oldest = conn.execute(text(f'SELECT min(created_at) FROM "{table}"')).scalar()
+        conn.execute(
+            text(f'CREATE TABLE "{new}" (LIKE "{table}" INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)')
+        )
+        conn.execute(text(f'ALTER TABLE "{new}" ADD PRIMARY KEY (id, created_at)'))
+        for fk in model_table.foreign_keys:
+            conn.execute(
+                text(
+                    f'ALTER TABLE "{new}" ADD FOREIGN KEY ("{fk.parent.name}") '
+                    f'REFERENCES "{fk.column.table.name}" ("{fk.column.name}")'
+                )
+            )
+        for index in model_table.indexes:
+            cols = ", ".join(f'"{c.name}"' for c in index.columns)
+            conn.execute(text(f'CREATE INDEX "{index.name}_part" ON "{new}" ({cols})'))
+        month = _month_start(oldest or datetime.now(timezone.utc))
+        last = _add_months(_month_start(datetime.now(timezone.utc)), PARTITION_MONTHS_AHEAD)
+        while month <= last:
+            name = _partition_name(table, month)
+            conn.execute(
+                text(
+                    f'CREATE TABLE "{name}" PARTITION OF "{new}" '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+                )
+            )
+            month = _add_months(month, 1)
+
+    copied, last_id = 0, 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                text(
+                    f'INSERT INTO "{new}" ({columns}) SELECT {columns} FROM "{table}" '
+                    f"WHERE id > :last ORDER BY id LIMIT :n RETURNING id"
+                ),
+                {"last": last_id, "n": batch_size},
+            ).scalars().all()
+        if not rows:
+            break
+        copied += len(rows)
+        last_id = max(rows)
+
+    with db.engine.begin() as conn:
+        conn.execute(text(f'LOCK TABLE "{table}" IN SHARE ROW EXCLUSIVE MODE'))
+        tail = conn.execute(
+            text(f'INSERT INTO "{new}" ({columns}) SELECT {columns} FROM "{table}" WHERE id > :last'),
+            {"last": last_id},
+        ).rowcount
+        conn.execute(text(f'ALTER TABLE "{table}" RENAME TO "{old}"'))
+        conn.execute(text(f'ALTER TABLE "{new}" RENAME TO "{table}"'))
+        for index in model_table.indexes:
+            conn.execute(text(f'ALTER INDEX IF EXISTS "{index.name}" RENAME TO "{index.name}_unpart"'))
+            conn.execute(text(f'ALTER INDEX "{index.name}_part" RENAME TO "{index.name}"'))
+        # Keep the id sequence alive when the old table is eventually dropped
+        conn.execute(text(f"ALTER SEQUENCE IF EXISTS \"{table}_id_seq\" OWNED BY \"{table}\".id"))
+    return {"table": table, "copied_rows": copied + (tail or 0), "old_table": old}
+
+
+def main(argv: List[str]) -> None:
+    command = argv[1] if len(argv) > 1 else "run"
+    db.init_db()
+    try:
+        if command == "run":
+            print(run_retention())
+        elif command == "ensure":
+            print({t: ensure_partitions(t) for t in PARTITIONED_TABLES})
+        elif command == "migrate" and len(argv) > 2:
+            print(migrate_to_partitioned(argv[2]))
+        else:
+            print("usage: python -m app.retention [run | ensure | migrate <usage_events|order_events>]")
+    finally:
+        db.shutdown_db()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
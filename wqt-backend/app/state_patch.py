@@ -0,0 +1,146 @@
+# wqt-backend/app/state_patch.py
+"""
+Apply client deltas to a stored MainState document.
+
+Two formats are accepted by PATCH /api/state:
+  - JSON Patch (RFC 6902) operation lists; this is what the frontend sends,
+    because `add` on `/picks/-` lets it append to arrays without resending them.
+  - JSON Merge Patch (RFC 7386) objects, for simple top-level updates.
+
+Both work on plain dicts/lists as loaded from the device_states row and
+raise StatePatchError when the patch does not apply to that document.
+"""
+import copy
+from typing import Any, Dict, List
+
+
+class StatePatchError(ValueError):
+    pass
+
+
+def apply_merge_patch(target: Any, patch: Any) -> Any:
+    """RFC 7386: objects merge recursively, `null` deletes, anything else replaces."""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+def _split_pointer(pointer: str) -> List[str]:
+    if pointer == "":
+        return []
+    if not pointer.startswith("/"):
+        raise StatePatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [p.replace("~1", "/").replace("~0", "~") for p in pointer[1:].split("/")]
+
+
+def _array_index(container: list, token: str, allow_end: bool) -> int:
+    if allow_end and token == "-":
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token.startswith("0")):
+        raise StatePatchError(f"Invalid array index: {token!r}")
+    idx = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if idx > limit:
+        raise StatePatchError(f"Array index out of range: {idx}")
+    return idx
+
+
+def _resolve_parent(doc: Any, tokens: List[str]) -> Any:
+    node = doc
+    for token in tokens[:-1]:
+        if isinstance(node, dict):
+            if token not in node:
+                raise StatePatchError(f"Path not found: {token!r}")
+            node = node[token]
+        elif isinstance(node, list):
+            node = node[_array_index(node, token, allow_end=False)]
+        else:
+            raise StatePatchError(f"Cannot traverse into {type(node).__name__}")
+    return node
+
+
+def _get(doc: Any, pointer: str) -> Any:
+    tokens = _split_pointer(pointer)
+    if not tokens:
+        return doc
+    parent = _resolve_parent(doc, tokens)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise StatePatchError(f"Path not found: {pointer!r}")
+        return parent[last]
+    if isinstance(parent, list):
+        return parent[_array_index(parent, last, allow_end=False)]
+    raise StatePatchError(f"Path not found: {pointer!r}")
+
+
+def _add(doc: Any, pointer: str, value: Any) -> Any:
+    tokens = _split_pointer(pointer)
+    if not tokens:
+        return value
+    parent = _resolve_parent(doc, tokens)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        parent[last] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, last, allow_end=True), value)
+    else:
+        raise StatePatchError(f"Cannot add into {type(parent).__name__}")
+    return doc
+
+
+def _remove(doc: Any, pointer: str) -> Any:
+    tokens = _split_pointer(pointer)
+    if not tokens:
+        raise StatePatchError("Cannot remove the document root")
+    parent = _resolve_parent(doc, tokens)
+    last = tokens[-1]
+    if isinstance(parent, dict):
+        if last not in parent:
+            raise StatePatchError(f"Path not found: {pointer!r}")
+        del parent[last]
+    elif isinstance(parent, list):
+        del parent[_array_index(parent, last, allow_end=False)]
+    else:
+        raise StatePatchError(f"Cannot remove from {type(parent).__name__}")
+    return doc
+
+
+def apply_json_patch(doc: Dict[str, Any], ops: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    RFC 6902 operations: add, remove, replace, move, copy, test.
+
+    `doc` is modified in place and returned; callers pass a freshly loaded
+    document so there is nothing to protect.
+    """
+    for op in ops or []:
+        if not isinstance(op, dict) or "op" not in op or "path" not in op:
+            raise StatePatchError("Each operation needs 'op' and 'path'")
+        kind = op["op"]
+        path = op["path"]
+        if kind == "add":
+            doc = _add(doc, path, op.get("value"))
+        elif kind == "remove":
+            doc = _remove(doc, path)
+        elif kind == "replace":
+            _get(doc, path)
+            doc = _add(_remove(doc, path), path, op.get("value")) if path else op.get("value")
+        elif kind == "move":
+            value = _get(doc, op.get("from", ""))
+            doc = _add(_remove(doc, op.get("from", "")), path, value)
+        elif kind == "copy":
+            doc = _add(doc, path, copy.deepcopy(_get(doc, op.get("from", ""))))
+        elif kind == "test":
+            if _get(doc, path) != op.get("value"):
+                raise StatePatchError(f"Test failed at {path!r}")
+        else:
+            raise StatePatchError(f"Unsupported op: {kind!r}")
+    if not isinstance(doc, dict):
+        raise StatePatchError("Patched state must be an object")
+    return doc
@@ -1,46 +1,195 @@
 # wqt-backend/app/storage.py
-import json
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: journal still works, just without flock
+    fcntl = None
 
 from .models import MainState
 from .db import (
     load_device_state,
+    normalize_state_payload,
     save_device_state,
 )
+from .write_behind import WriteBehindBuffer
+from . import jsoncodec
 
-# Legacy file path for local / fallback mode
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
-STATE_FILE = DATA_DIR / "main_state.json"
 
+# Optional local journal of saved states, one append-only file per storage key.
+# Replaces the old shared data/main_state.json mirror, which every worker
+# rewrote in full on every save. Appends are coalesced per key and fsynced in
+# batches by a background thread, and each file is compacted down to its last
+# record once it grows past STATE_JOURNAL_MAX_RECORDS snapshots.
+#
+# load_main() falls back to it when Postgres has nothing for the key (or is
+# unreachable), which makes it a crash-recovery source for a single host.
+STATE_JOURNAL_ENABLED = os.getenv("STATE_JOURNAL", "0") == "1"
+STATE_JOURNAL_DIR = Path(os.getenv("STATE_JOURNAL_DIR", str(DATA_DIR / "journal")))
+STATE_JOURNAL_FSYNC_MS = int(os.getenv("STATE_JOURNAL_FSYNC_MS", "1000"))
+STATE_JOURNAL_MAX_RECORDS = int(os.getenv("STATE_JOURNAL_MAX_RECORDS", "50"))
 
-def _load_from_file() -> Optional[dict]:
-    """
-    Load the last saved MainState payload from the local JSON file.
-    Returns None if the file does not exist or is invalid.
-    """
-    if not STATE_FILE.exists():
-        return None
+# Key used when a save has no storage key (offline / dev single-device mode)
+LOCAL_JOURNAL_KEY = "local"
 
-    try:
-        with STATE_FILE.open("r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        # Treat any corrupted / partial file as "no data"
+_journal: Optional[WriteBehindBuffer] = None
+# Counted on the buffer itself (under its lock): the flusher thread and
+# request threads both bump them
+_JOURNAL_COUNTERS = ("appended", "fsyncs", "compactions", "recoveries")
+
+
+def _count(name: str, n: int = 1) -> None:
+    journal = _journal
+    if journal is not None:
+        journal.add_stat(name, n)
+
+
+def _journal_path(key: str) -> Path:
+    readable = re.sub(r"[^A-Za-z0-9_-]+", "_", key)[:40]
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return STATE_JOURNAL_DIR / f"{readable}-{digest}.jsonl"
+
+
+def _lock(fh, exclusive: bool = True) -> None:
+    # Several gunicorn workers may journal the same key
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+
+def _unlock(fh) -> None:
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _compact(path: Path, last_line: bytes) -> None:
+    tmp = path.with_suffix(".jsonl.tmp")
+    with tmp.open("wb") as fh:
+        fh.write(last_line)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    _count("compactions")
+
+
+def _open_locked_for_append(path: Path):
+    # Another worker may compact (replace) the file between our open() and
+    # flock(); appending to the old inode would lose the record, so retry.
+    while True:
+        fh = path.open("ab")
+        _lock(fh)
+        try:
+            if os.fstat(fh.fileno()).st_ino == os.stat(path).st_ino:
+                return fh
+        except FileNotFoundError:
+            pass
+        _unlock(fh)
+        fh.close()
+
+
+def _flush_journal(entries: Dict[str, Dict[str, Any]]) -> None:
+    """Append one record per key, fsync each file once per batch."""
+    STATE_JOURNAL_DIR.mkdir(parents=True, exist_ok=True)
+    for key, record in entries.items():
+        path = _journal_path(key)
+        line = jsoncodec.dumps_bytes(record) + b"\n"
+        with _open_locked_for_append(path) as fh:
+            try:
+                fh.write(line)
+                fh.flush()
+                os.fsync(fh.fileno())
+                _count("appended")
+                _count("fsyncs")
+                if fh.tell() > len(line) * max(1, STATE_JOURNAL_MAX_RECORDS):
+                    _compact(path, line)
+            finally:
+                _unlock(fh)
+
+
+def start_state_journal() -> None:
+    global _journal
+    if not STATE_JOURNAL_ENABLED or _journal is not None:
+        return
+    _journal = WriteBehindBuffer(
+        "state_journal",
+        _flush_journal,
+        interval_seconds=STATE_JOURNAL_FSYNC_MS / 1000.0,
+    )
+    for name in _JOURNAL_COUNTERS:
+        _journal.add_stat(name, 0)
+    _journal.start()
+
+
+def shutdown_state_journal() -> None:
+    global _journal
+    if _journal is not None:
+        _journal.stop()
+        _journal = None
+
+
+def get_state_journal_stats() -> Optional[Dict[str, Any]]:
+    if _journal is None:
         return None
+    return {**_journal.stats(), "dir": str(STATE_JOURNAL_DIR)}
+
+
+def _journal_state(key: str, payload: dict, version: int) -> None:
+    if _journal is None:
+        return
+    _journal.put(
+        key,
+        {
+            "key": key,
+            "version": version,
+            "journaled_at": datetime.now(timezone.utc).isoformat(),
+            "payload": payload or {},
+        },
+    )
 
 
-def _save_to_file(payload: dict) -> None:
+def load_journaled_state(key: Optional[str]) -> Optional[dict]:
     """
-    Persist a JSON-serialisable payload to the local JSON file.
+    Latest journaled payload for a storage key, or None.
+    Includes records still waiting for the next fsync batch.
     """
+    if not STATE_JOURNAL_ENABLED:
+        return None
+    key = key or LOCAL_JOURNAL_KEY
+    if _journal is not None:
+        pending = _journal.get(key)
+        if pending is not None:
+            return pending.get("payload")
+
+    path = _journal_path(key)
+    if not path.exists():
+        return None
+    last: Optional[dict] = None
     try:
-        with STATE_FILE.open("w", encoding="utf-8") as f:
-            json.dump(payload or {}, f)
-    except Exception:
-        # Local file is only a safety net; if it fails we don't want 500s.
-        pass
+        with path.open("rb") as fh:
+            _lock(fh, exclusive=False)
+            try:
+                for raw in fh:
+                    try:
+                        last = jsoncodec.loads(raw)
+                    except ValueError:
+                        # Torn final line after a crash: keep the previous record
+                        continue
+            finally:
+                _unlock(fh)
+    except OSError:
+        logging.exception("[StateJournal] failed to read %s", path)
+        return None
+    if last is None:
+        return None
+    _count("recoveries")
+    return last.get("payload")
 
 
 def load_main(device_id: Optional[str] = None) -> MainState:
@@ -49,7 +198,7 @@ def load_main(device_id: Optional[str] = None) -> MainState:
 
     Order of precedence now:
       1. Per-device state in Postgres (device_id required)
-      2. Local JSON file (legacy single-device / offline)
+      2. The local journal for that same key (crash recovery / offline)
       3. A fresh default MainState
 
     We deliberately do NOT fall back to a global DB state anymore,
@@ -61,9 +210,9 @@ def load_main(device_id: Optional[str] = None) -> MainState:
     if device_id:
         payload = load_device_state(device_id)
 
-    # 2) Fall back to legacy file (for offline / dev)
+    # 2) Fall back to this key's journal (never another key's)
     if not payload:
-        payload = _load_from_file()
+        payload = load_journaled_state(device_id)
 
     # 3) Fresh install / first run - minimal sane defaults.
     if not payload:
@@ -72,24 +221,40 @@ def load_main(device_id: Optional[str] = None) -> MainState:
     return MainState(**payload)
 
 
-def save_main(state: MainState, device_id: Optional[str] = None) -> None:
+def save_main(
+    state: MainState,
+    device_id: Optional[str] = None,
+    expected_version: Optional[int] = None,
+) -> Tuple[int, bool, Dict[str, Any]]:
     """
     Persist main state to Postgres *per-device* when we know the device_id.
-    If we don't know the device, only write to the local JSON snapshot to
-    avoid creating a shared global blob.
+    If we don't know the device, only journal it locally to avoid creating
+    a shared global blob.
+
+    Returns (version, written, document): version/written as from
+    db.save_device_state (written is False when the payload was unchanged
+    and the save was skipped), and the normalised document as stored, so
+    callers can hand it back to the client as its sync base.
+    `expected_version` is passed through for delta saves.
     """
-    if isinstance(state, MainState):
+    validated = isinstance(state, MainState)
+    if validated:
         payload = state.model_dump()
     else:
         payload = dict(state or {})
+    payload = normalize_state_payload(payload)
 
     # Only use per-device rows in Postgres now
     if device_id:
-        save_device_state(device_id, payload)
+        version, written = save_device_state(
+            device_id, payload, expected_version=expected_version, validated=validated
+        )
     else:
-        # No device_id - only keep a local backup, don't pollute global DB state
-        _save_to_file(payload)
-        return
+        # No device_id - only keep a local record, don't pollute global DB state
+        _journal_state(LOCAL_JOURNAL_KEY, payload, 0)
+        return 0, True, payload
 
-    # Still keep the local JSON snapshot as a last-known-state backup
-    _save_to_file(payload)
+    # Keep this key's journal as a last-known-state backup
+    if written:
+        _journal_state(device_id, payload, version)
+    return version, written, payload
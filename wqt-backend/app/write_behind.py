@@ -0,0 +1,155 @@
+# wqt-backend/app/write_behind.py
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class WriteBehindBuffer:
+    """
+    Latest-value-wins write buffer with a background flusher thread.
+
+    - `put(key, value)` replaces any pending value for the key, so a burst of
+      saves for one user collapses into a single row write.
+    - A daemon thread calls `flush_fn(entries)` every `interval_seconds`, or
+      sooner once `max_pending` keys are waiting.
+    - `get(key)` sees pending *and* in-flight values, so readers in this
+      process never observe an older DB row while a flush is running.
+    - A failed flush puts its entries back (unless a newer value arrived)
+      and is retried on the next cycle.
+    - `stop()` drains everything before returning; call it on shutdown.
+      A `put` that arrives once stopping has begun is written through
+      (synchronously, replacing any pending value for the key) instead of
+      being left in a buffer nobody flushes.
+
+    Buffered values only live in this process. Anything not yet flushed is
+    lost if the process is killed hard, which is why callers keep this opt-in.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[Dict[Hashable, Any]], None],
+        interval_seconds: float = 0.5,
+        max_pending: int = 200,
+    ) -> None:
+        self.name = name
+        self._flush_fn = flush_fn
+        self.interval_seconds = max(0.01, float(interval_seconds))
+        self.max_pending = max(1, int(max_pending))
+        self._pending: Dict[Hashable, Any] = {}
+        self._inflight: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "puts": 0,
+            "coalesced": 0,
+            "flushes": 0,
+            "rows_flushed": 0,
+            "flush_errors": 0,
+            "pressure_flushes": 0,
+        }
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-flusher", daemon=True)
+        self._thread.start()
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self._stopping.is_set():
+            self._write_through(key, value)
+            return
+        with self._lock:
+            if key in self._pending:
+                self._stats["coalesced"] += 1
+            self._pending[key] = value
+            self._stats["puts"] += 1
+            under_pressure = len(self._pending) >= self.max_pending
+        if under_pressure:
+            with self._lock:
+                self._stats["pressure_flushes"] += 1
+            self._wake.set()
+
+    def add_stat(self, name: str, count: int = 1) -> None:
+        """Bump a caller-defined counter; stats() reports it with the buffer's own."""
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + count
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            return self._inflight.get(key)
+
+    def pending_items(self) -> Dict[Hashable, Any]:
+        """Snapshot of every buffered value (pending overrides in-flight)."""
+        with self._lock:
+            merged = dict(self._inflight)
+            merged.update(self._pending)
+            return merged
+
+    def flush(self) -> int:
+        """Write out everything pending right now; returns the number of keys written."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+            try:
+                self._flush_fn(batch)
+            except Exception:
+                logging.exception("[WriteBehind:%s] flush of %d keys failed", self.name, len(batch))
+                with self._lock:
+                    self._stats["flush_errors"] += 1
+                    for key, value in batch.items():
+                        self._pending.setdefault(key, value)
+                    self._inflight = {}
+                return 0
+            with self._lock:
+                self._inflight = {}
+                self._stats["flushes"] += 1
+                self._stats["rows_flushed"] += len(batch)
+            return len(batch)
+
+    def _write_through(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            # This value supersedes anything still waiting for the drain
+            self._pending.pop(key, None)
+            self._stats["puts"] += 1
+            self._stats["write_through"] = self._stats.get("write_through", 0) + 1
+        # Serialised with flush() so an older in-flight value cannot land after it
+        with self._flush_lock:
+            self._flush_fn({key: value})
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(5.0, self.interval_seconds * 4))
+            self._thread = None
+        # Drain whatever is left (including entries re-queued after an error)
+        for _ in range(3):
+            if not self.flush():
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "name": self.name,
+                "pending": len(self._pending),
+                "inflight": len(self._inflight),
+                "interval_seconds": self.interval_seconds,
+                "max_pending": self.max_pending,
+                **self._stats,
+            }
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            self.flush()
@@ -0,0 +1,116 @@
+"""
+stdlib json vs app.jsoncodec on realistic blobs.
+
+Builds a MainState with DAYS days of history (the heavy users' GET/POST
+/api/state body) and an admin device list of DEVICES such states (the
+/api/admin/devices body), then times decode, encode and response rendering
+with both. JSON_CODEC=msgspec / json picks the codec under test.
+
+    cd wqt-backend
+    python -m bench.bench_json_codec [days] [devices]
+"""
+import json
+import random
+import sys
+import time
+
+from fastapi.responses import JSONResponse
+
+from app import jsoncodec
+from app.jsoncodec import CodecJSONResponse
+from app.models import MainState
+
+
+def _pick(rng: random.Random, day: int, n: int) -> dict:
+    start = 6 * 60 + n * 17
+    return {
+        "name": f"ORD-{day:03d}-{n:02d}",
+        "units": rng.randint(20, 400),
+        "locations": rng.randint(1, 40),
+        "pallets": rng.randint(1, 6),
+        "start": f"{start // 60:02d}:{start % 60:02d}",
+        "close": f"{(start + 15) // 60:02d}:{(start + 15) % 60:02d}",
+        "excl": 0,
+        "closedEarly": rng.random() < 0.05,
+        "log": {
+            "wraps": [{"t": "07:10", "units": rng.randint(1, 50)} for _ in range(rng.randint(0, 3))],
+            "breaks": [],
+            "rate": round(rng.uniform(80, 260), 2),
+        },
+    }
+
+
+def build_state(days: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    history = [
+        {
+            "date": f"2026-{1 + d // 28:02d}-{1 + d % 28:02d}",
+            "picks": [_pick(rng, d, n) for n in range(rng.randint(12, 24))],
+            "totalUnits": rng.randint(2000, 6000),
+            "note": "Ambient — aisle 14 reset",
+        }
+        for d in range(days)
+    ]
+    state = MainState(
+        version="3.3.55",
+        savedAt="2026-10-16T07:45:00.000Z",
+        picks=[_pick(rng, days, n) for n in range(10)],
+        history=history,
+        current={"name": "ORD-LIVE", "units": 120, "locations": 8, "liveRate": 187},
+        startTime="06:00",
+        shiftBreaks=[{"start": "09:00", "end": "09:15"}],
+    )
+    return state.model_dump()
+
+
+def _time(fn, rounds: int) -> float:
+    fn()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    return (time.perf_counter() - started) / rounds * 1000.0
+
+
+def _compare(label: str, rounds: int, stdlib_fn, codec_fn) -> None:
+    a = _time(stdlib_fn, rounds)
+    b = _time(codec_fn, rounds)
+    print(f"  {label:<22} stdlib {a:8.3f}ms  {jsoncodec.JSON_BACKEND:>7} {b:8.3f}ms  x{a / b:5.1f}")
+
+
+def main() -> None:
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    devices = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    state = build_state(days)
+    state_text = json.dumps(state)
+    device_list = [build_state(max(1, days // 4), seed=i) for i in range(devices)]
+    list_text = json.dumps(device_list)
+
+    print(f"MainState: {days} days of history, {len(state_text) / 1024:.0f} KB")
+    _compare("decode (load state)", 50, lambda: json.loads(state_text), lambda: jsoncodec.loads(state_text))
+    _compare("encode (save state)", 50, lambda: json.dumps(state), lambda: jsoncodec.dumps(state))
+    _compare(
+        "fingerprint encode",
+        50,
+        lambda: json.dumps(state, sort_keys=True, separators=(",", ":"), default=str),
+        lambda: jsoncodec.dumps_bytes(state, sort_keys=True),
+    )
+
+    print(f"Admin device list: {devices} devices, {len(list_text) / 1024:.0f} KB")
+    row_texts = [json.dumps(s) for s in device_list]
+    _compare(
+        "decode (rows)",
+        10,
+        lambda: [json.loads(t) for t in row_texts],
+        lambda: [jsoncodec.loads(t) for t in row_texts],
+    )
+    _compare(
+        "response render",
+        10,
+        lambda: JSONResponse(device_list),
+        lambda: CodecJSONResponse(device_list),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Event-loop latency during a PIN login burst.
+
+Simulates a shift change: BURST logins hash a PIN at the same time while a
+ticker coroutine measures how late the event loop wakes it up. Compares the
+old inline hashing against the bounded hashing pool in app.hashing.
+
+    cd wqt-backend
+    python -m bench.bench_login_burst [burst]
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from app.db import hash_pin_value
+from app.hashing import HashPoolBusy, run_pin_hashing, shutdown_hashing_pool
+
+TICK_SECONDS = 0.005
+
+
+async def _ticker(stop: asyncio.Event, lags: list) -> None:
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append((time.perf_counter() - before - TICK_SECONDS) * 1000.0)
+
+
+async def _inline_login(pin: str) -> bool:
+    # What the handlers used to do: hash directly inside `async def`
+    hash_pin_value(pin)
+    return True
+
+
+async def _pooled_login(pin: str) -> bool:
+    try:
+        await run_pin_hashing(hash_pin_value, pin)
+        return True
+    except HashPoolBusy:
+        return False
+
+
+async def _run(mode: str, burst: int) -> None:
+    login = _inline_login if mode == "inline" else _pooled_login
+    lags: list = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login(f"{1000 + i}") for i in range(burst)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await ticker
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if lags else 0.0
+    print(
+        f"{mode:>7}: {burst} logins in {elapsed:6.2f}s "
+        f"accepted={sum(results):3d} rejected={burst - sum(results):3d} | "
+        f"loop lag p50={statistics.median(lags) if lags else 0:7.2f}ms "
+        f"p99={p99:7.2f}ms max={lags[-1] if lags else 0:7.2f}ms"
+    )
+
+
+def main() -> None:
+    burst = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    asyncio.run(_run("inline", burst))
+    asyncio.run(_run("pooled", burst))
+    shutdown_hashing_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Parallel start_shift calls for the same operators (the double-fired /
+retried "Start shift" case).
+
+Starts THREADS workers that all call start_shift for the same brand-new
+operator ids at once, then asserts that no call failed, every caller got
+the same shift id and exactly one open shift row exists per operator, and
+reports SQL statements per call (1 shift write + the pg_notify on
+Postgres). Exits non-zero (AssertionError) when any check fails.
+
+Needs a real database; Postgres is the interesting case:
+
+    cd wqt-backend
+    DATABASE_URL=postgresql://... python -m bench.bench_shift_start [threads] [operators]
+"""
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+from sqlalchemy import event, func
+
+from app import db
+
+
+def main() -> None:
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    operators = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    db.init_db()
+    statements = {"count": 0}
+    lock = threading.Lock()
+
+    @event.listens_for(db.engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("BEGIN", "COMMIT", "ROLLBACK")):
+            return
+        with lock:
+            statements["count"] += 1
+
+    op_ids = [f"bench:{uuid.uuid4().hex[:12]}" for _ in range(operators)]
+    shift_ids = defaultdict(set)
+    errors = {"count": 0}
+    barrier = threading.Barrier(threads)
+
+    def worker(n: int) -> None:
+        barrier.wait()
+        for op in op_ids:
+            try:
+                sid = db.start_shift(op, device_id=f"bench-dev-{n}", site="bench")
+                with lock:
+                    shift_ids[op].add(sid)
+            except Exception as err:
+                with lock:
+                    errors["count"] += 1
+                print(f"start_shift failed: {err}")
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    session = db.get_session()
+    try:
+        open_counts = dict(
+            session.query(db.ShiftSession.operator_id, func.count())
+            .filter(db.ShiftSession.operator_id.in_(op_ids), db.ShiftSession.ended_at.is_(None))
+            .group_by(db.ShiftSession.operator_id)
+            .all()
+        )
+        session.query(db.ShiftSession).filter(db.ShiftSession.operator_id.in_(op_ids)).delete(
+            synchronize_session=False
+        )
+        session.commit()
+    finally:
+        session.close()
+
+    total = threads * operators
+    split = [op for op in op_ids if len(shift_ids[op]) != 1]
+    not_one_open = {op: open_counts.get(op, 0) for op in op_ids if open_counts.get(op, 0) != 1}
+    print(
+        f"{db.engine.dialect.name}: {total} starts in {elapsed:.2f}s errors={errors['count']} "
+        f"operators_with_split_ids={len(split)} operators_without_exactly_one_open={len(not_one_open)} "
+        f"statements_per_start={statements['count'] / total:.2f}"
+    )
+    db.shutdown_db()
+    assert errors["count"] == 0, f"{errors['count']} start_shift calls failed"
+    assert not split, f"callers got different shift ids for {split}"
+    assert not not_one_open, f"open shift rows per operator, expected exactly 1: {not_one_open}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Parallel writers against save_device_state.
+
+Starts THREADS workers that all save to the same brand-new storage keys at
+once (the "two first-time saves race on device_id" case), then reports
+IntegrityErrors and SQL statements per save: 1.00 on Postgres (state
+write, live status and NOTIFY in one CTE), 2.00 on SQLite.
+
+Then checks the compare-and-swap: for ROUNDS rounds, every thread saves a
+different payload with the same expected_version at once, and it asserts
+exactly one save wins and all the others raise StateVersionConflict.
+
+Needs a real database; Postgres is the interesting case:
+
+    cd wqt-backend
+    DATABASE_URL=postgresql://... python -m bench.bench_state_upsert [threads] [saves] [rounds]
+"""
+import sys
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+
+
+def main() -> None:
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    saves = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+    db.init_db()
+    statements = {"count": 0}
+    lock = threading.Lock()
+
+    @event.listens_for(db.engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("BEGIN", "COMMIT", "ROLLBACK")):
+            return
+        with lock:
+            statements["count"] += 1
+
+    keys = [f"bench:{uuid.uuid4().hex}" for _ in range(4)]
+    errors = {"integrity": 0, "other": 0}
+    barrier = threading.Barrier(threads)
+
+    def worker(n: int) -> None:
+        barrier.wait()
+        for i in range(saves):
+            key = keys[i % len(keys)]
+            try:
+                db.save_device_state(key, {"version": "bench", "picks": [{"units": n * 1000 + i}]})
+            except IntegrityError:
+                with lock:
+                    errors["integrity"] += 1
+            except Exception:
+                with lock:
+                    errors["other"] += 1
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * saves
+    print(
+        f"{db.engine.dialect.name}: {total} saves in {elapsed:.2f}s "
+        f"integrity_errors={errors['integrity']} other_errors={errors['other']} "
+        f"statements_per_save={statements['count'] / total:.2f}"
+    )
+
+    cas_key = f"bench:{uuid.uuid4().hex}"
+    keys.append(cas_key)
+    version, _ = db.save_device_state(cas_key, {"version": "bench", "picks": []})
+    outcomes = []
+
+    def cas_worker(n: int, expected: int, round_no: int) -> None:
+        barrier.wait()
+        try:
+            _, written = db.save_device_state(
+                cas_key,
+                {"version": "bench", "picks": [{"units": round_no * 1000 + n}]},
+                expected_version=expected,
+            )
+            result = "won" if written else "noop"
+        except db.StateVersionConflict:
+            result = "conflict"
+        except Exception as err:
+            result = f"error: {err}"
+        with lock:
+            outcomes[-1].append(result)
+
+    for round_no in range(rounds):
+        outcomes.append([])
+        pool = [threading.Thread(target=cas_worker, args=(n, version, round_no)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        version += 1
+
+    bad = [r for r in outcomes if r.count("won") != 1 or r.count("conflict") != threads - 1]
+    print(f"{db.engine.dialect.name}: {rounds} CAS rounds x {threads} savers, rounds_without_exactly_one_winner={len(bad)}")
+
+    session = db.get_session()
+    try:
+        session.query(db.DeviceState).filter(db.DeviceState.device_id.in_(keys)).delete(
+            synchronize_session=False
+        )
+        session.commit()
+    finally:
+        session.close()
+    db.shutdown_db()
+    assert not bad, f"expected 1 winner and {threads - 1} StateVersionConflict per round, got {bad[:3]}"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+-- Partial index for message delivery: pops only ever look up unread rows
+-- by device, so the index stays as small as the unread backlog.
+CREATE INDEX IF NOT EXISTS ix_admin_messages_unread
+    ON admin_messages (device_id)
+    WHERE read_at IS NULL;
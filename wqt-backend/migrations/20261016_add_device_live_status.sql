@@ -0,0 +1,22 @@
+-- Compact per-device projection for the admin live floor, rewritten by the
+-- backend on every state save. The backend backfills it from device_states
+-- on first start when it is empty.
+CREATE TABLE IF NOT EXISTS device_live_status (
+    storage_key TEXT PRIMARY KEY,
+    device_id TEXT,
+    logical_key TEXT NOT NULL,
+    operator_id TEXT,
+    operator_name TEXT,
+    operator_role TEXT,
+    order_name TEXT,
+    units_done INTEGER,
+    units_left INTEGER,
+    units_total INTEGER,
+    locations INTEGER,
+    live_rate DOUBLE PRECISION,
+    active_break TEXT,
+    saved_at TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ix_device_live_status_logical_key ON device_live_status (logical_key);
@@ -0,0 +1,3 @@
+-- Fingerprint of the normalised state payload (minus savedAt / current.liveRate),
+-- used to skip rewriting device_states when a save carries no real change.
+ALTER TABLE device_states ADD COLUMN IF NOT EXISTS payload_fingerprint TEXT;
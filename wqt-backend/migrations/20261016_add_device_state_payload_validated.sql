@@ -0,0 +1,4 @@
+-- Rows whose payload was written from a validated MainState; GET /api/state
+-- returns their stored JSON text as-is instead of re-parsing and re-validating.
+-- Existing rows stay FALSE and are upgraded on their next real save.
+ALTER TABLE device_states ADD COLUMN IF NOT EXISTS payload_validated BOOLEAN NOT NULL DEFAULT FALSE;
@@ -0,0 +1,2 @@
+-- Per-row version for device_states, used as the base for delta saves (PATCH /api/state).
+ALTER TABLE device_states ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 0;
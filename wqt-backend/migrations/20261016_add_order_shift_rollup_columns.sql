@@ -0,0 +1,42 @@
+-- Shift-end stats are summed from orders in SQL: each order records the
+-- operator's open shift and its active minutes; the shift stores its
+-- order count next to total_units / active_minutes / avg_rate.
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS shift_id INTEGER;
+ALTER TABLE orders ADD COLUMN IF NOT EXISTS active_min INTEGER;
+CREATE INDEX IF NOT EXISTS ix_orders_shift_id ON orders (shift_id);
+ALTER TABLE shift_sessions ADD COLUMN IF NOT EXISTS order_count INTEGER;
+
+-- Backfill active_min for orders recorded before the column existed, with
+-- the same rule as _compute_active_minutes_from_pick(): duration minus the
+-- excluded minutes, the logged breaks and the logged wraps (whole minutes
+-- per wrap), never below zero. log_json is CompressedText, so only plain
+-- JSON ('{...}') is parsed; compressed (gz:/zs:) or missing logs count as
+-- duration minus excl, the same fallback _compute_shift_stats() applies.
+UPDATE orders o
+SET active_min = GREATEST(
+    0,
+    o.duration_min
+    - COALESCE(o.excl_min, 0)
+    - COALESCE((
+        SELECT SUM((b ->> 'minutes')::numeric)
+        FROM jsonb_array_elements(
+            CASE WHEN jsonb_typeof(src.log -> 'breaks') = 'array'
+                 THEN src.log -> 'breaks' ELSE '[]'::jsonb END
+        ) b
+        WHERE jsonb_typeof(b -> 'minutes') = 'number'
+    ), 0)
+    - COALESCE((
+        SELECT SUM(TRUNC((w ->> 'durationMs')::numeric / 60000))
+        FROM jsonb_array_elements(
+            CASE WHEN jsonb_typeof(src.log -> 'wraps') = 'array'
+                 THEN src.log -> 'wraps' ELSE '[]'::jsonb END
+        ) w
+        WHERE jsonb_typeof(w -> 'durationMs') = 'number'
+    ), 0)
+)::int
+FROM (
+    SELECT id, CASE WHEN log_json LIKE '{%' THEN log_json::jsonb END AS log
+    FROM orders
+    WHERE active_min IS NULL AND duration_min IS NOT NULL
+) src
+WHERE o.id = src.id;
@@ -0,0 +1,5 @@
+-- Partial index for active-shift lookups: open shifts per operator, newest
+-- first. Closed shifts (the vast majority of rows) are not indexed here.
+CREATE INDEX IF NOT EXISTS ix_shift_sessions_open_operator
+    ON shift_sessions (operator_id, started_at DESC)
+    WHERE ended_at IS NULL;
@@ -0,0 +1,3 @@
+-- Shift history pages: per operator, newest first, keyset on (started_at, id).
+CREATE INDEX IF NOT EXISTS ix_shift_sessions_operator_started_at
+    ON shift_sessions (operator_id, started_at DESC, id DESC);
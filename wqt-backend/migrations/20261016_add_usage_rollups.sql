@@ -0,0 +1,19 @@
+-- Composite index for per-category time-window queries on usage_events.
+CREATE INDEX IF NOT EXISTS ix_usage_events_category_created_at
+    ON usage_events (category, created_at);
+
+-- Hourly event counts per category / operator / device, maintained by the
+-- backend's usage-event writer. '' stands for "no operator/device".
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    id SERIAL PRIMARY KEY,
+    bucket_start TIMESTAMPTZ NOT NULL,
+    category TEXT NOT NULL,
+    operator_id TEXT NOT NULL DEFAULT '',
+    device_id TEXT NOT NULL DEFAULT '',
+    count INTEGER NOT NULL DEFAULT 0,
+    CONSTRAINT uq_usage_rollups_bucket UNIQUE (bucket_start, category, operator_id, device_id)
+);
+CREATE INDEX IF NOT EXISTS ix_usage_rollups_id ON usage_rollups (id);
+CREATE INDEX IF NOT EXISTS ix_usage_rollups_category_bucket ON usage_rollups (category, bucket_start);
+
+-- Then backfill history once: POST /api/admin/usage/rollups/rebuild?days=30
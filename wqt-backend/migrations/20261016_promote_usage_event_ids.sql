@@ -0,0 +1,21 @@
+-- Promote device/operator out of usage_events.detail so the admin log can
+-- filter and keyset-paginate in SQL.
+ALTER TABLE usage_events ADD COLUMN IF NOT EXISTS device_id TEXT;
+ALTER TABLE usage_events ADD COLUMN IF NOT EXISTS operator_id TEXT;
+
+CREATE INDEX IF NOT EXISTS ix_usage_events_category_id ON usage_events (category, id);
+CREATE INDEX IF NOT EXISTS ix_usage_events_device_id_id ON usage_events (device_id, id);
+CREATE INDEX IF NOT EXISTS ix_usage_events_operator_id_id ON usage_events (operator_id, id);
+
+-- Backfill existing rows (safe to re-run; only touches rows not yet filled).
+UPDATE usage_events
+SET device_id = NULLIF(detail::jsonb ->> 'device_id', ''),
+    operator_id = NULLIF(COALESCE(
+        detail::jsonb ->> 'operator_id',
+        detail::jsonb ->> 'logged_in_user',
+        detail::jsonb ->> 'username'
+    ), '')
+WHERE device_id IS NULL
+  AND operator_id IS NULL
+  AND detail IS NOT NULL
+  AND detail LIKE '{%';
@@ -0,0 +1,16 @@
+-- One open shift per operator. Duplicate open shifts (double-fired starts)
+-- are closed with zero length, keeping the newest, before the partial
+-- unique index is added. It replaces ix_shift_sessions_open_operator and is
+-- the ON CONFLICT target for start_shift.
+UPDATE shift_sessions SET ended_at = started_at
+WHERE ended_at IS NULL AND EXISTS (
+    SELECT 1 FROM shift_sessions newer
+    WHERE newer.operator_id = shift_sessions.operator_id
+      AND newer.ended_at IS NULL
+      AND (newer.started_at > shift_sessions.started_at
+           OR (newer.started_at = shift_sessions.started_at AND newer.id > shift_sessions.id))
+);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_shift_sessions_open_operator
+    ON shift_sessions (operator_id)
+    WHERE ended_at IS NULL;
+DROP INDEX IF EXISTS ix_shift_sessions_open_operator;